@@ -1,6 +1,6 @@
 # annotate_scenes.py
 import json, csv, os, re
-from test import read_script, split_scenes, parse_header
+from scene_parser import iter_scenes, parse_header
 
 CHOICES = ["None","Mild","Moderate","Severe"]
 
@@ -27,8 +27,8 @@ def collect_episodes(scene_text):
     return eps
 
 def annotate_file(path, out_csv="labels.csv"):
-    text = read_script(path)
-    scenes = split_scenes(text)
+    # Сцены потоком: первая показывается, не дожидаясь разбора всего файла
+    scenes = iter_scenes(path)
 
     exists = os.path.exists(out_csv)
     with open(out_csv, "a", encoding="utf-8", newline="") as f:
@@ -0,0 +1,168 @@
+# batch_runner.py — пакетная переоценка по JSONL-очереди заявок
+#
+# Формат строки входа (одна заявка на строку):
+#   {"request_id": "abc", "path": "scripts/x.docx"}                 — целый сценарий (файл)
+#   {"request_id": "abc", "text": "...", "options": {"kind": "script"}} — сценарий текстом
+#   {"request_id": "abc", "text": "...", "options": {"kind": "scene"}}  — одна сцена (как cli_scene_check)
+# options сценария: use_cache (bool), previous (путь к прошлому отчёту того же сценария — переоценка
+# только правок), script (имя сценария для текста; у файла — имя файла). Неизвестный ключ — ошибка заявки.
+# Выход: одна строка результата на заявку; уже успешные request_id при перезапуске пропускаются.
+#
+# Пример: python batch_runner.py requests.jsonl results.jsonl --workers 4
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from models import get_tok_mdl, get_fused_heads, get_fused_ep_heads
+from embeddings import thread_windows
+from scene_parser import read_script
+from test import analyze_text, load_report, script_name
+from cli_scene_check import check_scene
+
+# Модель одна на процесс: по очереди идут только прямые проходы энкодера (models.ENCODER_LOCK),
+# чтение, разбор, кэш и головы заявок перекрываются
+OUT_LOCK = threading.Lock()
+OPTIONS = {"script": {"kind", "use_cache", "previous", "script"}, "scene": {"kind"}}
+
+def request_id(req: dict, line_no: int) -> str:
+    return str(req.get("request_id") or req.get("id") or f"line-{line_no}")
+
+def load_requests(path):
+    reqs = []
+    with open(path, "r", encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                req = json.loads(line)
+            except ValueError as e:
+                req = {"_error": f"bad json: {e}"}
+            reqs.append((request_id(req, n), req))
+    return reqs
+
+def completed_ids(out_path):
+    """request_id со статусом ok из уже записанного выхода (недописанная последняя строка игнорируется)."""
+    done = set()
+    if not os.path.exists(out_path):
+        return done
+    with open(out_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            if rec.get("status") == "ok":
+                done.add(str(rec.get("request_id")))
+    return done
+
+def process(rid: str, req: dict):
+    """Одна заявка -> запись результата (без исключений наружу)."""
+    t0 = time.perf_counter()
+    rec = {"request_id": rid}
+    try:
+        if "_error" in req:
+            raise ValueError(req["_error"])
+        opts = req.get("options") or {}
+        kind = opts.get("kind") or ("script" if req.get("path") else "scene")
+        if kind not in OPTIONS:
+            raise ValueError(f"options.kind={kind!r}: ожидается script или scene")
+        unknown = set(opts) - OPTIONS[kind]
+        if unknown:
+            raise ValueError(f"options: неизвестные ключи {sorted(unknown)} для kind={kind}; "
+                             f"допустимы {sorted(OPTIONS[kind])}")
+        if req.get("path"):
+            text = read_script(req["path"])
+        elif req.get("text"):
+            text = req["text"]
+        else:
+            raise ValueError("need 'path' or 'text'")
+
+        w0 = thread_windows()
+        if kind == "scene":
+            result, scenes = check_scene(text), 1
+        else:
+            use_cache = opts.get("use_cache", True)
+            if not isinstance(use_cache, bool):
+                raise ValueError("options.use_cache: ожидается true/false")
+            script = opts.get("script") or (script_name(req["path"]) if req.get("path") else None)
+            result = analyze_text(text, verbose=False, use_cache=use_cache, previous=previous_for(opts, script),
+                                  script=script)
+            scenes = result["summary"]["count_scenes"]
+        windows = thread_windows() - w0
+
+        rec.update({"status": "ok", "kind": kind, "scenes": scenes, "windows": windows, "result": result})
+    except Exception as e:
+        rec.update({"status": "error", "error": f"{type(e).__name__}: {e}"})
+    rec["elapsed_s"] = round(time.perf_counter() - t0, 3)
+    return rec
+
+def previous_for(opts, script):
+    """Прошлый отчёт из options.previous — только того же сценария (иначе changes были бы бессмыслицей)."""
+    if not opts.get("previous"):
+        return None
+    previous = load_report(opts["previous"])
+    if previous.get("script") != script:
+        raise ValueError(f"options.previous: отчёт по сценарию {previous.get('script')!r}, а не {script!r}")
+    return previous
+
+def run(in_path, out_path, workers: int = 2):
+    reqs = load_requests(in_path)
+    done = completed_ids(out_path)
+    todo = [(rid, req) for rid, req in reqs if rid not in done]
+    print(f"Заявок: {len(reqs)}; уже готово: {len(reqs) - len(todo)}; к обработке: {len(todo)}")
+    if not todo:
+        return
+
+    # Прогрев до старта пула, чтобы время загрузки не попало в пропускную способность
+    get_tok_mdl()
+    get_fused_heads()
+    get_fused_ep_heads()
+
+    t0 = time.perf_counter()
+    totals = {"ok": 0, "error": 0, "scenes": 0, "windows": 0}
+    # Если прошлый запуск упал посреди записи — закрываем оборванную строку
+    if os.path.exists(out_path) and os.path.getsize(out_path) > 0:
+        with open(out_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            tail = f.read(1)
+        if tail != b"\n":
+            with open(out_path, "a", encoding="utf-8") as f:
+                f.write("\n")
+
+    with open(out_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=workers) as pool:
+        futs = [pool.submit(process, rid, req) for rid, req in todo]
+        for fut in as_completed(futs):
+            rec = fut.result()
+            with OUT_LOCK:
+                out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                out.flush()
+            totals[rec["status"]] += 1
+            totals["scenes"] += rec.get("scenes", 0)
+            totals["windows"] += rec.get("windows", 0)
+            print(f"[{rec['status']}] {rec['request_id']} ({rec['elapsed_s']} s)")
+
+    dt = max(time.perf_counter() - t0, 1e-9)
+    print(f"\n✅ ok={totals['ok']} error={totals['error']} за {dt:.1f} s")
+    print(f"📈 {totals['scenes'] / dt:.2f} scenes/s, {totals['windows'] / dt:.2f} windows/s "
+          f"(окна — только реально прогнанные через энкодер, без попаданий в кэш)")
+    return totals
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Пакетная оценка сценариев по JSONL")
+    ap.add_argument("input", nargs="?", default="requests.jsonl")
+    ap.add_argument("output", nargs="?", default="results.jsonl")
+    ap.add_argument("--workers", type=int, default=2, help="потоки заявок (модель общая, прямые проходы энкодера по очереди)")
+    args = ap.parse_args(argv)
+    if not os.path.exists(args.input):
+        print(f"Файл не найден: {args.input}")
+        sys.exit(1)
+    run(args.input, args.output, workers=args.workers)
+
+if __name__ == "__main__":
+    main()
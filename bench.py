@@ -0,0 +1,292 @@
+# bench.py — замеры производительности пайплайна
+# Пример: python bench.py imports
+#         python bench.py scaling fisher2.docx --workers 1 2 4 8
+#         python bench.py split --mb 1 2 5
+#         python bench.py normalize --mb 1 5
+#         python bench.py pdf script.pdf --workers 1 2 4
+#         python bench.py docx fisher2.docx varvara.docx
+#         python bench.py encoder fisher2.docx --backends torch int8 onnx
+#         python bench.py tokenize fisher2.docx
+
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+# ===== Время импорта (в отдельном процессе, без прогретых модулей) =====
+def time_import(stmt: str, repeat: int = 5) -> float:
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, "-c", stmt], check=True)
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times)
+
+def cmd_imports(args):
+    stmts = ["from scene_parser import split_scenes",
+             "from scene_parser import read_script, split_scenes, parse_header"]
+    if args.with_models:
+        stmts.append("from test import split_scenes")
+    for stmt in stmts:
+        print(f"{time_import(stmt, args.repeat):7.3f} s  python -c \"{stmt}\"")
+
+# ===== Масштабирование по ядрам (каждый замер — в свежем процессе, загрузка моделей не в счёт) =====
+def cmd_scaling_one(args):
+    from models import get_tok_mdl, get_fused_heads, get_fused_ep_heads
+    from scene_parser import read_script
+    from test import analyze_text
+    get_tok_mdl()
+    get_fused_heads()
+    get_fused_ep_heads()
+    text = read_script(args.script)
+    t0 = time.perf_counter()
+    payload = analyze_text(text, verbose=False, workers=args.workers, use_cache=False)
+    dt = time.perf_counter() - t0
+    print(json.dumps({"workers": args.workers, "seconds": dt, "scenes": payload["summary"]["count_scenes"],
+                      "rating": payload["rating"]}))
+
+def cmd_scaling(args):
+    base = None
+    print(f"{'workers':>7} {'seconds':>9} {'scenes/s':>9} {'speedup':>8}  rating")
+    for w in args.workers:
+        out = subprocess.run([sys.executable, __file__, "scaling-one", args.script, "--workers", str(w)],
+                             check=True, capture_output=True, text=True).stdout
+        res = json.loads(out.strip().splitlines()[-1])
+        base = base or res["seconds"]
+        print(f"{w:>7} {res['seconds']:>9.2f} {res['scenes'] / res['seconds']:>9.2f} "
+              f"{base / res['seconds']:>7.2f}x  {res['rating']}")
+
+# ===== Разбивка на сцены: линейный сегментатор против re.split =====
+SYNTH_SCENE = (
+    "{n}. ИНТ. КВАРТИРА МАРИИ - НОЧЬ\n\n"
+    "Мария входит в комнату и садится у окна. За стеной слышен шум.\n\n"
+    "МАРИЯ\nНе сейчас. Я устала.\n\n"
+    "ПАВЕЛ ОТКРЫВАЕТ ДВЕРЬ И ДОЛГО СТОИТ НА ПОРОГЕ, НЕ ГОВОРЯ НИ СЛОВА, ПОКА ЗА ОКНОМ ИДЁТ ДОЖДЬ "
+    "И ГДЕ-ТО ВНИЗУ ЛАЕТ СОБАКА, А В ПОДЪЕЗДЕ ГАСНЕТ СВЕТ\n\n"
+    "{n}-1. НАТ. ДВОР.ДЕТСКАЯ ПЛОЩАДКА. ДЕНЬ\n\n"
+    "Дети играют. Павел смотрит на них из окна.\n\n"
+)
+
+def synth_script(mb: float) -> str:
+    parts, size, n = [], 0, 1
+    while size < mb * 1024 * 1024:
+        s = SYNTH_SCENE.format(n=n)
+        parts.append(s)
+        size += len(s.encode("utf-8"))
+        n += 1
+    return "".join(parts)
+
+def cmd_split(args):
+    from scene_parser import split_scenes, split_scenes_regex
+    print(f"{'MB':>5} {'scenes':>7} {'linear s':>9} {'MB/s':>7} {'re.split s':>10} {'same':>5}")
+    for mb in args.mb:
+        text = synth_script(mb)
+        t0 = time.perf_counter()
+        new = split_scenes(text)
+        t_new = time.perf_counter() - t0
+        if args.no_regex:
+            t_old, same = float("nan"), "-"
+        else:
+            t0 = time.perf_counter()
+            old = split_scenes_regex(text)
+            t_old = time.perf_counter() - t0
+            same = "yes" if old == new else "NO"
+        print(f"{mb:>5g} {len(new):>7} {t_new:>9.3f} {mb / t_new:>7.1f} {t_old:>10.3f} {same:>5}")
+
+# ===== normalize_headings: этапы 3-5 на участках у кандидатов против этапов по всему тексту =====
+def cmd_normalize(args):
+    from unittest import mock
+    import normalize
+    print(f"{'MB':>5} {'участки %':>9} {'normalize s':>11} {'MB/s':>7} {'весь текст s':>12} {'same':>5}")
+    for mb in args.mb:
+        text = synth_script(mb)
+        cover = sum(b - a for a, b in normalize.heading_windows(text)) / max(1, len(text))
+        t0 = time.perf_counter()
+        fast = normalize.normalize_headings(text)
+        t_fast = time.perf_counter() - t0
+        with mock.patch.object(normalize, "heading_windows", lambda s: [(0, len(s))]):
+            t0 = time.perf_counter()
+            slow = normalize.normalize_headings(text)
+            t_slow = time.perf_counter() - t0
+        print(f"{mb:>5g} {100 * cover:>9.0f} {t_fast:>11.3f} {mb / t_fast:>7.1f} {t_slow:>12.3f} "
+              f"{'yes' if fast == slow else 'NO':>5}")
+
+# ===== PDF: извлечение страниц на 1/2/4 процессах, затем повторное чтение из постраничного кэша =====
+def cmd_pdf(args):
+    from pdf_pages import extract_pages
+    print(f"{'workers':>7} {'pages':>5} {'total s':>8} {'sum page s':>10} {'max page s':>10}")
+    ref = None
+    for w in args.workers:
+        t0 = time.perf_counter()
+        pages = extract_pages(args.pdf, workers=w, use_cache=False)
+        dt = time.perf_counter() - t0
+        texts = [p.text for p in pages]
+        ref = ref or texts
+        times = [p.seconds for p in pages]
+        print(f"{w:>7} {len(pages):>5} {dt:>8.2f} {sum(times):>10.2f} {max(times, default=0):>10.3f}"
+              f"{'' if texts == ref else '  ТЕКСТ ОТЛИЧАЕТСЯ'}")
+    extract_pages(args.pdf, workers=max(args.workers))  # прогрев кэша
+    t0 = time.perf_counter()
+    pages = extract_pages(args.pdf)
+    print(f"кэш: {sum(p.cached for p in pages)}/{len(pages)} страниц за {time.perf_counter() - t0:.3f} s")
+
+# ===== DOCX: потоковый XML-ридер против объектной модели python-docx =====
+def cmd_docx(args):
+    import tracemalloc
+    from scene_parser import read_docx, docx_lines, clean_docx_paragraph
+    try:
+        from docx import Document
+    except ImportError:
+        Document = None
+
+    def via_python_docx(path):
+        paras = (clean_docx_paragraph(p.text or "") for p in Document(path).paragraphs)
+        return "\n".join(t for t, _, _ in docx_lines(paras))
+
+    def measure(fn, path):
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        text = fn(path)
+        dt = time.perf_counter() - t0
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return text, dt, peak / 2 ** 20
+
+    print(f"{'файл':<24} {'xml s':>7} {'xml MB':>7} {'docx s':>7} {'docx MB':>8} {'same':>5}")
+    for path in args.docx:
+        text, dt, mb = measure(read_docx, path)
+        if Document is None:
+            print(f"{path:<24} {dt:>7.3f} {mb:>7.1f} {'—':>7} {'—':>8} {'—':>5}")
+            continue
+        ref, dt_ref, mb_ref = measure(via_python_docx, path)
+        print(f"{path:<24} {dt:>7.3f} {mb:>7.1f} {dt_ref:>7.3f} {mb_ref:>8.1f} {'yes' if text == ref else 'NO':>5}")
+
+# ===== Бэкенды энкодера: fp32 против int8 / ONNX (каждый — в свежем процессе) =====
+CATS = ["violence", "sexual", "profanity", "alcohol_drugs", "scary"]
+
+def cmd_encoder_one(args):
+    import resource
+    from embeddings import ENCODE_STATS
+    from models import ENCODER_BACKEND, get_tok_mdl, get_fused_heads, get_fused_ep_heads
+    from normalize import normalize_headings
+    from scene_parser import read_script, split_scenes
+    from test import analyze_scenes
+    t0 = time.perf_counter()
+    get_tok_mdl()
+    get_fused_heads()
+    get_fused_ep_heads()
+    load_s = time.perf_counter() - t0
+    scenes = split_scenes(normalize_headings(read_script(args.script)))[:args.scenes or None]
+    t0 = time.perf_counter()
+    per_class = analyze_scenes(scenes, use_cache=False)
+    dt = time.perf_counter() - t0
+    rows = [{c: [pc[c]["model_proba"], pc[c]["episode_max"], pc[c]["final_proba"], pc[c]["severity"]]
+             for c in CATS} for pc in per_class]
+    print(json.dumps({"backend": ENCODER_BACKEND, "load_s": load_s, "seconds": dt, "scenes": len(scenes),
+                      "windows": ENCODE_STATS["windows"], "tokens": ENCODE_STATS["tokens"],
+                      "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, "rows": rows}))
+
+def cmd_encoder(args):
+    import os
+    runs = {}
+    for backend in args.backends:
+        env = dict(os.environ, SCRIPT_ENCODER_BACKEND=backend)
+        cmd = [sys.executable, __file__, "encoder-one", args.script, "--scenes", str(args.scenes)]
+        out = subprocess.run(cmd, check=True, capture_output=True, text=True, env=env).stdout
+        runs[backend] = json.loads(out.strip().splitlines()[-1])
+    base = runs.get("torch")
+    print(f"{'backend':>7} {'load s':>7} {'scenes/s':>9} {'windows/s':>9} {'RSS MB':>7} "
+          f"{'max|Δ head|':>11} {'max|Δ ep|':>9} {'max|Δ final|':>12} {'severity':>9}")
+    for backend, r in runs.items():
+        line = (f"{backend:>7} {r['load_s']:>7.1f} {r['scenes'] / r['seconds']:>9.2f} "
+                f"{r['windows'] / r['seconds']:>9.1f} {r['max_rss_mb']:>7.0f}")
+        if base is not None and backend != "torch":
+            # Головы и итог — по всем сценам и категориям; severity — доля совпавших уровней
+            d = [[abs(a[c][k] - b[c][k]) for a, b in zip(r["rows"], base["rows"]) for c in CATS] for k in range(3)]
+            same = [a[c][3] == b[c][3] for a, b in zip(r["rows"], base["rows"]) for c in CATS]
+            line += (f" {max(d[0], default=0):>11.4f} {max(d[1], default=0):>9.4f} {max(d[2], default=0):>12.4f}"
+                     f" {100.0 * sum(same) / max(1, len(same)):>8.1f}%")
+        print(line)
+
+# ===== Токенизация: по сцене против одного прохода по скрипту со срезами =====
+def cmd_tokenize(args):
+    from embeddings import ScriptTokens, tokenize_ids
+    from models import get_tok_mdl
+    from normalize import normalize_headings
+    from scene_parser import read_script, scene_spans
+    get_tok_mdl()
+    text = normalize_headings(read_script(args.script))
+    spans = scene_spans(text)
+    scenes = [text[a:b] for a, b in spans]
+    t0 = time.perf_counter()
+    ref = [tokenize_ids(s) for s in scenes]
+    t_scene = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    st = ScriptTokens(text, spans)
+    got = [st.ids(s) for s in scenes]
+    t_script = time.perf_counter() - t0
+    same = sum(a.tolist() == b.tolist() for a, b in zip(ref, got))
+    print(f"Сцен: {len(scenes)}; токенов: {sum(x.numel() for x in ref)}")
+    print(f"по сцене: {t_scene:.3f} s; скрипт целиком + срезы: {t_script:.3f} s "
+          f"(срезом {st.sliced}, отдельно {st.fallbacks})")
+    print(f"совпало с токенизацией по сцене: {same}/{len(scenes)}")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Бенчмарки пайплайна рейтинга сценариев")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("imports", help="время холодного импорта парсера")
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--with-models", action="store_true", help="для сравнения замерить и импорт test.py")
+    p.set_defaults(func=cmd_imports)
+
+    p = sub.add_parser("scaling", help="анализ сценария на 1/2/4/8 процессах (без кэша эмбеддингов)")
+    p.add_argument("script")
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    p.set_defaults(func=cmd_scaling)
+
+    p = sub.add_parser("scaling-one", help="один замер для scaling (служебная)")
+    p.add_argument("script")
+    p.add_argument("--workers", type=int, default=1)
+    p.set_defaults(func=cmd_scaling_one)
+
+    p = sub.add_parser("split", help="разбивка синтетического сценария N MB: сегментатор против re.split")
+    p.add_argument("--mb", type=float, nargs="+", default=[1, 2, 5])
+    p.add_argument("--no-regex", action="store_true", help="не замерять прежний re.split")
+    p.set_defaults(func=cmd_split)
+
+    p = sub.add_parser("normalize", help="normalize_headings на синтетическом сценарии N MB")
+    p.add_argument("--mb", type=float, nargs="+", default=[1, 5])
+    p.set_defaults(func=cmd_normalize)
+
+    p = sub.add_parser("pdf", help="извлечение текста PDF: пул процессов по страницам и постраничный кэш")
+    p.add_argument("pdf")
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    p.set_defaults(func=cmd_pdf)
+
+    p = sub.add_parser("docx", help="чтение DOCX: потоковый XML против python-docx (время и пик памяти)")
+    p.add_argument("docx", nargs="+")
+    p.set_defaults(func=cmd_docx)
+
+    p = sub.add_parser("encoder", help="бэкенды энкодера: точность против fp32, скорость и память")
+    p.add_argument("script")
+    p.add_argument("--backends", nargs="+", default=["torch", "int8", "onnx"])
+    p.add_argument("--scenes", type=int, default=40, help="сколько первых сцен (0 — все)")
+    p.set_defaults(func=cmd_encoder)
+
+    p = sub.add_parser("encoder-one", help="один замер для encoder (служебная)")
+    p.add_argument("script")
+    p.add_argument("--scenes", type=int, default=40)
+    p.set_defaults(func=cmd_encoder_one)
+
+    p = sub.add_parser("tokenize", help="токенизация по сцене против одного прохода по скрипту со срезами")
+    p.add_argument("script")
+    p.set_defaults(func=cmd_tokenize)
+
+    args = ap.parse_args(argv)
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
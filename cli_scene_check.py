@@ -2,8 +2,6 @@
 
 import json
 import sys
-import re
-import numpy as np
 
 from test import (
     analyze_scene,           # возвращает per_class по категориям
@@ -27,11 +25,11 @@ def load_input_text():
     print("Usage:\n  python cli_scene_check.py \"Текст сцены...\"\n  python cli_scene_check.py path/to/scene.txt\n  cat scene.txt | python cli_scene_check.py")
     sys.exit(1)
 
-def main():
-    scene_text = load_input_text()
-
+def check_scene(scene_text, per_class=None):
+    """Компактный JSON по одной сцене (per_class можно передать готовым — из пакетного анализа)."""
     # 1) Пер‑категорийный анализ
-    per_class = analyze_scene(scene_text)
+    if per_class is None:
+        per_class = analyze_scene(scene_text)
 
     # 2) Предварительный возраст по ML/правилам
     base_age = age_from_scene(per_class)
@@ -45,7 +43,7 @@ def main():
             final_age = override["min_age"]
 
     # 4) Компактный вывод
-    out = {
+    return {
         "base_age": base_age,
         "final_age": final_age,
         "override": override or None,
@@ -60,6 +58,10 @@ def main():
             } for k, v in per_class.items()
         }
     }
+
+def main():
+    scene_text = load_input_text()
+    out = check_scene(scene_text)
     print(json.dumps(out, ensure_ascii=False, indent=2))
 
 if __name__ == "__main__":
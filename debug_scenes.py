@@ -2,7 +2,7 @@
 from pathlib import Path
 
 # импортируй те же функции, что использует make_features.py
-from test import read_script, split_scenes  # должен совпадать с make_features.py
+from scene_parser import iter_scenes  # та же разбивка, что split_scenes(read_script(...)) в make_features.py
 
 def scene_heading_and_preview(scene, head_n=180):
     # Подстройка под разные представления сцены
@@ -16,13 +16,12 @@ def scene_heading_and_preview(scene, head_n=180):
     return text[:head_n]
 
 def main(script_path: str, out_path: str = "scenes_dump.txt"):
-    text = read_script(script_path)
-    scenes = split_scenes(text)
-    print(f"Всего сцен: {len(scenes)}")
-    lines = []
-    for i, sc in enumerate(scenes):
-        lines.append(f"{i:04d}: {scene_heading_and_preview(sc)}")
-    Path(out_path).write_text("\n".join(lines), encoding="utf-8")
+    n = 0
+    with Path(out_path).open("w", encoding="utf-8") as f:
+        for i, sc in enumerate(iter_scenes(script_path)):
+            f.write(("\n" if i else "") + f"{i:04d}: {scene_heading_and_preview(sc)}")
+            n += 1
+    print(f"Всего сцен: {n}")
     print(f"Сцены записаны в {out_path}")
 
 if __name__ == "__main__":
@@ -1,67 +1,286 @@
 # embeddings.py — общие утилиты для токенизации, оконного эмбеддинга и кэша
 
 import os
+import math
 import hashlib
+import threading
+from bisect import bisect_left
+from collections import namedtuple
 import numpy as np
 import torch
-from transformers import AutoTokenizer, AutoModel
-
-# Кэш (можно поменять директорию при деплое)
-try:
-    from joblib import Memory
-    CACHE_DIR = os.environ.get("SCRIPT_CACHE_DIR", "./.cache_script_rating")
-    memory = Memory(CACHE_DIR, verbose=0)
-except Exception:
-    memory = None
-
-# Модель (синглтон)
-_DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-_MODEL_NAME = "ai-forever/ruRoberta-large"
-
-_tok = None
-_mdl = None
-
-def get_tok_mdl():
-    global _tok, _mdl
-    if _tok is None or _mdl is None:
-        _tok = AutoTokenizer.from_pretrained(_MODEL_NAME)
-        _mdl = AutoModel.from_pretrained(_MODEL_NAME).to(_DEVICE)
-        _mdl.eval()
-    return _tok, _mdl
-
-# Хелпер: хэш текста + параметров окна (для кэша)
-def _hash_text_and_params(text: str, max_len: int, stride: int) -> str:
+
+# Кэш оконных эмбеддингов (можно поменять директорию и лимит при деплое): хранилище vector_store "windows"
+CACHE_DIR = os.environ.get("SCRIPT_CACHE_DIR", "./.cache_script_rating")
+CACHE_MAX_BYTES = int(float(os.environ.get("SCRIPT_CACHE_MAX_MB", "2048")) * 1024 * 1024)
+
+# Бюджет токенов на один батч энкодера (B * L_max), общий для окон всех сцен скрипта
+ENCODE_TOKEN_BUDGET = int(os.environ.get("SCRIPT_TOKEN_BUDGET", "8192"))
+
+# Модель берётся из общего реестра (ленивая загрузка, одна копия на процесс)
+from models import (MODEL_NAME as _MODEL_NAME, ENCODER_LOCK, TOKENIZER_LOCK, encoder_tag, get_device,
+                    get_tok_mdl, get_tokenizer)
+from vector_store import open_store
+
+# Ревизия токенизатора/модели: входит в ключ кэша, чтобы смена весов не отдавала старые векторы.
+# Берётся из локального кэша HF (refs/main), без загрузки самой модели.
+_revision = None
+
+def _tokenizer_revision() -> str:
+    global _revision
+    if _revision is None:
+        rev = os.environ.get("SCRIPT_EMB_REVISION")
+        if not rev:
+            try:
+                from huggingface_hub import constants
+                ref = os.path.join(constants.HF_HUB_CACHE, "models--" + _MODEL_NAME.replace("/", "--"), "refs", "main")
+                with open(ref, "r", encoding="utf-8") as f:
+                    rev = f.read().strip()
+            except Exception:
+                rev = "main"
+        _revision = rev
+    return _revision
+
+# Хелпер: контентный ключ (модель и бэкенд, ревизия, хэш текста, параметры окон, пулинг)
+def _hash_text_and_params(text: str, max_len: int, stride: int, pooling: str = "mean") -> str:
+    text_hash = hashlib.sha1(text.encode("utf-8", errors="ignore")).hexdigest()
     h = hashlib.sha1()
-    h.update(text.encode("utf-8", errors="ignore"))
-    h.update(f"|{max_len}|{stride}".encode())
+    h.update(f"{encoder_tag()}|{_tokenizer_revision()}|{text_hash}|{max_len}|{stride}|{pooling}".encode())
     return h.hexdigest()
 
-# Токенизация в окна по токенам
-def tokenize_to_windows(text: str, max_len: int = 384, stride: int = 320):
-    tok, _ = get_tok_mdl()
-    enc = tok(
-        text,
-        return_tensors="pt",
-        truncation=False,
-        add_special_tokens=True
-    )
-    input_ids = enc["input_ids"][0]          # [T]
-    attn = torch.ones_like(input_ids)        # потом нарежем под окна
+# ===== Дисковый кэш матриц окон [Nw, H] в общем хранилище векторов =====
+CACHE_STATS = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0, "bytes": None}
 
-    T = input_ids.size(0)
-    if T <= max_len:
-        return input_ids.unsqueeze(0), torch.ones(1, T, dtype=torch.long)  # [1, T], [1, T]
+def _window_store():
+    return open_store("windows", max_bytes=CACHE_MAX_BYTES)
+
+def cache_get(key: str):
+    """Матрица окон по ключу или None; попадание отмечается в журнале хранилища (вытеснение по давности)."""
+    V = _window_store().get(key, touch=True)
+    CACHE_STATS["hits" if V is not None else "misses"] += 1
+    return V
+
+def cache_put(key: str, V: np.ndarray):
+    """Дозапись матрицы окон; сверх лимита хранилище компактизируется, вытесняя самые давние ключи."""
+    store = _window_store()
+    store.put(key, np.asarray(V, dtype=np.float32))
+    CACHE_STATS["writes"] += 1
+    CACHE_STATS["evictions"] = store.evictions
+    CACHE_STATS["bytes"] = store.stats()["bytes"]
 
-    # создаём окно с [CLS]...[SEP] в пределах max_len
+def cache_stats():
+    """Счётчики кэша: hits/misses/writes/evictions и hit_rate."""
+    stats = dict(CACHE_STATS)
+    looked = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / looked, 4) if looked else 0.0
+    return stats
+
+# Эпизодные окна: короче сценовых, чтобы точнее локализовать эпизод.
+# Пулятся из тех же скрытых состояний, что и сценовые окна (отдельного прохода модели нет).
+EP_WIN_LEN = 256
+EP_STRIDE = 224
+EP_MAX_WINS = 16
+
+# Планировщик окон: fixed — прежняя раскладка (шаг stride, последнее окно прижато к концу, эпизоды
+# обрезаются до EP_MAX_WINS); even — минимум окон равной длины <= max_len с перекрытием не меньше
+# max_len - stride, распределённым поровну; эпизодные спаны не обрезаются, а расширяются до EP_MAX_WINS.
+# По умолчанию fixed. Поставляемые heads.pkl / episode_heads.pkl обучены ещё на прежних признаках
+# (эпизоды — отдельными окнами 256/224, а не спанами окон сцены 384) и без метки раскладки: models
+# их не берёт, пока головы не переобучены (train_heads_episodes -> make_features -> train_heads)
+# или не задано SCRIPT_ALLOW_STALE_HEADS=1. Метка раскладки — window_plan_tag(), хранится в весах.
+WINDOW_PLAN = os.environ.get("SCRIPT_WINDOW_PLAN", "fixed").strip().lower()
+# Потолок токенов энкодера на сцену (0 — без потолка): сверх него сначала убирается перекрытие, затем покрытие
+SCENE_TOKEN_BUDGET = int(os.environ.get("SCRIPT_SCENE_TOKEN_BUDGET", "0"))
+
+_PLAN_TAG = "" if WINDOW_PLAN == "fixed" else f":{WINDOW_PLAN}"
+EP_POOLING = f"span-mean:{EP_WIN_LEN}/{EP_STRIDE}/{EP_MAX_WINS}{_PLAN_TAG}"
+
+def window_plan_tag() -> str:
+    """Раскладка окон и потолок токенов на сцену — для версий оценки и ключей признаков."""
+    return f"{WINDOW_PLAN}|{SCENE_TOKEN_BUDGET}|{EP_POOLING}"
+
+# Токенизация всего текста сцены (с [CLS]/[SEP])
+def tokenize_ids(text: str):
+    tok = get_tokenizer()
+    with TOKENIZER_LOCK:
+        enc = tok(
+            text,
+            return_tensors="pt",
+            truncation=False,
+            add_special_tokens=True
+        )
+    return enc["input_ids"][0]               # [T]
+
+# ===== Токенизация скрипта целиком =====
+class ScriptTokens:
+    """
+    Нормализованный скрипт токенизируется один раз (fast-токенизатор, return_offsets_mapping);
+    токены сцены — срез по символьным границам сегментатора (scene_spans) + служебные токены.
+    Лениво: проход токенизатора — при первой сцене, которой нужны токены (промах кэша или символьные
+    диапазоны эпизодов); веса энкодера для этого не грузятся.
+    """
+    def __init__(self, text: str, spans):
+        self.text = text
+        self.spans = {}
+        for a, b in spans:
+            self.spans.setdefault(text[a:b], (a, b))
+        self._ids = self._offsets = self._starts = None
+        self.sliced = 0      # сцен взято срезом
+        self.fallbacks = 0   # сцен токенизировано отдельно
+
+    def _encode(self):
+        tok = get_tokenizer()
+        with TOKENIZER_LOCK:
+            enc = tok(self.text, add_special_tokens=False, truncation=False, return_offsets_mapping=True)
+        self._ids, self._offsets = enc["input_ids"], enc["offset_mapping"]
+        self._starts = [a for a, _ in self._offsets]
+
+    def scene(self, scene_text: str):
+        """(ids [T] со служебными токенами, символьные offsets токенов в скрипте) или None."""
+        span = self.spans.get(scene_text)
+        if span is None:
+            return None
+        a, b = span
+        # Пробел перед сценой byte-level BPE приклеил бы к первому токену ("Ġ...") — такую сцену отдельно
+        if a > 0 and self.text[a - 1] != "\n":
+            return None
+        if self._ids is None:
+            self._encode()
+        i, j = bisect_left(self._starts, a), bisect_left(self._starts, b)
+        # Границы сцены должны совпасть с границами токенов
+        if (i > 0 and self._offsets[i - 1][1] > a) or (j > i and self._offsets[j - 1][1] > b):
+            return None
+        tok = get_tokenizer()
+        body = self._ids[i:j]
+        ids = tok.build_inputs_with_special_tokens(body)
+        # Маска по готовым ids: fast-токенизаторы умеют её только с already_has_special_tokens=True
+        mask = tok.get_special_tokens_mask(ids, already_has_special_tokens=True)
+        if len(mask) - sum(mask) != len(body):
+            return None  # в тексте сцены встретился литерал служебного токена — сопоставить нельзя
+        # Служебные токены — нулевой ширины на границах сцены
+        offsets, k = [], i
+        for special in mask:
+            if special:
+                offsets.append((a, a) if k == i else (b, b))
+            else:
+                offsets.append(tuple(self._offsets[k]))
+                k += 1
+        return torch.tensor(ids), offsets
+
+    def ids(self, scene_text: str):
+        """Токены сцены: срез скрипта, а если сцену нельзя вырезать — отдельный вызов токенизатора."""
+        got = self.scene(scene_text)
+        if got is None:
+            self.fallbacks += 1
+            return tokenize_ids(scene_text)
+        self.sliced += 1
+        return got[0]
+
+    def window_ranges(self, scene_text: str, max_len: int = 384, stride: int = 320, budget: int = None):
+        """
+        Символьные диапазоны [a, b) окон и эпизодных спанов сцены относительно её начала (или None).
+        episodes — ровно строки V_ep из encode_scenes с тем же budget (спаны без покрытия выброшены).
+        """
+        got = self.scene(scene_text)
+        if got is None:
+            return None
+        _, offsets = got
+        base, T = self.spans[scene_text][0], len(offsets)
+        plan = plan_windows(T, max_len, stride, budget=budget or SCENE_TOKEN_BUDGET or None)
+        owned = owned_ranges(plan.starts, T, plan.length)
+        chars = lambda x, y: (offsets[x][0] - base, offsets[y - 1][1] - base)
+        return {"windows": [chars(s, min(s + plan.length, T)) for s in plan.starts],
+                "episodes": [chars(x, y) for x, y in episode_spans(T)
+                             if any(max(x, lo) < min(y, hi) for lo, hi in owned)]}
+
+    @classmethod
+    def of_scenes(cls, scenes):
+        r"""ScriptTokens по готовому списку сцен (склейка через '\n') — когда текста скрипта под рукой нет."""
+        spans, pos = [], 0
+        for s in scenes:
+            spans.append((pos, pos + len(s)))
+            pos += len(s) + 1
+        return cls("\n".join(scenes), spans)
+
+# Начала окон: шаг stride, последнее окно прижато к концу
+def window_starts(T: int, max_len: int, stride: int):
+    if T <= max_len:
+        return [0]
     starts = list(range(0, max(1, T - max_len + 1), stride))
     if starts[-1] != T - max_len:
         starts.append(T - max_len)
+    return starts
 
+# Раскладка окон сцены: начала, общая длина окна и сколько токенов сцены покрыто
+WindowPlan = namedtuple("WindowPlan", "starts length T covered")
+
+def _even_starts(T: int, n: int, length: int):
+    if n <= 1:
+        return [0]
+    step = (T - length) / (n - 1)
+    return [int(round(i * step)) for i in range(n)]
+
+def _union_len(intervals) -> int:
+    # intervals отсортированы по началу
+    covered, end = 0, 0
+    for a, b in intervals:
+        covered += max(0, b - max(a, end))
+        end = max(end, b)
+    return covered
+
+def plan_windows(T: int, max_len: int, stride: int, budget: int = None, max_windows: int = None, plan: str = None):
+    """
+    Минимум окон, покрывающих T токенов с перекрытием >= max_len - stride.
+    budget — потолок суммы токенов окон: сперва жертвуем перекрытием, затем покрытием
+    (окна max_len равномерно по сцене). max_windows — потолок числа окон: окна удлиняются
+    сверх max_len (для эпизодных спанов, которые режутся из уже посчитанных состояний).
+    """
+    plan = plan or WINDOW_PLAN
+    if plan == "fixed":
+        starts = window_starts(T, max_len, stride)
+        return WindowPlan(starts, min(max_len, T), T, T)
+    if plan != "even":
+        raise ValueError(f"SCRIPT_WINDOW_PLAN={plan!r}: ожидается fixed или even")
+    ov = max_len - stride
+    n = 1 if T <= max_len else math.ceil((T - ov) / (max_len - ov))
+    if max_windows:
+        n = min(n, max_windows)
+    length = min(T, math.ceil((T + (n - 1) * ov) / n))
+    if budget and n * length > budget:
+        n = math.ceil(T / max_len)
+        length = math.ceil(T / n)
+        if n * length > budget:
+            length = min(max_len, T, budget)
+            n = max(1, budget // length)
+    starts = _even_starts(T, n, length)
+    return WindowPlan(starts, length, T, _union_len((s, min(s + length, T)) for s in starts))
+
+# Покрытие и избыточность окон (по сценам, реально прошедшим через энкодер)
+WINDOW_STATS = {"scenes": 0, "tokens": 0, "window_tokens": 0, "covered": 0, "windows": 0,
+                "ep_spans": 0, "ep_covered": 0}
+
+def window_stats():
+    """Счётчики планировщика + coverage (доля покрытых токенов) и redundancy (лишние токены на покрытый)."""
+    st = dict(WINDOW_STATS)
+    st["coverage"] = round(st["covered"] / st["tokens"], 4) if st["tokens"] else 1.0
+    st["ep_coverage"] = round(st["ep_covered"] / st["tokens"], 4) if st["tokens"] else 1.0
+    st["redundancy"] = round(st["window_tokens"] / st["covered"] - 1, 4) if st["covered"] else 0.0
+    return st
+
+# Токенизация в окна по токенам
+def tokenize_to_windows(text: str, max_len: int = 384, stride: int = 320, budget: int = None):
+    tok = get_tokenizer()
+    input_ids = tokenize_ids(text)           # [T]
+
+    T = input_ids.size(0)
+    plan = plan_windows(T, max_len, stride, budget=budget or SCENE_TOKEN_BUDGET)
+    if len(plan.starts) == 1 and plan.length == T:
+        return input_ids.unsqueeze(0), torch.ones(1, T, dtype=torch.long)  # [1, T], [1, T]
+
+    # окна по плану (внутренние окна без собственных [CLS]/[SEP], как и раньше)
     windows_ids = []
     windows_attn = []
-    for s in starts:
-        e = s + max_len
-        ids_win = input_ids[s:e]
+    for s in plan.starts:
+        ids_win = input_ids[s:s + plan.length]
         attn_win = torch.ones_like(ids_win)
         windows_ids.append(ids_win)
         windows_attn.append(attn_win)
@@ -75,9 +294,10 @@ def encode_windows_batched(input_ids, attention_mask, batch_size: int = 8):
     Hs = []
     with torch.no_grad():
         for i in range(0, input_ids.size(0), batch_size):
-            ids = input_ids[i:i+batch_size].to(_DEVICE)
-            attn = attention_mask[i:i+batch_size].to(_DEVICE)
-            out = mdl(input_ids=ids, attention_mask=attn)
+            ids = input_ids[i:i+batch_size].to(get_device())
+            attn = attention_mask[i:i+batch_size].to(get_device())
+            with ENCODER_LOCK:
+                out = mdl(input_ids=ids, attention_mask=attn)
             hs = out.last_hidden_state                      # [B, L, H]
             # mean-pool по валидным токенам
             mask = (attn.unsqueeze(-1) > 0).float()         # [B, L, 1]
@@ -99,18 +319,162 @@ def aggregate_windows(V: np.ndarray, topk: int = 3):
     topk_mean = V[top_idx].mean(axis=0) if k > 0 else mean_vec
     return np.concatenate([mean_vec, max_vec, topk_mean], axis=0)  # 3H
 
+# Зоны «владения» токенами: при перекрытии токен берётся из окна, где он ближе к центру;
+# зона не выходит за своё окно (при частичном покрытии между окнами остаются непокрытые токены)
+def owned_ranges(starts, T: int, max_len: int):
+    ends = [min(s + max_len, T) for s in starts]
+    out = []
+    for i, s in enumerate(starts):
+        lo = 0 if i == 0 else (s + ends[i - 1]) // 2
+        hi = T if i == len(starts) - 1 else (starts[i + 1] + ends[i]) // 2
+        out.append((max(lo, s), min(hi, ends[i])))
+    return out
+
+# Эпизодные под-спаны [a, b) в координатах токенов сцены
+def episode_spans(T: int):
+    if WINDOW_PLAN == "fixed":
+        return [(s, min(s + EP_WIN_LEN, T)) for s in window_starts(T, EP_WIN_LEN, EP_STRIDE)][:EP_MAX_WINS]
+    # Длинная сцена: не больше EP_MAX_WINS спанов, но хвост сцены покрыт
+    plan = plan_windows(T, EP_WIN_LEN, EP_STRIDE, max_windows=EP_MAX_WINS)
+    return [(s, min(s + plan.length, T)) for s in plan.starts]
+
+# Счётчики энкодера: сколько окон/токенов реально прогнали и сколько ушло в паддинг
+ENCODE_STATS = {"windows": 0, "tokens": 0, "padded_tokens": 0, "batches": 0}
+_local = threading.local()
+
+def thread_windows() -> int:
+    """Окон, прогнанных энкодером в текущем потоке (счёт заявки при общем ENCODE_STATS)."""
+    return getattr(_local, "windows", 0)
+
+# Скрытые состояния окон [L_i, H] по порядку (батчами, без паддинга в выдаче)
+def encode_window_states(windows, batch_size: int = 8):
+    tok, mdl = get_tok_mdl()
+    with torch.no_grad():
+        for i in range(0, len(windows), batch_size):
+            chunk = windows[i:i+batch_size]
+            ids = torch.nn.utils.rnn.pad_sequence(chunk, batch_first=True, padding_value=tok.pad_token_id).to(get_device())
+            attn = torch.nn.utils.rnn.pad_sequence([torch.ones_like(w) for w in chunk], batch_first=True, padding_value=0).to(get_device())
+            with ENCODER_LOCK:
+                hs = mdl(input_ids=ids, attention_mask=attn).last_hidden_state.float().cpu().numpy()  # [B, L, H]
+                ENCODE_STATS["windows"] += len(chunk)
+                ENCODE_STATS["tokens"] += int(attn.sum())
+                ENCODE_STATS["padded_tokens"] += int(attn.numel())
+                ENCODE_STATS["batches"] += 1
+            _local.windows = thread_windows() + len(chunk)
+            for b, w in enumerate(chunk):
+                yield hs[b, :w.size(0)]
+
+# Пулинг одного окна: mean для сцены + вклад в суммы эпизодных спанов по «своим» токенам
+def pool_window(hs: np.ndarray, start: int, owned, spans, ep_sum: np.ndarray, ep_cnt: np.ndarray):
+    lo, hi = owned
+    for j, (a, b) in enumerate(spans):
+        x, y = max(a, lo), min(b, hi)
+        if x < y:
+            ep_sum[j] += hs[x - start:y - start].sum(axis=0)
+            ep_cnt[j] += y - x
+    return hs.mean(axis=0)
+
+# Динамические батчи: окна отсортированы по убыванию длины, B * L_max <= token_budget
+def plan_batches(jobs, token_budget: int):
+    batches, cur = [], []
+    for job in sorted(jobs, key=lambda j: -j[2].size(0)):
+        if cur and (len(cur) + 1) * cur[0][2].size(0) > token_budget:
+            batches.append(cur)
+            cur = []
+        cur.append(job)
+    if cur:
+        batches.append(cur)
+    return batches
+
+# Скриптовый энкодер: окна всех сцен в общем пуле
+def encode_scenes(texts, max_len: int = 384, stride: int = 320, token_budget: int = None, use_cache: bool = True,
+                  scene_budget: int = None, script_budget: int = None, script_tokens: ScriptTokens = None):
+    """
+    Окна всех сцен (промахи кэша) собираются вместе, сортируются по длине и прогоняются
+    динамическими батчами под бюджет токенов; векторы раскладываются обратно по сценам.
+    Раскладка окон — plan_windows; scene_budget / script_budget — потолок токенов окон на сцену /
+    на все некэшированные сцены (делится пропорционально потребности сцен).
+    script_tokens — токены сцен срезом из одного прохода токенизатора по всему скрипту.
+    Возвращает [(V_scene [Nw, H], V_ep [Ne, H]), ...] в порядке texts.
+    """
+    budget = token_budget or ENCODE_TOKEN_BUDGET
+    scene_budget = scene_budget or SCENE_TOKEN_BUDGET or None
+    limits = f"|{scene_budget or 0}/{script_budget or 0}" if scene_budget or script_budget else ""
+    results = [None] * len(texts)
+    pending, keys = {}, {}
+    for i, text in enumerate(texts):
+        if use_cache and text not in pending:
+            k = (_hash_text_and_params(text, max_len, stride, pooling=f"mean{_PLAN_TAG}{limits}"),
+                 _hash_text_and_params(text, max_len, stride, pooling=f"{EP_POOLING}{limits}"))
+            V, E = cache_get(k[0]), cache_get(k[1])
+            if V is not None and E is not None:
+                results[i] = (V, E)
+                continue
+            keys[text] = k
+        pending.setdefault(text, []).append(i)
+    if not pending:
+        return results
+
+    # 1) Токенизация и раскладка окон каждой сцены (бюджет скрипта — пропорционально потребности)
+    tokenized = [script_tokens.ids(text) if script_tokens is not None else tokenize_ids(text) for text in pending]
+    budgets = [scene_budget] * len(tokenized)
+    if script_budget:
+        plans = [plan_windows(ids.size(0), max_len, stride, budget=scene_budget) for ids in tokenized]
+        need = [len(p.starts) * p.length for p in plans]
+        if sum(need) > script_budget:
+            budgets = [min(b or n, max(1, script_budget * n // sum(need))) for b, n in zip(budgets, need)]
+    scenes, jobs = [], []
+    for text, ids, b in zip(pending, tokenized, budgets):
+        T = ids.size(0)
+        plan = plan_windows(T, max_len, stride, budget=b)
+        spans = episode_spans(T)
+        for w, s in enumerate(plan.starts):
+            jobs.append((len(scenes), w, ids[s:s + plan.length]))
+        scenes.append({"text": text, "starts": plan.starts, "owned": owned_ranges(plan.starts, T, plan.length),
+                       "spans": spans, "V": [None] * len(plan.starts), "ep_sum": None, "ep_cnt": np.zeros(len(spans))})
+        WINDOW_STATS["scenes"] += 1
+        WINDOW_STATS["tokens"] += T
+        WINDOW_STATS["windows"] += len(plan.starts)
+        WINDOW_STATS["window_tokens"] += sum(min(s + plan.length, T) - s for s in plan.starts)
+        WINDOW_STATS["covered"] += plan.covered
+
+    # 2) Прогон батчами и раскладка по сценам
+    for batch in plan_batches(jobs, budget):
+        states = encode_window_states([j[2] for j in batch], batch_size=len(batch))
+        for (sc, w, _), hs in zip(batch, states):
+            st = scenes[sc]
+            if st["ep_sum"] is None:
+                st["ep_sum"] = np.zeros((len(st["spans"]), hs.shape[1]), dtype=np.float64)
+            st["V"][w] = pool_window(hs, st["starts"][w], st["owned"][w], st["spans"], st["ep_sum"], st["ep_cnt"])
+
+    # 3) Финальные матрицы, кэш
+    for st in scenes:
+        V = np.vstack(st["V"]).astype(np.float32)
+        # Спаны целиком в непокрытых промежутках (только при урезанном бюджете) не дают вектора
+        seen = st["ep_cnt"] > 0
+        E = (st["ep_sum"][seen] / st["ep_cnt"][seen][:, None]).astype(np.float32)
+        WINDOW_STATS["ep_spans"] += int(seen.sum())
+        WINDOW_STATS["ep_covered"] += _union_len(sp for sp, ok in zip(st["spans"], seen) if ok)
+        if st["text"] in keys:
+            cache_put(keys[st["text"]][0], V)
+            cache_put(keys[st["text"]][1], E)
+        for i in pending[st["text"]]:
+            results[i] = (V, E)
+    return results
+
+# Единый проход энкодера для одной сцены
+def encode_scene(text: str, max_len: int = 384, stride: int = 320, batch_size: int = 8, use_cache: bool = True):
+    """
+    Текст сцены -> токенные окна max_len/stride -> скрытые состояния токенов ->
+    (V_scene [Nw, H] mean-pool по окнам, V_ep [Ne, H] mean-pool по эпизодным под-спанам EP_WIN_LEN/EP_STRIDE).
+    """
+    return encode_scenes([text], max_len=max_len, stride=stride, token_budget=batch_size * max_len, use_cache=use_cache)[0]
+
+# Матрица окон сцены [Nw, H] с кэшем по содержимому
+def window_vectors(text: str, max_len: int = 384, stride: int = 320, batch_size: int = 8, use_cache: bool = True):
+    return encode_scene(text, max_len=max_len, stride=stride, batch_size=batch_size, use_cache=use_cache)[0]
+
 # Полный пайплайн: текст → окна → эмбеддинги → агрегат
 def scene_vector(text: str, max_len: int = 384, stride: int = 320, batch_size: int = 8, use_cache: bool = True):
-    # Кэшируем на уровне эмбеддингов окон
-    def _compute():
-        ids, attn = tokenize_to_windows(text, max_len=max_len, stride=stride)
-        V = encode_windows_batched(ids, attn, batch_size=batch_size)
-        agg = aggregate_windows(V, topk=3)
-        return agg
-
-    if memory is not None and use_cache:
-        key = _hash_text_and_params(text, max_len, stride)
-        cached_fn = memory.cache(_compute)
-        return cached_fn()
-    else:
-        return _compute()
+    V = window_vectors(text, max_len=max_len, stride=stride, batch_size=batch_size, use_cache=use_cache)
+    return aggregate_windows(V, topk=3)
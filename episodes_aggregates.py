@@ -1,63 +1,65 @@
 # episodes_aggregates.py — эпизодные агрегаты по токенным окнам (устойчиво для длинных сцен)
 
-import re
 import numpy as np
-import pickle
 
-# Единый стек модели и оконные утилиты
-from embeddings import get_tok_mdl, tokenize_to_windows, encode_windows_batched  # [web:35][web:39][web:49][web:41]
-
-# Инициализация общей модели/токенизатора
-tok, mdl = get_tok_mdl()  # [web:35]
-mdl.eval()  # [web:35]
+# Оконные утилиты (модель грузится лениво через общий реестр models.py)
+from embeddings import encode_scene  # [web:35][web:39][web:49][web:41]
+from models import get_fused_ep_heads
+from fused_heads import ep_scores
 
 # Категории и головы
 CATS = ["violence","sexual","profanity","alcohol_drugs","scary"]  # [web:6]
 
-with open("episode_heads.pkl","rb") as f:
-    EP_HEADS = pickle.load(f)  # heads: {'cat': {'bin': LogReg, 'sev': Ridge}} [web:6]
-
-# Параметры окон для эпизодов
-WIN_LEN = 256      # короче, чем сценовые, чтобы точнее локализовать эпизод [web:39]
-STRIDE  = 224      # перекрытие для непропускаемых фрагментов [web:39]
-MAX_WINS = 16      # ограничение на количество окон для скорости [web:83]
+# Эпизодные головы грузятся лениво одной матрицей (episode_heads.npz или фьюзинг episode_heads.pkl) [web:6]
 
 def episode_windows_vecs(text: str):
     """
-    Текст сцены -> токенные окна -> батчевый эмбеддинг окон (mean-pool).
+    Текст сцены -> эпизодные под-спаны (256/224 токена) из общего прохода энкодера (mean-pool).
     """
-    ids, attn = tokenize_to_windows(text, max_len=WIN_LEN, stride=STRIDE)  # [Nw, L] [Nw, L] [web:39]
-    # Ограничим число окон для стабильного времени и VRAM
-    if ids.size(0) > MAX_WINS:
-        ids = ids[:MAX_WINS]
-        attn = attn[:MAX_WINS]
-    V = encode_windows_batched(ids, attn, batch_size=8)  # [Nw, H] [web:35]
-    return V  # [web:35]
+    _, E = encode_scene(text, max_len=384, stride=320, batch_size=8, use_cache=True)
+    return E
 
 def episode_aggregates_for_scene(scene_text: str):
+    return episode_aggregates_from_vecs(episode_windows_vecs(scene_text))
+
+def episode_aggregates_from_vecs(V: np.ndarray):
     """
     Возвращает 30 признаков (5 категорий * 6 агрегатов): 
     [p_bin.max, p_bin.mean, top3mean(p_bin), p_sev.max, p_sev.mean, top3mean(p_sev)] по токенным окнам. 
     """
-    V = episode_windows_vecs(scene_text)  # [Nw, H] [web:39]
-    if V.ndim == 1:
-        V = V[None, :]
-    feats = []
-    for cat in CATS:
-        h = EP_HEADS[cat]
-        # Бинарная вероятность «эпизод есть» по каждому окну
-        p_bin = h["bin"].predict_proba(V)[:, 1]  # [Nw] [web:6]
-        # Регрессия степени серьёзности 0..1 по каждому окну
-        p_sev = np.clip(h["sev"].predict(V), 0.0, 1.0)  # [Nw] [web:6]
-        # Агрегаты: max/mean и top-3 mean устойчиво отражают пик и общую «нагруженность»
-        top3b = np.sort(p_bin)[-3:] if len(p_bin) >= 3 else p_bin  # [web:39]
-        top3s = np.sort(p_sev)[-3:] if len(p_sev) >= 3 else p_sev  # [web:39]
-        feats += [
-            float(p_bin.max()),
-            float(p_bin.mean()),
-            float(np.mean(top3b)),
-            float(p_sev.max()),
-            float(p_sev.mean()),
-            float(np.mean(top3s)),
-        ]
-    return np.array(feats, dtype=float)  # 5*6=30 фич [web:6]
+    return episode_aggregates_batch([V])[0]
+
+def episode_aggregates_batch(Vs, peaks=None):
+    """
+    Эпизодные агрегаты всех сцен скрипта [N, 30]: bin/sev головы по всем окнам — один matmul.
+    peaks — список, в который дописывается по сцене [индекс спана с максимальным p_bin по категориям].
+    """
+    Vs = [V[None, :] if V.ndim == 1 else V for V in Vs]
+    out = np.zeros((len(Vs), len(CATS) * 6), dtype=float)
+    if not Vs:
+        return out
+    P_bin, P_sev = ep_scores(get_fused_ep_heads(), np.vstack(Vs))  # [sum Nw, 5] x2 [web:6]
+    pos = 0
+    for i, V in enumerate(Vs):
+        n = V.shape[0]
+        feats = []
+        for j in range(len(CATS)):
+            # Бинарная вероятность «эпизод есть» и степень серьёзности 0..1 по каждому окну
+            p_bin = np.ascontiguousarray(P_bin[pos:pos + n, j])  # [Nw] [web:6]
+            p_sev = np.ascontiguousarray(P_sev[pos:pos + n, j])  # [Nw] [web:6]
+            # Агрегаты: max/mean и top-3 mean устойчиво отражают пик и общую «нагруженность»
+            top3b = np.sort(p_bin)[-3:] if len(p_bin) >= 3 else p_bin  # [web:39]
+            top3s = np.sort(p_sev)[-3:] if len(p_sev) >= 3 else p_sev  # [web:39]
+            feats += [
+                float(p_bin.max()),
+                float(p_bin.mean()),
+                float(np.mean(top3b)),
+                float(p_sev.max()),
+                float(p_sev.mean()),
+                float(np.mean(top3s)),
+            ]
+        out[i] = feats
+        if peaks is not None:
+            peaks.append([int(np.argmax(P_bin[pos:pos + n, j])) if n else None for j in range(len(CATS))])
+        pos += n
+    return out  # N x 5*6=30 фич [web:6]
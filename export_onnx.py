@@ -0,0 +1,55 @@
+# export_onnx.py — экспорт энкодера в ONNX для бэкенда SCRIPT_ENCODER_BACKEND=onnx
+#
+# Граф принимает input_ids/attention_mask [B, L] (оси B и L динамические) и отдаёт last_hidden_state [B, L, H].
+# --int8 дополнительно сохраняет динамически квантованную копию (onnxruntime.quantization) рядом с fp32.
+#
+# Пример: python export_onnx.py encoder.onnx --int8
+#         SCRIPT_ENCODER_BACKEND=onnx SCRIPT_ONNX_PATH=encoder.int8.onnx python bench.py encoder fisher2.docx
+
+import argparse
+
+from models import MODEL_NAME, ONNX_PATH
+
+def export(path: str = ONNX_PATH, opset: int = 17):
+    import torch
+    from transformers import AutoTokenizer, AutoModel
+
+    class LastHidden(torch.nn.Module):
+        def __init__(self, mdl):
+            super().__init__()
+            self.mdl = mdl
+
+        def forward(self, input_ids, attention_mask):
+            return self.mdl(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+
+    tok = AutoTokenizer.from_pretrained(MODEL_NAME)
+    mdl = AutoModel.from_pretrained(MODEL_NAME).eval()
+    # Пример входа с паддингом, чтобы маска в графе была честной
+    enc = tok(["ИНТ. КВАРТИРА - НОЧЬ", "Мария входит в комнату и садится у окна."],
+              return_tensors="pt", padding=True)
+    axes = {0: "batch", 1: "seq"}
+    with torch.no_grad():
+        torch.onnx.export(LastHidden(mdl), (enc["input_ids"], enc["attention_mask"]), path,
+                          input_names=["input_ids", "attention_mask"], output_names=["last_hidden_state"],
+                          dynamic_axes={"input_ids": axes, "attention_mask": axes, "last_hidden_state": axes},
+                          opset_version=opset)
+    return path
+
+def quantize(path: str) -> str:
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    out = path[:-len(".onnx")] + ".int8.onnx" if path.endswith(".onnx") else path + ".int8"
+    quantize_dynamic(path, out, weight_type=QuantType.QInt8)
+    return out
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Экспорт энкодера в ONNX")
+    ap.add_argument("path", nargs="?", default=ONNX_PATH)
+    ap.add_argument("--opset", type=int, default=17)
+    ap.add_argument("--int8", action="store_true", help="ещё и динамически квантованная копия")
+    args = ap.parse_args(argv)
+    print(f"ONNX: {export(args.path, args.opset)}")
+    if args.int8:
+        print(f"ONNX int8: {quantize(args.path)}")
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 # extract_episodes.py (with severity)
 import re, csv, sys
-from docx import Document
+from scene_parser import read_docx_raw
 
 EP_RE = re.compile(r'\[\s*ep\s*:\s*([^\]]+)\]', re.IGNORECASE)
 MAP_KEY = {"v":"violence","p":"profanity","s":"sexual","a":"alcohol_drugs","sc":"scary"}
@@ -8,10 +8,6 @@ SEV_NORM = {"none":"None","mild":"Mild","moderate":"Moderate","severe":"Severe",
             "нет":"None","лёгкое":"Mild","легкое":"Mild","среднее":"Moderate","жёсткое":"Severe","жесткое":"Severe"}
 SEV_TO_NUM = {"None":0.0, "Mild":0.33, "Moderate":0.66, "Severe":1.0}
 
-def read_docx(path):
-    doc = Document(path)
-    return "\n".join(p.text or "" for p in doc.paragraphs)
-
 def window_around(text, idx, radius=220):
     start = max(0, idx - radius)
     end = min(len(text), idx + radius)
@@ -23,7 +19,7 @@ def normalize(text: str) -> str:
     return text
 
 def extract(path, out_csv="episodes.csv"):
-    raw = read_docx(path) if path.lower().endswith(".docx") else open(path, encoding="utf-8").read()
+    raw = read_docx_raw(path) if path.lower().endswith(".docx") else open(path, encoding="utf-8").read()
     text = normalize(raw)
     rows = []
     for m in EP_RE.finditer(text):
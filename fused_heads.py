@@ -0,0 +1,110 @@
+# fused_heads.py — все головы одной матрицей весов: один matmul + sigmoid на весь скрипт
+#
+# Сценовые головы {cat: LogisticRegression} -> W [C, D], b [C]
+# Эпизодные головы {cat: {'bin': LogReg, 'sev': Ridge}} -> W [2C, H], b [2C] (сначала bin, затем sev)
+# Веса экспортируются в компактный .npz — для инференса не нужен ни sklearn, ни pickle.
+# Вместе с весами хранится раскладка окон (window_plan_tag), на признаках которой головы обучены:
+# в pickle — ключом PLAN_KEY рядом с категориями, в .npz — полем plan.
+#
+# Пример: python fused_heads.py   (heads.pkl/episode_heads.pkl -> heads.npz/episode_heads.npz + сверка)
+
+import numpy as np
+
+CATS = ["violence", "sexual", "profanity", "alcohol_drugs", "scary"]
+PLAN_KEY = "window_plan"
+
+try:
+    from scipy.special import expit as _expit  # та же сигмоида, что в sklearn predict_proba
+except ImportError:
+    def _expit(z):
+        return 1.0 / (1.0 + np.exp(-z))
+
+# ===== Фьюзинг =====
+def fuse_scene_heads(heads, cats=CATS):
+    W = np.vstack([np.asarray(heads[c].coef_, dtype=np.float64).reshape(1, -1) for c in cats])
+    b = np.array([float(np.ravel(heads[c].intercept_)[0]) for c in cats], dtype=np.float64)
+    return {"kind": "scene", "cats": list(cats), "W": W, "b": b, "plan": heads.get(PLAN_KEY)}
+
+def fuse_ep_heads(ep_heads, cats=CATS):
+    rows, bias = [], []
+    for c in cats:
+        rows.append(np.asarray(ep_heads[c]["bin"].coef_, dtype=np.float64).reshape(1, -1))
+        bias.append(float(np.ravel(ep_heads[c]["bin"].intercept_)[0]))
+    for c in cats:
+        rows.append(np.asarray(ep_heads[c]["sev"].coef_, dtype=np.float64).reshape(1, -1))
+        bias.append(float(np.ravel(ep_heads[c]["sev"].intercept_)[0]))
+    return {"kind": "episode", "cats": list(cats), "W": np.vstack(rows), "b": np.array(bias),
+            "plan": ep_heads.get(PLAN_KEY)}
+
+# ===== Инференс =====
+def scene_proba(fused, X: np.ndarray) -> np.ndarray:
+    """[N, D] -> [N, C] вероятности положительного класса по всем категориям сразу."""
+    X = np.asarray(X, dtype=np.float64)
+    if X.ndim == 1:
+        X = X[None, :]
+    # predict_proba[:, 1] у бинарной LogisticRegression — это expit(decision_function)
+    return _expit(X @ fused["W"].T + fused["b"])
+
+def ep_scores(fused, V: np.ndarray):
+    """[Nw, H] -> (p_bin [Nw, C], p_sev [Nw, C]) для всех эпизодных голов одним matmul."""
+    V = np.asarray(V, dtype=np.float64)
+    if V.ndim == 1:
+        V = V[None, :]
+    C = len(fused["cats"])
+    Z = V @ fused["W"].T + fused["b"]
+    p_bin = _expit(Z[:, :C])
+    p_sev = np.clip(Z[:, C:], 0.0, 1.0)
+    return p_bin, p_sev
+
+# ===== .npz =====
+def save_npz(path, fused):
+    extra = {"plan": np.array(fused["plan"])} if fused.get("plan") else {}
+    np.savez(path, kind=np.array(fused["kind"]), cats=np.array(fused["cats"]),
+             W=fused["W"], b=fused["b"], **extra)
+
+def load_npz(path):
+    with np.load(path, allow_pickle=False) as z:
+        return {"kind": str(z["kind"]), "cats": [str(c) for c in z["cats"]],
+                "W": z["W"], "b": z["b"], "plan": str(z["plan"]) if "plan" in z.files else None}
+
+# ===== Сверка с pickle-моделями sklearn =====
+def verify_scene(heads, fused, X):
+    ref = np.column_stack([heads[c].predict_proba(X)[:, 1] for c in fused["cats"]])
+    got = scene_proba(fused, X)
+    return float(np.max(np.abs(ref - got))), int(np.sum(ref != got))
+
+def verify_ep(ep_heads, fused, V):
+    ref_b = np.column_stack([ep_heads[c]["bin"].predict_proba(V)[:, 1] for c in fused["cats"]])
+    ref_s = np.column_stack([np.clip(ep_heads[c]["sev"].predict(V), 0.0, 1.0) for c in fused["cats"]])
+    got_b, got_s = ep_scores(fused, V)
+    diff = max(float(np.max(np.abs(ref_b - got_b))), float(np.max(np.abs(ref_s - got_s))))
+    return diff, int(np.sum(ref_b != got_b) + np.sum(ref_s != got_s))
+
+def main(heads_pkl="heads.pkl", ep_pkl="episode_heads.pkl", data_x="data_X.npy"):
+    import os
+    import pickle
+    from vector_store import load_features
+    prefix = data_x[:-len("_X.npy")] if data_x.endswith("_X.npy") else data_x
+    X = load_features(prefix) if os.path.exists(f"{prefix}_X.keys") or os.path.exists(data_x) else None
+    with open(heads_pkl, "rb") as f:
+        heads = pickle.load(f)
+    fused = fuse_scene_heads(heads)
+    save_npz("heads.npz", fused)
+    print(f"heads.npz: W{fused['W'].shape}")
+    if X is not None:
+        diff, n = verify_scene(heads, fused, X)
+        print(f"  сверка на {data_x}: max|Δp|={diff:.3e}, отличающихся значений: {n}")
+
+    with open(ep_pkl, "rb") as f:
+        ep_heads = pickle.load(f)
+    fused_ep = fuse_ep_heads(ep_heads)
+    save_npz("episode_heads.npz", fused_ep)
+    print(f"episode_heads.npz: W{fused_ep['W'].shape}")
+    if X is not None:
+        # mean-часть сценового вектора — реальные H-мерные эмбеддинги для сверки эпизодных голов
+        V = X[:, :fused_ep["W"].shape[1]]
+        diff, n = verify_ep(ep_heads, fused_ep, V)
+        print(f"  сверка на {data_x}[:, :H]: max|Δ|={diff:.3e}, отличающихся значений: {n}")
+
+if __name__ == "__main__":
+    main()
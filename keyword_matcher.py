@@ -0,0 +1,111 @@
+# keyword_matcher.py — многошаблонный поиск ключевых слов (Aho–Corasick) за один проход по сцене
+#
+# Семантика совпадает с прежним циклом re.finditer(rf'\b{re.escape(w)}\b', text.lower()):
+# границы слова как у \b в re (буквы любого алфавита, цифры и '_' — «словесные» символы),
+# совпадения одного слова не перекрываются, порядок хитов — по порядку слов в словаре, затем по offset.
+# Слово с '*' на конце — основа: правая граница не требуется ("убийств*" найдёт "убийство").
+
+def _isword(c: str) -> bool:
+    return c.isalnum() or c == "_"
+
+class KeywordMatcher:
+    def __init__(self, keywords: dict, weights: dict):
+        # patterns[pid] = (cat, word, weight, stem)
+        self.patterns = []
+        self.cats = list(keywords.keys())
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for cat, words in keywords.items():
+            for w in words:
+                stem = w.endswith("*")
+                pat = w[:-1] if stem else w
+                if not pat:
+                    continue
+                pid = len(self.patterns)
+                self.patterns.append((cat, w, weights.get(cat, {}).get(w, 1.0), stem))
+                self._insert(pat, pid)
+        self._lens = [len(p[1]) - (1 if p[3] else 0) for p in self.patterns]
+        self._build()
+
+    def _insert(self, pat: str, pid: int):
+        node = 0
+        for ch in pat:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append(pid)
+
+    def _build(self):
+        # BFS: ссылки неудач + объединение выходов по цепочке fail
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for ch, nxt in self._goto[node].items():
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                cand = self._goto[f].get(ch, 0)
+                self._fail[nxt] = cand if cand != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+                queue.append(nxt)
+
+    def scan(self, text: str):
+        """Один проход по text.lower(): [(pid, start, end), ...] с проверкой границ слова."""
+        low = text.lower()
+        n = len(low)
+        goto, fail, out, lens, pats = self._goto, self._fail, self._out, self._lens, self.patterns
+        last_end = {}
+        found = []
+        node = 0
+        for i, ch in enumerate(low):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if not out[node]:
+                continue
+            end = i + 1
+            for pid in out[node]:
+                start = end - lens[pid]
+                if start < last_end.get(pid, 0):
+                    continue
+                # \b слева: «словесность» соседей по разные стороны границы различается
+                left_prev = _isword(low[start - 1]) if start > 0 else False
+                if left_prev == _isword(low[start]):
+                    continue
+                if not pats[pid][3]:
+                    right_next = _isword(low[end]) if end < n else False
+                    if _isword(low[end - 1]) == right_next:
+                        continue
+                last_end[pid] = end
+                found.append((pid, start, end))
+        return found
+
+    def hits(self, text: str, matches=None):
+        """{cat: (hits, total_score)} — тот же формат, что прежний find_triggers_weighted."""
+        if matches is None:
+            matches = self.scan(text)
+        res = {cat: ([], 0.0) for cat in self.cats}
+        for pid, start, end in sorted(matches, key=lambda m: (m[0], m[1])):
+            cat, w, weight, _ = self.patterns[pid]
+            a = max(0, start - 25)
+            b = min(len(text), end + 25)
+            snippet = text[a:b].replace("\n", " ")
+            hits, total = res[cat]
+            hits.append({"offset": start, "match": w, "weight": weight, "snippet": snippet})
+            res[cat] = (hits, total + weight)
+        return res
+
+    def counts(self, matches):
+        """{cat: число совпадений} (как сумма len(re.findall(...)) по словам категории)."""
+        cnt = {cat: 0 for cat in self.cats}
+        for pid, _, _ in matches:
+            cnt[self.patterns[pid][0]] += 1
+        return cnt
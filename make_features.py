@@ -1,22 +1,33 @@
 # make_features.py — сбор признаков под test.py (оконный эмбеддинг сцен)
+#
+# Порядок обучения: train_heads_episodes.py (episode_heads.pkl — из них 30 агрегатов эпизодов в X)
+# -> make_features.py -> train_heads.py. Без эпизодных голов ключи строк считаются (ep=none),
+# но собрать новые строки X нельзя.
 
+import json
+import hashlib
 import numpy as np
 import pandas as pd
-import torch
 import re
 
 # Общий оконный эмбеддинг сцен
-from embeddings import scene_vector  # 3H агрегат: mean | max | top3-mean [web:35][web:39]
+from embeddings import encode_scenes, aggregate_windows  # 3H агрегат: mean | max | top3-mean [web:35][web:39]
 
 # Берём те же помощники и словари, что в test.py
-from test import read_script, split_scenes, keywords
-from episodes_aggregates import episode_aggregates_for_scene  # 30 фич (эпизодные головы) [web:6]
-
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+from scene_parser import read_script, split_scenes
+from test import keywords, KEYWORD_MATCHER
+from episodes_aggregates import episode_aggregates_batch  # 30 фич (эпизодные головы) [web:6]
+# Строки X — в общем хранилище векторов (memmap), а не в одном data_X.npy в памяти
+from embeddings import window_plan_tag, _hash_text_and_params
+from models import get_fused_ep_heads
+from vector_store import open_store, save_feature_keys
 
 EP_RE = re.compile(r'\[\s*ep\s*:\s*([^\]]+)\]', re.IGNORECASE)
 MAP_KEY = {"v":"violence","p":"profanity","s":"sexual","a":"alcohol_drugs","sc":"scary"}
 SEV_TO_NUM = {"None":0.0,"Mild":0.33,"Moderate":0.66,"Severe":1.0}
+# Потолок токенов окон на скрипт при сборе X (0 — без потолка); входит в feature_key
+FEATURE_SCRIPT_BUDGET = 0
+_ep_digest = None
 
 def parse_ep_features(text):
     """[ep: ...] → 10 признаков: 5 max_sev(0..1) + 5 count (как в test.py)"""
@@ -46,28 +57,63 @@ def parse_ep_features(text):
     cats = list(keywords.keys())
     return [max_sev[c] for c in cats] + [count[c] for c in cats]  # [10] [web:6]
 
+def ep_heads_digest() -> str:
+    """Хэш весов эпизодных голов W/b: от них зависят 30 агрегатов эпизодов в строке X."""
+    global _ep_digest
+    if _ep_digest is None:
+        try:
+            fused = get_fused_ep_heads()
+        except FileNotFoundError:
+            return "none"  # головы ещё не обучены — не запоминаем, появятся к сборке строк
+        h = hashlib.sha1(np.ascontiguousarray(fused["W"]).tobytes())
+        h.update(np.ascontiguousarray(fused["b"]).tobytes())
+        _ep_digest = h.hexdigest()
+    return _ep_digest
+
+def feature_key(text):
+    """Ключ строки X: текст сцены + энкодер/окна (как кэш окон) + раскладка и потолки окон + эпизодные головы + словари."""
+    kw = hashlib.sha1(json.dumps(keywords, ensure_ascii=False, sort_keys=True).encode()).hexdigest()
+    pooling = f"features:3H+45|{window_plan_tag()}|script={FEATURE_SCRIPT_BUDGET}|ep={ep_heads_digest()}|{kw}"
+    return _hash_text_and_params(text, 384, 320, pooling=pooling)
+
 def rule_feats(text):
-    """Подсчет совпадений словарей по категориям (границы слова, как в test.py)"""
-    lf = text.lower()
-    feats = []
-    for cat in ["violence","sexual","profanity","alcohol_drugs","scary"]:
-        words = keywords.get(cat, [])
-        cnt = sum(len(re.findall(rf'\b{re.escape(w)}\b', lf)) for w in words)
-        feats.append(cnt)
-    return feats  # [5] [web:39]
+    """Подсчет совпадений словарей по категориям (границы слова, как в test.py) — один проход автомата"""
+    cnt = KEYWORD_MATCHER.counts(KEYWORD_MATCHER.scan(text))
+    return [cnt.get(cat, 0) for cat in ["violence","sexual","profanity","alcohol_drugs","scary"]]  # [5] [web:39]
 
 def run(script_path, labels_csv, out_prefix="data"):
-    # 1) Читаем метки и сцены
+    # 1) Читаем метки и сцены; строки, уже лежащие в хранилище признаков, не пересчитываются
     df = pd.read_csv(labels_csv)
     text = read_script(script_path)
     scenes = split_scenes(text)
+    store = open_store("features")
+    keys = [feature_key(s) for s in scenes]
+    fresh = {}
+    for s, k in zip(scenes, keys):
+        if k not in store:
+            fresh.setdefault(k, s)
+    print(f"Сцен: {len(scenes)}; новых строк X: {len(fresh)}")
+    if fresh:
+        if ep_heads_digest() == "none":
+            raise FileNotFoundError("episode_heads.pkl: сначала обучите эпизодные головы (train_heads_episodes.py)")
+        store.put_many(zip(fresh, build_features(list(fresh.values()))))
+    save_feature_keys(out_prefix, keys)
+
+    # 2) Цели по категориям
+    for cat in ["violence","sexual","profanity","alcohol_drugs","scary"]:
+        y = df[f"has_{cat}"].values
+        np.save(f"{out_prefix}_y_{cat}.npy", y)
+
+    print(f"✅ Сохранено: {out_prefix}_X.keys (строки — {store.path}), {out_prefix}_y_*.npy")
 
-    # 2) Эмбеддинги сцен (оконный агрегат 3H)
-    # Используем кэш внутри scene_vector(use_cache=True) для скорости повторных запусков
+def build_features(scenes):
+    """X = [scene_emb(3H) | rule(5) | ep(10) | epi(30)] по сценам, [N, 3H+45]"""
+    # 2) Эмбеддинги сцен (оконный агрегат 3H) и эпизодные под-спаны — один проход энкодера на скрипт
+    # Используем кэш внутри encode_scenes(use_cache=True) для скорости повторных запусков
     print("Эмбеддинги сцен (sliding windows)...")
-    embs = np.vstack([
-        scene_vector(s, max_len=384, stride=320, batch_size=8, use_cache=True) for s in scenes
-    ])  # [N, 3H] [web:35][web:39]
+    encoded = encode_scenes(scenes, max_len=384, stride=320, use_cache=True,
+                            script_budget=FEATURE_SCRIPT_BUDGET or None)
+    embs = np.vstack([aggregate_windows(V, topk=3) for V, _ in encoded])  # [N, 3H] [web:35][web:39]
 
     # 3) Правила и ручные ep-фичи
     print("Правила и ручные ep-фичи...")
@@ -76,19 +122,12 @@ def run(script_path, labels_csv, out_prefix="data"):
 
     # 4) Агрегаты эпизодов (на токенных окнах)
     print("Агрегаты эпизодов...")
-    epi = np.array([episode_aggregates_for_scene(s) for s in scenes], dtype=float)  # [N, 30] [web:6]
+    epi = episode_aggregates_batch([E for _, E in encoded])  # [N, 30] [web:6]
 
     # 5) Собираем X = [scene_emb(3H) | rule(5) | ep(10) | epi(30)]
     X = np.hstack([embs, rules, ep_feats, epi])
     print("X shape:", X.shape)
-    np.save(f"{out_prefix}_X.npy", X)
-
-    # 6) Цели по категориям
-    for cat in ["violence","sexual","profanity","alcohol_drugs","scary"]:
-        y = df[f"has_{cat}"].values
-        np.save(f"{out_prefix}_y_{cat}.npy", y)
-
-    print(f"✅ Сохранено: {out_prefix}_X.npy, {out_prefix}_y_*.npy")
+    return X
 
 if __name__ == "__main__":
     # Пример: python make_features.py
@@ -0,0 +1,208 @@
+# models.py — единый реестр моделей проекта: всё грузится лениво, при первом обращении
+
+import os
+import threading
+
+MODEL_NAME = "ai-forever/ruRoberta-large"
+
+# Бэкенд энкодера: torch (fp32, по умолчанию) | int8 (динамическая квантизация Linear, CPU) |
+# onnx (экспортированный граф в onnxruntime, CPU; см. export_onnx.py)
+ENCODER_BACKEND = os.environ.get("SCRIPT_ENCODER_BACKEND", "torch").strip().lower()
+ENCODER_BACKENDS = ("torch", "int8", "onnx")
+ONNX_PATH = os.environ.get("SCRIPT_ONNX_PATH", "encoder.onnx")
+# Головы, обученные на другой раскладке окон (или до window_plan в весах), по умолчанию не используются
+ALLOW_STALE_HEADS = os.environ.get("SCRIPT_ALLOW_STALE_HEADS", "0") == "1"
+
+_lock = threading.Lock()
+# Один прямой проход энкодера за раз (веса общие, intra-op потоки torch и так заняты); разбор,
+# кэш и головы из разных потоков идут параллельно. Fast-токенизатор не реентерабелен — свой замок.
+ENCODER_LOCK = threading.Lock()
+TOKENIZER_LOCK = threading.Lock()
+_device = None
+_tok = None
+_mdl = None
+
+def get_device():
+    global _device
+    if _device is None:
+        import torch
+        # int8 и onnx — только CPU
+        _device = "cuda" if torch.cuda.is_available() and ENCODER_BACKEND == "torch" else "cpu"
+    return _device
+
+def encoder_tag() -> str:
+    """
+    Модель + бэкенд: часть ключа кэша эмбеддингов и scoring_stamp, чтобы векторы int8/onnx не смешивались
+    с fp32. Для onnx в тег входит хэш файла графа: encoder.onnx и encoder.int8.onnx — разные энкодеры.
+    """
+    if ENCODER_BACKEND == "torch":
+        return MODEL_NAME
+    if ENCODER_BACKEND == "onnx":
+        return f"{MODEL_NAME}@onnx:{onnx_digest(ONNX_PATH)}"
+    return f"{MODEL_NAME}@{ENCODER_BACKEND}"
+
+_digests = {}
+
+def onnx_digest(path: str) -> str:
+    """
+    sha1 файла графа (первые 16 знаков). Хэш запоминается в процессе и в соседнем <path>.sha1
+    вместе с размером и mtime: сотни мегабайт не перечитываются при каждом запуске.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return f"missing:{os.path.abspath(path)}"
+    stamp = f"{st.st_size} {st.st_mtime_ns}"
+    key = (os.path.abspath(path), stamp)
+    if key not in _digests:
+        side = f"{path}.sha1"
+        try:
+            with open(side, "r", encoding="utf-8") as f:
+                saved_stamp, digest = f.read().strip().rsplit(" ", 1)
+        except (OSError, ValueError):
+            saved_stamp = digest = None
+        if saved_stamp != stamp:
+            import hashlib
+            h = hashlib.sha1()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    h.update(block)
+            digest = h.hexdigest()[:16]
+            try:
+                with open(side, "w", encoding="utf-8") as f:
+                    f.write(f"{stamp} {digest}")
+            except OSError:
+                pass  # каталог только для чтения — посчитаем заново в следующем процессе
+        _digests[key] = digest
+    return _digests[key]
+
+class OnnxEncoder:
+    """ONNX-граф энкодера в onnxruntime с тем же интерфейсом: mdl(input_ids=, attention_mask=).last_hidden_state."""
+    def __init__(self, path: str):
+        import onnxruntime as ort
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, opts, providers=["CPUExecutionProvider"])
+
+    def eval(self):
+        return self
+
+    def __call__(self, input_ids, attention_mask):
+        import torch
+        from types import SimpleNamespace
+        hs, = self.session.run(["last_hidden_state"], {
+            "input_ids": input_ids.cpu().numpy(),
+            "attention_mask": attention_mask.cpu().numpy(),
+        })
+        return SimpleNamespace(last_hidden_state=torch.from_numpy(hs))
+
+def _load_encoder():
+    if ENCODER_BACKEND not in ENCODER_BACKENDS:
+        raise ValueError(f"SCRIPT_ENCODER_BACKEND={ENCODER_BACKEND!r}: ожидается одно из {ENCODER_BACKENDS}")
+    if ENCODER_BACKEND == "onnx":
+        return OnnxEncoder(ONNX_PATH)
+    from transformers import AutoModel
+    mdl = AutoModel.from_pretrained(MODEL_NAME).to(get_device())
+    mdl.eval()
+    if ENCODER_BACKEND == "int8":
+        import torch
+        # Веса Linear — int8, активации квантуются на лету; LayerNorm и эмбеддинги остаются fp32
+        mdl = torch.ao.quantization.quantize_dynamic(mdl, {torch.nn.Linear}, dtype=torch.qint8)
+    return mdl
+
+def get_tokenizer():
+    """Только токенизатор (без весов энкодера) — для разметки окон и offsets, когда векторы уже в кэше."""
+    global _tok
+    if _tok is None:
+        with _lock:
+            if _tok is None:
+                from transformers import AutoTokenizer
+                _tok = AutoTokenizer.from_pretrained(MODEL_NAME)
+    return _tok
+
+def get_tok_mdl():
+    """Токенизатор и энкодер (бэкенд ENCODER_BACKEND) — одна копия на процесс, загрузка при первом вызове."""
+    global _mdl
+    tok = get_tokenizer()
+    if _mdl is None:
+        with _lock:
+            if _mdl is None:
+                _mdl = _load_encoder()
+    return tok, _mdl
+
+def encoder_loaded() -> bool:
+    return _mdl is not None
+
+# ===== Головы классификаторов (pickle) =====
+_pickles = {}
+
+def _load_pickle(path, required: bool):
+    if path not in _pickles:
+        with _lock:
+            if path not in _pickles:
+                import os
+                import pickle
+                if not os.path.exists(path):
+                    if required:
+                        raise FileNotFoundError(path)
+                    _pickles[path] = None
+                else:
+                    with open(path, "rb") as f:
+                        _pickles[path] = pickle.load(f)
+    return _pickles[path]
+
+def get_heads(path="heads.pkl"):
+    """Сценовые головы {cat: LogisticRegression} или None, если файла нет."""
+    return _load_pickle(path, required=False)
+
+def get_ep_heads(path="episode_heads.pkl"):
+    """Эпизодные головы {cat: {'bin': LogReg, 'sev': Ridge}}."""
+    return _load_pickle(path, required=True)
+
+# ===== Сфьюженные веса голов (.npz, без sklearn) =====
+_fused = {}
+
+def _get_fused(npz_path, pkl_path, loader, fuse, required):
+    key = (npz_path, pkl_path)
+    if key not in _fused:
+        import os
+        from fused_heads import load_npz
+        # .npz берём, только если он не старше pickle (иначе головы переобучили — фьюзим заново)
+        if os.path.exists(npz_path) and (not os.path.exists(pkl_path)
+                                         or os.path.getmtime(npz_path) >= os.path.getmtime(pkl_path)):
+            fused = load_npz(npz_path)
+        else:
+            heads = loader(pkl_path)
+            fused = fuse(heads) if heads else None
+            if fused is None and required:
+                raise FileNotFoundError(pkl_path)
+        if fused is not None and not _plan_matches(fused, pkl_path, required):
+            fused = None
+        _fused[key] = fused
+    return _fused[key]
+
+def _plan_matches(fused, pkl_path, required: bool) -> bool:
+    """Раскладка окон голов против текущей: чужие признаки — ошибка (обязательные головы) или отказ от голов."""
+    from embeddings import window_plan_tag
+    plan, current = fused.get("plan"), window_plan_tag()
+    if plan == current:
+        return True
+    msg = (f"{pkl_path}: головы обучены на раскладке окон {plan or 'без метки (до общих окон сцены)'}, "
+           f"текущая {current} — переобучите их (train_heads_episodes -> make_features -> train_heads)")
+    if ALLOW_STALE_HEADS:
+        print(f"⚠️  {msg}; SCRIPT_ALLOW_STALE_HEADS=1 — используются как есть")
+        return True
+    if required:
+        raise ValueError(msg)
+    print(f"⚠️  {msg}; сценовые головы отключены")
+    return False
+
+def get_fused_heads(npz_path="heads.npz", pkl_path="heads.pkl"):
+    """Сценовые головы одной матрицей {W [C, D], b [C]} или None, если голов нет."""
+    from fused_heads import fuse_scene_heads
+    return _get_fused(npz_path, pkl_path, get_heads, fuse_scene_heads, required=False)
+
+def get_fused_ep_heads(npz_path="episode_heads.npz", pkl_path="episode_heads.pkl"):
+    """Эпизодные головы одной матрицей {W [2C, H], b [2C]} (сначала bin, затем sev)."""
+    from fused_heads import fuse_ep_heads
+    return _get_fused(npz_path, pkl_path, get_ep_heads, fuse_ep_heads, required=True)
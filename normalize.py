@@ -3,99 +3,235 @@ import re
 import unicodedata
 
 
-def normalize_headings(text: str) -> str:
+# ===== Скомпилированные паттерны normalize_headings =====
+# Тире и минус -> дефис одним проходом (str.translate с не-ASCII таблицей в разы медленнее)
+DASH_RE = re.compile(r'[–—−]')
+DOUBLE_BACKSLASH_EOL_RE = re.compile(r"[ \t]*\\\\\s*$", re.MULTILINE)
+BACKSLASH_EOL_RE = re.compile(r"[ \t]*\\\s*$", re.MULTILINE)
+PLACE_LINE_START_RE = re.compile(r'(?im)^\s*(нат|инт|nat|int|ext)\b\.?')
+PLACE_NO_DOT_RE = re.compile(r'(?im)\b(ИНТ|НАТ|INT|EXT)(?!\.)\s+')
+PLACE_SEP_RE = re.compile(r'(?im)\b(ИНТ\.|НАТ\.|INT\.|EXT\.)\s*[-:]\s+')
+FUSED_PLACE_RE = re.compile(
+    r'\b(ИНТ|НАТ|INT|EXT)\.([A-ZА-ЯЁ][^\.\n]{2,80})\.(?=ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|DAY|NIGHT|EVENING|MORNING\b)',
+    re.IGNORECASE
+)
+NUM_LOC_DOT_TOD_RE = re.compile(
+    r'(?im)^(\d+\.\s*(?:ИНТ\.|НАТ\.|INT\.|EXT\.)\s+[^\n]{2,120}?)\.\s*'
+    r'(ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|DAY|NIGHT|РЕЖИМ|РАССВЕТ)\b',
+    re.MULTILINE
+)
+NUM_DOT_LOC_RE = re.compile(
+    r'(?im)^(\d+\.\s*(?:ИНТ\.?|НАТ\.?|INT\.?|EXT\.?)\s*[A-ZА-ЯЁ]{3,})\.'
+    r'([A-ZА-ЯЁ]{3,})\s*\.\s*(ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|DAY|NIGHT)',
+    re.MULTILINE
+)
+LOC_SEP_TOD_RE = re.compile(
+    r'(?im)([^-:\n]{2,120}?)\s*[:.]\s*-?\s*(ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|DAY|NIGHT|EVENING|MORNING)\b'
+)
+# Якорь LOC_SEP_TOD_RE: любое его совпадение заканчивается на "[:.] ВРЕМЯ"
+SEP_TOD_RE = re.compile(r'(?im)[:.]\s*-?\s*(?:ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|DAY|NIGHT|EVENING|MORNING)\b')
+TOD_DOT_EOL_RE = re.compile(r'(?im)\b(ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|DAY|NIGHT|EVENING|MORNING)\.\s*$', re.MULTILINE)
+MULTI_SPACE_RE = re.compile(r'[ \t]{2,}')
+TRAILING_SPACE_RE = re.compile(r'[ \t]+$', re.MULTILINE)
+DOUBLE_DASH_RE = re.compile(r'\s*--+\s*')
+MULTI_BLANK_RE = re.compile(r'\n{3,}')
+
+# Кандидаты этапов 3-5: каждое совпадение их паттернов содержит тип места или время суток с границей слова
+CANDIDATE_WORDS = r'\b(?:инт|нат|int|nat|ext|день|ночь|вечер|утро|режим|рассвет|day|night|evening|morning)'
+CANDIDATE_RE = re.compile(CANDIDATE_WORDS, re.IGNORECASE)
+# Тот же поиск без IGNORECASE по text.lower(): вдвое быстрее. Символы, которые re без учёта регистра
+# приравнивает к буквам ключей, а lower() не переводит в них, сводим таблицей (проверено по всему Unicode)
+CANDIDATE_LOWER_RE = re.compile(CANDIDATE_WORDS)
+CASE_FOLD_TABLE = str.maketrans({"ı": "i", "ᲀ": "в", "ᲁ": "д", "ᲂ": "о", "ᲃ": "с", "ᲄ": "т", "ᲅ": "т"})
+CASE_FOLD_RE = re.compile(r'[ıᲀ-ᲅ]')
+# Строка-разделитель (":", "-", "." или пусто): паттерны проходят её насквозь к соседней строке
+SEPARATOR_LINE_RE = re.compile(r'[\s:.\-]*')
+# Строка номера сцены ("12.") перед строкой типа места (4.7, 4.8)
+NUM_LINE_RE = re.compile(r'\s*\d+\.\s*')
+PLACE_END_RE = re.compile(r'(?:инт|нат|int|nat|ext)\Z', re.IGNORECASE)
+
+
+def sub_near_anchors(rx, repl, text: str, anchor_rx, lookback: int, stop_chars: str = "") -> str:
     """
-    Комплексная нормализация заголовков сцен с поддержкой всех форматов.
+    Точный аналог rx.sub(repl, text) для паттерна, каждое совпадение которого заканчивается
+    совпадением anchor_rx, а начинается не раньше, чем за lookback символов до пробельного
+    прогона перед якорем, и не захватывает stop_chars до него. repl — строка-шаблон или функция от совпадения.
+    Движок rx запускается только в окнах у якорей, а не на каждой позиции текста.
     """
-    
-    # ===== ЭТАП 1: Unicode-нормализация =====
-    text = unicodedata.normalize('NFC', text)
-    
-    # ===== ЭТАП 2: Унификация разделителей =====
-    text = text.replace("–", "-").replace("—", "-").replace("−", "-")
-    text = re.sub(r"[ \t]*\\\\\s*$", "", text, flags=re.MULTILINE)
-    text = re.sub(r"[ \t]*\\\s*$", "", text, flags=re.MULTILINE)
-    text = text.replace("{.smallcaps}", "").replace("{.underline}", "")
-    text = text.replace("\\[", "[").replace("\\]", "]")
-    
+    out = []
+    cur = 0
+    n = len(text)
+    expand = repl if callable(repl) else (lambda m: m.expand(repl))
+    for a in anchor_rx.finditer(text):
+        if a.end() <= cur:
+            continue
+        # \s* перед якорем может начинаться раньше — отступаем через пробельный прогон
+        start = a.start()
+        while start > cur and text[start - 1].isspace():
+            start -= 1
+        # endpos = конец якоря + 1 символ: \b в конце видит тот же соседний символ, что и без окна
+        lo = max(cur, start - lookback)
+        for ch in stop_chars:
+            lo = max(lo, text.rfind(ch, lo, start) + 1)
+        m = rx.search(text, lo, min(n, a.end() + 1))
+        if m is None:
+            continue
+        out.append(text[cur:m.start()])
+        out.append(expand(m))
+        cur = m.end()
+    out.append(text[cur:])
+    return "".join(out)
+
+
+def _line_start(text: str, pos: int) -> int:
+    return text.rfind("\n", 0, pos) + 1
+
+def _line_end(text: str, pos: int) -> int:
+    nl = text.find("\n", pos)
+    return len(text) if nl < 0 else nl
+
+def _needs_prev(text: str, a: int, ls: int) -> bool:
+    """Совпадение может начаться на строке перед прогоном разделителей [a, ls) у кандидата в ls."""
+    if not text[a:ls].isspace() and a < ls:
+        return True  # ":" / "-" / "." между строками — этап 5.1 и 4.8 тянутся с предыдущей строки
+    q = ls
+    while q < len(text) and text[q] != "\n" and text[q].isspace():
+        q += 1
+    if q < len(text) and (text[q] in ":.-" or CANDIDATE_RE.match(text, q)):
+        return True  # "локация\n: ДЕНЬ", "локация.\n- ДЕНЬ", "ЛОКАЦИЯ.\nДЕНЬ" (4.7, 4.8, 5.1)
+    return NUM_LINE_RE.fullmatch(text, _line_start(text, a - 1), a - 1) is not None  # "1.\nИНТ." (4.7, 4.8)
+
+def _needs_next(text: str, ls: int, le: int) -> bool:
+    """Строка кандидата кончается типом места (+ разделители): 3.2, 3.3, 4.7, 4.8 идут на следующую строку."""
+    j = le
+    while j > ls and (text[j - 1].isspace() or text[j - 1] in ":.-"):
+        j -= 1
+    return PLACE_END_RE.search(text, max(ls, j - 3), j) is not None
+
+def heading_windows(text: str):
+    """
+    Участки [(a, b)] по целым строкам, вне которых этапы 3-5 ничего не меняют (один проход по кандидатам).
+    Участок — строка кандидата с пустыми строками и строками-разделителями вокруг; соседняя непустая
+    строка — только если паттерн может перейти на неё (_needs_prev / _needs_next). Смежные участки
+    сливаются.
+    """
+    windows = []
+    n = len(text)
+    scan, rx = text.lower(), CANDIDATE_LOWER_RE
+    if len(scan) != n:
+        scan, rx = text, CANDIDATE_RE  # "İ".lower() длиннее — позиции разъехались бы
+    elif CASE_FOLD_RE.search(scan):
+        scan = scan.translate(CASE_FOLD_TABLE)
+    last = -1  # конец строки предыдущего кандидата
+    for m in rx.finditer(scan):
+        if m.start() <= last:
+            continue  # та же строка
+        ls = _line_start(text, m.start())
+        le = last = _line_end(text, m.end())
+        a = ls
+        while a > 0:
+            p = _line_start(text, a - 1)
+            if not SEPARATOR_LINE_RE.fullmatch(text, p, a - 1):
+                break
+            a = p
+        if a > 0 and _needs_prev(text, a, ls):
+            a = _line_start(text, a - 1)
+        b = le
+        while b < n:
+            e = _line_end(text, b + 1)
+            if not SEPARATOR_LINE_RE.fullmatch(text, b + 1, e):
+                break
+            b = e
+        if b < n and _needs_next(text, ls, le):
+            b = _line_end(text, b + 1)
+        if windows and a <= windows[-1][1] + 1:
+            windows[-1] = (windows[-1][0], max(b, windows[-1][1]))
+        else:
+            windows.append((a, b))
+    return windows
+
+def _loc_dash_tod(m) -> str:
+    # r'\1 - \2' без разбора шаблона на каждом совпадении (m.expand)
+    return f"{m.group(1)} - {m.group(2)}"
+
+def _heading_stages(text: str) -> str:
+    """Этапы 3-5 (типы мест, слитное написание, разделитель перед временем) над участком текста."""
     # ===== ЭТАП 3: Нормализация типов мест (ИНТ/НАТ) =====
     # 3.1) Поднимаем строчные в начале строки
-    text = re.sub(
-        r'(?im)^\s*(нат|инт|nat|int|ext)\b\.?',
-        lambda m: m.group(1).upper() + '.',
-        text
-    )
+    text = PLACE_LINE_START_RE.sub(lambda m: m.group(1).upper() + '.', text)
     
     # 3.2) Добавляем точку если отсутствует после ИНТ/НАТ
-    text = re.sub(
-        r'(?im)\b(ИНТ|НАТ|INT|EXT)(?!\.)\s+',
-        r'\1. ',
-        text
-    )
+    text = PLACE_NO_DOT_RE.sub(r'\1. ', text)
     
     # 3.3) Убираем дефис/двоеточие ПОСЛЕ типа места: "ИНТ. - " -> "ИНТ. "
-    text = re.sub(
-        r'(?im)\b(ИНТ\.|НАТ\.|INT\.|EXT\.)\s*[-:]\s+',
-        r'\1 ',
-        text
-    )
+    text = PLACE_SEP_RE.sub(r'\1 ', text)
     
     # ===== ЭТАП 4: Обработка слитного написания =====
     # 4.1) "ИНТ.ЛОКАЦИЯ.ВРЕМЯ" -> "ИНТ. ЛОКАЦИЯ - ВРЕМЯ"
     # Используем lookahead для проверки времени суток в конце
-    text = re.sub(
-        r'\b(ИНТ|НАТ|INT|EXT)\.([A-ZА-ЯЁ][^\.\n]{2,80})\.(?=ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|DAY|NIGHT|EVENING|MORNING\b)',
-        r'\1. \2 - ',
-        text,
-        flags=re.IGNORECASE
-    )
+    text = FUSED_PLACE_RE.sub(r'\1. \2 - ', text)
 
     # ===== ЭТАП 4.7: "ЛОКАЦИЯ. ВРЕМЯ" -> "ЛОКАЦИЯ - ВРЕМЯ" (для формата с номером) =====
-    text = re.sub(
-        r'(?im)^(\d+\.\s*(?:ИНТ\.|НАТ\.|INT\.|EXT\.)\s+[^\n]{2,120}?)\.\s*'
-        r'(ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|DAY|NIGHT|РЕЖИМ|РАССВЕТ)\b',
-        r'\1 - \2',
-        text,
-        flags=re.MULTILINE
-    )
+    text = NUM_LOC_DOT_TOD_RE.sub(r'\1 - \2', text)
 
     # ===== ЭТАП 4.8: "НАТ.У ЦИРКА. ДЕНЬ" -> "НАТ. У ЦИРКА - ДЕНЬ" =====
-    text = re.sub(
-        r'(?im)^(\d+\.\s*(?:ИНТ\.?|НАТ\.?|INT\.?|EXT\.?)\s*[A-ZА-ЯЁ]{3,})\.'
-        r'([A-ZА-ЯЁ]{3,})\s*\.\s*(ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|DAY|NIGHT)',
-        r'\1 \2 - \3',
-        text,
-        flags=re.MULTILINE
-    )
+    text = NUM_DOT_LOC_RE.sub(r'\1 \2 - \3', text)
     
     # ===== ЭТАП 5: Нормализация разделителя между локацией и временем =====
-    # 5.1) Двоеточие или точка перед временем -> дефис
-    text = re.sub(
-        r'(?im)([^-:\n]{2,120}?)\s*[:.]\s*-?\s*(ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|DAY|NIGHT|EVENING|MORNING)\b',
-        r'\1 - \2',
-        text
-    )
+    # 5.1) Двоеточие или точка перед временем -> дефис.
+    # Ленивый {2,120}? на каждой позиции — самый дорогой проход; совпадение всегда кончается
+    # на "[:.] ВРЕМЯ", а локация не длиннее 120 символов и без "-:\n" — движок гоняем
+    # только в этом окне перед такими местами.
+    text = sub_near_anchors(LOC_SEP_TOD_RE, _loc_dash_tod, text, SEP_TOD_RE, 120, "-:\n")
     
     # 5.2) Убираем точку в конце времени суток
-    text = re.sub(
-        r'(?im)\b(ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|DAY|NIGHT|EVENING|MORNING)\.\s*$',
-        r'\1',
-        text,
-        flags=re.MULTILINE
-    )
+    return TOD_DOT_EOL_RE.sub(r'\1', text)
+
+
+def normalize_headings(text: str) -> str:
+    """
+    Комплексная нормализация заголовков сцен с поддержкой всех форматов.
+    Тире — одним проходом, разметка — только если она есть; этапы заголовков — только на участках
+    у кандидатов (heading_windows), результат тот же, что у этапов по всему тексту.
+    """
+    
+    # ===== ЭТАП 1: Unicode-нормализация =====
+    text = unicodedata.normalize('NFC', text)
+    
+    # ===== ЭТАП 2: Унификация разделителей =====
+    text = DASH_RE.sub('-', text)
+    if "\\" in text:
+        text = DOUBLE_BACKSLASH_EOL_RE.sub("", text)
+        text = BACKSLASH_EOL_RE.sub("", text)
+    # Разметка pandoc — по порядку (удаление {.smallcaps} может склеить "\\[" или "{.underline}")
+    if "{." in text:
+        text = text.replace("{.smallcaps}", "").replace("{.underline}", "")
+    if "\\" in text:
+        text = text.replace("\\[", "[").replace("\\]", "]")
+    
+    # ===== ЭТАПЫ 3-5: заголовки — только на участках у кандидатов =====
+    out, cur = [], 0
+    for a, b in heading_windows(text):
+        out.append(text[cur:a])
+        out.append(_heading_stages(text[a:b]))
+        cur = b
+    out.append(text[cur:])
+    text = "".join(out)
     
     # ===== ЭТАП 6: Унификация пробелов =====
     # Множественные пробелы -> один пробел
-    text = re.sub(r'[ \t]{2,}', ' ', text)
+    text = MULTI_SPACE_RE.sub(' ', text)
     
     # Пробелы в конце строк
-    text = re.sub(r'[ \t]+$', '', text, flags=re.MULTILINE)
+    text = TRAILING_SPACE_RE.sub('', text)
     
     # ===== ЭТАП 7: Двойные дефисы =====
-    text = re.sub(r'\s*--+\s*', ' - ', text)
+    if "--" in text:
+        text = DOUBLE_DASH_RE.sub(' - ', text)
     
     # Множественные пустые строки
-    text = re.sub(r'\n{3,}', '\n\n', text)
+    if "\n\n\n" in text:
+        text = MULTI_BLANK_RE.sub('\n\n', text)
     
     return text
 
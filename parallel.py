@@ -0,0 +1,121 @@
+# parallel.py — многопроцессный анализ сценария (fork после загрузки моделей)
+#
+# Модель, HEADS и EP_HEADS грузятся в родителе один раз; воркеры получают их через fork
+# (copy-on-write, веса только читаются). В каждом воркере число потоков torch закреплено,
+# чтобы intra-op потоки разных процессов не дрались за ядра.
+# fork делаем до первого инференса в родителе: OpenMP-пул после fork может зависнуть.
+# fork из процесса с живыми потоками (сервер, batch_runner) — тот же риск для замков OpenMP и токенизатора:
+# тогда (SCRIPT_PARALLEL_START=auto) сцены считаются последовательно, как в pdf_pages.
+# Пул один на весь прогон (ScenePool): потоковый режим шлёт в него кусок за куском без повторного fork.
+
+import os
+import threading
+import multiprocessing as mp
+
+from models import get_tok_mdl, get_fused_heads, get_fused_ep_heads
+
+# Способ запуска воркеров: auto (fork, если в процессе нет других потоков, иначе последовательно) |
+# fork | forkserver | spawn (воркер грузит модель сам)
+PARALLEL_START = os.environ.get("SCRIPT_PARALLEL_START", "auto").strip().lower()
+
+def _init_worker(threads: int):
+    import torch
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # пул interop уже поднят — оставляем как есть
+
+# Счётчики embeddings, которые воркер меняет у себя: без возврата в родителя они терялись бы
+def _stats_tables():
+    from embeddings import CACHE_STATS, ENCODE_STATS, WINDOW_STATS
+    return {"cache": CACHE_STATS, "encode": ENCODE_STATS, "window": WINDOW_STATS}
+
+def _analyze_chunk(args):
+    scenes, use_cache = args
+    from test import analyze_scenes
+    before = {name: dict(tbl) for name, tbl in _stats_tables().items()}
+    result = analyze_scenes(scenes, use_cache=use_cache)
+    after = _stats_tables()
+    return result, {name: {k: (v, before[name].get(k)) for k, v in after[name].items()} for name in after}
+
+def merge_stats(deltas):
+    """Прибавить к счётчикам родителя приросты воркеров; bytes кэша — абсолютное значение, берётся последнее."""
+    tables = _stats_tables()
+    for delta in deltas:
+        for name, items in delta.items():
+            for k, (v, v0) in items.items():
+                if k == "bytes":
+                    tables[name][k] = v if v is not None else tables[name][k]
+                else:
+                    tables[name][k] += v - (v0 or 0)
+
+def _mp_context():
+    """Контекст пула или None — анализировать в текущем процессе."""
+    methods = mp.get_all_start_methods()
+    if PARALLEL_START == "auto":
+        if "fork" in methods and threading.active_count() == 1:
+            return mp.get_context("fork")
+        return None
+    return mp.get_context(PARALLEL_START) if PARALLEL_START in methods else None
+
+def split_chunks(scenes, n: int):
+    """Непрерывные куски примерно равной суммарной длины (порядок сцен сохраняется)."""
+    total = sum(len(s) for s in scenes) or 1
+    chunks, cur, acc = [], [], 0
+    for s in scenes:
+        cur.append(s)
+        acc += len(s)
+        if len(chunks) < n - 1 and acc >= total * (len(chunks) + 1) / n:
+            chunks.append(cur)
+            cur = []
+    if cur:
+        chunks.append(cur)
+    return chunks
+
+class ScenePool:
+    """Воркеры на весь прогон: пул поднимается при первом куске сцен и живёт до close()."""
+
+    def __init__(self, workers: int = 4, threads_per_worker: int = None, use_cache: bool = True):
+        self.workers = workers
+        self.threads = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+        self.use_cache = use_cache
+        self._ctx = _mp_context() if workers > 1 else None
+        self._pool = None
+
+    def analyze(self, scenes, script_tokens=None):
+        """То же, что test.analyze_scenes, но сцены делятся между воркерами; порядок сохраняется."""
+        if self._ctx is None or len(scenes) <= 1:
+            from test import analyze_scenes
+            return analyze_scenes(scenes, use_cache=self.use_cache, script_tokens=script_tokens)
+        if self._pool is None:
+            if self._ctx.get_start_method() == "fork":
+                # Всё тяжёлое — до fork, чтобы воркеры делили страницы памяти с родителем
+                get_tok_mdl()
+                get_fused_heads()
+                get_fused_ep_heads()
+            self._pool = self._ctx.Pool(self.workers, initializer=_init_worker, initargs=(self.threads,))
+        # воркеры токенизируют свои сцены сами: срез общего прохода не пересекает границу процесса
+        chunks = split_chunks(scenes, self.workers)
+        parts = self._pool.map(_analyze_chunk, [(c, self.use_cache) for c in chunks])
+        merge_stats(d for _, d in parts)
+        return [pc for part, _ in parts for pc in part]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is not None and self._pool is not None:
+            self._pool.terminate()
+        self.close()
+
+def analyze_scenes_parallel(scenes, workers: int = 4, threads_per_worker: int = None, use_cache: bool = True):
+    """То же, что test.analyze_scenes, но сцены делятся между workers процессами; порядок сохраняется."""
+    with ScenePool(workers, threads_per_worker, use_cache) as pool:
+        return pool.analyze(scenes)
@@ -0,0 +1,238 @@
+# pdf_pages.py — текст PDF по страницам: пул процессов по диапазонам страниц + постраничный кэш
+#
+# pdfplumber — чистый Python: на 150-страничном сценарии последовательный extract_text идёт десятки секунд.
+# Некэшированные страницы делятся на непрерывные диапазоны по числу воркеров; каждый воркер сам открывает
+# файл и извлекает свой диапазон. Страницы отдаются строго по порядку, по мере готовности диапазонов.
+#
+# Ключ кэша — отпечаток содержимого страницы (потоки контента, XObject, шрифты, геометрия), а не хэш файла:
+# в исправленной версии сценария заново извлекаются только изменённые страницы, даже если они сдвинулись.
+#
+# Пример: python pdf_pages.py script.pdf --workers 4
+
+import os
+import time
+import hashlib
+import threading
+import multiprocessing as mp
+from collections import namedtuple
+
+# Тот же корень, что у кэша эмбеддингов (embeddings.CACHE_DIR), без импорта torch
+CACHE_DIR = os.environ.get("SCRIPT_CACHE_DIR", "./.cache_script_rating")
+PAGES_DIR = os.path.join(CACHE_DIR, "pdf_pages")
+PDF_WORKERS = int(os.environ.get("SCRIPT_PDF_WORKERS", "0")) or min(4, os.cpu_count() or 1)
+# Меньше страниц на воркер — старт процесса и повторное открытие файла дороже самой работы
+PDF_MIN_PAGES_PER_WORKER = 8
+# Запуск воркеров: auto — fork, только если в процессе нет других потоков (иначе последовательно:
+# fork при живых потоках, например в scoring_server или batch_runner, может повиснуть на чужой блокировке);
+# fork / forkserver / spawn — явно (forkserver и spawn заново импортируют __main__ в каждом воркере)
+PDF_START = os.environ.get("SCRIPT_PDF_START", "auto").strip().lower()
+# Глубина вложенных /Resources form-XObject в отпечатке
+PDF_FINGERPRINT_DEPTH = 4
+
+# no — номер страницы с 1; seconds — время extract_text (для кэша — время чтения из кэша)
+PdfPage = namedtuple("PdfPage", "no text seconds cached")
+
+# Накопительные счётчики + постраничные времена последнего документа
+PDF_STATS = {"docs": 0, "pages": 0, "cached": 0, "extracted": 0, "extract_s": 0.0, "last_page_s": []}
+
+# ===== Отпечаток страницы =====
+def _stream_bytes(obj) -> bytes:
+    from pdfminer.pdftypes import PDFStream, resolve1
+    obj = resolve1(obj)
+    if not isinstance(obj, PDFStream):
+        return repr(obj).encode()
+    raw = obj.get_rawdata()  # сжатые байты: распаковывать ради хэша незачем
+    return raw if raw is not None else obj.get_data()
+
+def _hash_font(h, font):
+    from pdfminer.pdftypes import PDFStream, resolve1
+    # Имя, кодировка (имя или словарь с /Differences) и ToUnicode — от них зависит извлечённый текст
+    for name in ("BaseFont", "Subtype", "Encoding", "ToUnicode"):
+        x = resolve1(font.get(name))
+        if isinstance(x, PDFStream):
+            h.update(_stream_bytes(x))
+        elif isinstance(x, dict):
+            h.update(repr(sorted((k, resolve1(v)) for k, v in x.items())).encode())
+        else:
+            h.update(repr(x).encode())
+
+def _hash_resources(h, res, depth: int = 0):
+    """Шрифты и XObject словаря ресурсов, включая вложенные /Resources form-XObject."""
+    from pdfminer.pdftypes import resolve1
+    res = resolve1(res) or {}
+    for kind in ("Font", "XObject"):
+        table = resolve1(res.get(kind)) or {}
+        for name in sorted(table):
+            h.update(f"|{depth}:{kind}:{name}|".encode())
+            x = resolve1(table[name])
+            if kind == "Font":
+                _hash_font(h, x)
+                continue
+            h.update(_stream_bytes(x))
+            # Текст form-XObject рисуется его собственными шрифтами; глубина ограничена от циклов
+            sub = x.get("Resources") if hasattr(x, "get") else None
+            if sub is not None and depth < PDF_FINGERPRINT_DEPTH:
+                _hash_resources(h, sub, depth + 1)
+
+def page_fingerprint(page):
+    """sha1 содержимого страницы pdfplumber или None, если снять его не удалось (тогда без кэша)."""
+    try:
+        obj = page.page_obj
+        h = hashlib.sha1(repr((page.bbox, page.rotation)).encode())
+        for s in obj.contents or []:
+            h.update(_stream_bytes(s))
+        _hash_resources(h, obj.resources)
+        return h.hexdigest()
+    except Exception:
+        return None
+
+# ===== Постраничный кэш текста =====
+def _cache_key(fingerprint: str) -> str:
+    import pdfplumber
+    # Версия экстрактора входит в ключ: другой pdfplumber может иначе собрать строки
+    return hashlib.sha1(f"pdfplumber-{pdfplumber.__version__}|{fingerprint}".encode()).hexdigest()
+
+def _cache_path(key: str) -> str:
+    return os.path.join(PAGES_DIR, key[:2], f"{key}.txt")
+
+def page_cache_get(key: str):
+    try:
+        with open(_cache_path(key), "r", encoding="utf-8", newline="") as f:
+            return f.read()
+    except OSError:
+        return None
+
+def page_cache_put(key: str, text: str):
+    """Атомарная запись текста страницы (newline="" — текст байт в байт как из extract_text)."""
+    path = _cache_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8", newline="") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+# ===== Извлечение =====
+def _extract(pdf, nos):
+    """(no, text, seconds) по страницам nos уже открытого документа."""
+    for no in nos:
+        page = pdf.pages[no - 1]
+        t0 = time.perf_counter()
+        text = page.extract_text() or ""
+        dt = time.perf_counter() - t0
+        page.flush_cache()  # разобранные объекты страницы больше не нужны
+        yield no, text, dt
+
+def _extract_range(args):
+    # Воркер: свой дескриптор файла, свой диапазон страниц
+    path, nos = args
+    import pdfplumber
+    with pdfplumber.open(path) as pdf:
+        return list(_extract(pdf, nos))
+
+def split_ranges(nos, n: int):
+    """Непрерывные куски списка страниц примерно равной длины (порядок сохраняется)."""
+    n = max(1, min(n, len(nos) // PDF_MIN_PAGES_PER_WORKER))
+    size, rest = divmod(len(nos), n)
+    ranges, a = [], 0
+    for i in range(n):
+        b = a + size + (1 if i < rest else 0)
+        if b > a:
+            ranges.append(nos[a:b])
+        a = b
+    return ranges
+
+def _mp_context():
+    """Контекст пула или None — извлекать последовательно в текущем процессе."""
+    methods = mp.get_all_start_methods()
+    if PDF_START == "auto":
+        if "fork" in methods and threading.active_count() == 1:
+            return mp.get_context("fork")
+        return None
+    return mp.get_context(PDF_START) if PDF_START in methods else None
+
+def iter_pdf_pages(path, workers: int = None, use_cache: bool = True):
+    """
+    PdfPage по порядку страниц. Кэшированные страницы отдаются сразу,
+    остальные — по мере готовности диапазонов в пуле процессов (см. PDF_START).
+    """
+    import pdfplumber
+    workers = workers or PDF_WORKERS
+    page_s = []
+    stats = {"pages": 0, "cached": 0, "extracted": 0, "extract_s": 0.0}
+    with pdfplumber.open(path) as pdf:
+        n = len(pdf.pages)
+        keys, cached = {}, {}
+        if use_cache:
+            for no, page in enumerate(pdf.pages, 1):
+                fp = page_fingerprint(page)
+                if fp is None:
+                    continue
+                keys[no] = _cache_key(fp)
+                t0 = time.perf_counter()
+                text = page_cache_get(keys[no])
+                if text is not None:
+                    cached[no] = PdfPage(no, text, time.perf_counter() - t0, True)
+        todo = [no for no in range(1, n + 1) if no not in cached]
+        ranges = split_ranges(todo, workers) if todo else []
+
+        def merged(extracted):
+            nxt = 1
+            for no, text, dt in extracted:
+                while nxt < no:
+                    yield cached[nxt]
+                    nxt += 1
+                if no in keys:
+                    page_cache_put(keys[no], text)
+                stats["extracted"] += 1
+                stats["extract_s"] += dt
+                yield PdfPage(no, text, dt, False)
+                nxt = no + 1
+            while nxt <= n:
+                yield cached[nxt]
+                nxt += 1
+
+        ctx = _mp_context() if len(ranges) > 1 else None
+        if ctx is None:
+            pages = merged(_extract(pdf, todo))
+            pool = None
+        else:
+            pool = ctx.Pool(len(ranges))
+            chunks = pool.imap(_extract_range, [(path, r) for r in ranges])
+            pages = merged(x for chunk in chunks for x in chunk)
+        try:
+            for pg in pages:
+                page_s.append(pg.seconds)
+                stats["pages"] += 1
+                stats["cached"] += pg.cached
+                yield pg
+        finally:
+            if pool is not None:
+                pool.terminate()
+            for k, v in stats.items():
+                PDF_STATS[k] += v
+            PDF_STATS["docs"] += 1
+            PDF_STATS["last_page_s"] = page_s
+
+def extract_pages(path, workers: int = None, use_cache: bool = True):
+    """Все страницы списком: len() — число страниц, [p.seconds for p in ...] — время по страницам."""
+    return list(iter_pdf_pages(path, workers=workers, use_cache=use_cache))
+
+def main(argv=None):
+    import argparse
+    ap = argparse.ArgumentParser(description="Извлечение текста PDF по страницам (пул процессов + кэш)")
+    ap.add_argument("pdf")
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--no-cache", action="store_true")
+    args = ap.parse_args(argv)
+    t0 = time.perf_counter()
+    pages = extract_pages(args.pdf, workers=args.workers, use_cache=not args.no_cache)
+    dt = time.perf_counter() - t0
+    times = sorted(p.seconds for p in pages if not p.cached)
+    print(f"Страниц: {len(pages)}; из кэша: {sum(p.cached for p in pages)}; за {dt:.2f} s")
+    if times:
+        print(f"extract_text: сумма {sum(times):.2f} s, медиана {times[len(times) // 2]:.3f} s, max {times[-1]:.3f} s")
+        for p in sorted((p for p in pages if not p.cached), key=lambda p: -p.seconds)[:5]:
+            print(f"  стр. {p.no}: {p.seconds:.3f} s")
+
+if __name__ == "__main__":
+    main()
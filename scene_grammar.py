@@ -0,0 +1,431 @@
+# scene_grammar.py — единая грамматика заголовков сцен: разбивка, парсинг, нормализация.
+# Общая для обучения (extract_labels, make_features), инференса (test, scoring_server) и отладки (debug_split).
+# Все паттерны скомпилированы при импорте; таблицы упорядочены — порядок веток и есть приоритет.
+import re
+from collections import deque
+
+# ===== Общие куски грамматики =====
+SCENE_NO = r'(?:\d+\s*-\s*\d+(?:\s*-\s*[A-Za-zА-ЯЁ])?)?\.?\s*'
+PLACE = r'(?:ИНТ\.?|НАТ\.?|INT\.?|EXT\.?)'
+
+# ===== РАЗБИВКА НА СЦЕНЫ: упорядоченные ветки тела заголовка =====
+SPLIT_BRANCHES = [
+    # БЛОК 1: Стандартный формат (с дефисом)
+    ("dash",
+     SCENE_NO +
+     r'(?:\d{1,2}-[ЕE]\.?)?\s*'
+     r'(?:ИНТ\.?|НАТ\.?|INT\.?|EXT\.?|И/Н|I/E)\s+'
+     r'[^\n]{2,140}?'
+     r'\s*[-–—]\s*'
+     r'(?:ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|DAY|NIGHT|EVENING|MORNING|РЕЖИМ|РАССВЕТ)(?:\s+\d+)?'),
+    # БЛОК 2: БЕЗ дефиса (точка или пробел перед временем)
+    ("no_dash",
+     SCENE_NO + PLACE + r'\s*'
+     r'[^\n]{2,200}?'
+     r'\.?\s+'
+     r'(?:ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|DAY|NIGHT|РЕЖИМ|РАССВЕТ)(?:\s+\d+)?'
+     r'\.?\s*$'),
+    # БЛОК 3: Слитное написание "ЛЕС.ОПУШКА НОЧЬ"
+    ("fused_dot",
+     SCENE_NO + PLACE + r'\s*'
+     r'[A-ZА-ЯЁ]+\.[A-ZА-ЯЁ][^\n]{1,100}?'
+     r'\s+(?:ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|РЕЖИМ|РАССВЕТ)(?:\s+\d+)?'),
+    # БЛОК 4: Номер.тип ЛОКАЦИЯ - ВРЕМЯ
+    ("num_dash",
+     r'\d+\.\s*' + PLACE + r'\s+[^\n]{2,120}\s*[-–—]\s*'
+     r'(?:ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|РЕЖИМ|РАССВЕТ)(?:\s+\d+)?'),
+    # БЛОК 5: Служебные маркеры
+    ("marker",
+     r'(?:СЦЕНА|СЕРИЯ|ТИТРЫ)\s*\d*'),
+    # БЛОК 6: Формат "номер. тип. ЛОКАЦИЯ. ВРЕМЯ" (с точками вместо дефисов)
+    ("num_dots",
+     r'\d+\.\s*' + PLACE + r'\s*'
+     r'[^\n]{2,200}?\.\s*'
+     r'(?:ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|DAY|NIGHT|РЕЖИМ|РАССВЕТ)\b'),
+    # БЛОК 7: Формат "номер. тип. ЛОКАЦИЯ. ПОДЛОКАЦИЯ" (без времени, для сцен 12, 13)
+    ("sublocation",
+     SCENE_NO + PLACE + r'\s*'
+     r'[A-ZА-ЯЁ][^\n.]{2,100}?\.[A-ZА-ЯЁ][^\n]{2,100}?'
+     r'(?:\s*/\s*[A-ZА-ЯЁ][^\n]{2,100}?)?'),
+    # БЛОК 8: Слитное без пробелов "номер. тип.ЛОКАЦИЯ" или с / (для 10, 15)
+    ("glued",
+     SCENE_NO + PLACE + r'\s*'
+     r'[A-ZА-ЯЁ][^\n\s]{4,120}?(?:\s*/\s*[A-ZА-ЯЁ][^\n]{2,100}?)?'
+     r'(?=\s*(?:ДЕНЬ|НОЧЬ|\n))'),
+    # БЛОК 9: "номер. НАТ.У ЦИРКА. ДЕНЬ" (точки вместо дефисов, для 3, 4, 7)
+    ("num_dot_loc",
+     r'\d+\.\s*' + PLACE + r'\s*'
+     r'[A-ZА-ЯЁ][^\n.]{2,80}?\.[A-ZА-ЯЁ][^\n]{2,80}?'
+     r'(?:\s*\.\s*(?:ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|DAY|NIGHT)\b)?'),
+]
+
+# Тело заголовка без якоря: сегментатор проверяет его .match() от первого непробельного символа строки
+HEADING_BODY_SRC = r'(?:' + r'|'.join(src for _, src in SPLIT_BRANCHES) + r')'
+HEADING_BODY = re.compile(HEADING_BODY_SRC, re.IGNORECASE | re.MULTILINE)
+
+# Те же ветки по отдельности — чтобы отладка видела, какое правило сработало
+SPLIT_RULES = [(name, re.compile(src, re.IGNORECASE | re.MULTILINE)) for name, src in SPLIT_BRANCHES]
+
+# Прежний split-regex (lookahead на каждом начале строки) — оставлен для сверки и старых скриптов
+COMPREHENSIVE_SPLIT = re.compile(r'(?=^\s*' + HEADING_BODY_SRC + r')', re.IGNORECASE | re.MULTILINE)
+
+# Дешёвый префильтр: любая ветка начинается с цифры, точки, ИНТ/НАТ/INT/EXT/И/Н/I/E или СЦЕНА/СЕРИЯ/ТИТРЫ
+HEADING_FIRST_CHAR = re.compile(r'[\d.ИНIEСТ]', re.IGNORECASE)
+LEADING_WS = re.compile(r'\s*')
+# Сколько непустых строк вперёд видит потоковый сегментатор: тело заголовка
+# пересекает заметно меньше строк с текстом, пустые строки окно не ограничивают
+HEADING_LOOKAHEAD = 16
+ACTION_RE = re.compile(
+    r'\b(входит|выходит|говорит|смотрит|берёт|идёт|садится|стоит|открывает|закрывает)\b',
+    re.IGNORECASE
+)
+
+
+def heading_offsets(text: str):
+    """
+    Offsets начала заголовков сцен за один проход по строкам.
+    Каждая строка классифицируется один раз: префильтр по первому символу + один якорный match.
+    Совпадает с границами re.split(COMPREHENSIVE_SPLIT, ...) с точностью до пробельных хвостов.
+    """
+    offsets = []
+    n = len(text)
+    pos = 0
+    while pos < n:
+        nl = text.find("\n", pos)
+        end = n if nl < 0 else nl
+        # ^\s* исходного regex: первый непробельный символ строки (пустые строки не бывают началом)
+        q = LEADING_WS.match(text, pos, end).end()
+        if q < end and HEADING_FIRST_CHAR.match(text, q) and HEADING_BODY.match(text, q):
+            offsets.append(q)
+        if nl < 0:
+            break
+        pos = nl + 1
+    return offsets
+
+def heading_rule(text: str, pos: int = 0) -> str:
+    """Имя первой ветки SPLIT_BRANCHES, которая принимает заголовок с позиции pos ("" — ни одна)."""
+    for name, rx in SPLIT_RULES:
+        if rx.match(text, pos):
+            return name
+    return ""
+
+def scene_spans(text: str):
+    """Границы сцен [(start, end)] в исходном тексте — без копирования подстрок наружу."""
+    cuts = [0] + heading_offsets(text) + [len(text)]
+    spans = []
+    for a, b in zip(cuts, cuts[1:]):
+        span = _part_span(a, text[a:b])
+        if span:
+            spans.append(span[:2])
+    return spans
+
+def _part_span(a: int, p: str):
+    """Фрагмент между заголовками -> (start, end, body) или None, если это не сцена."""
+    body = p.strip()
+    word_count = len(body.split())
+    # Минимум 5 слов ИЛИ наличие характерных действий
+    if word_count >= 5 or (word_count >= 3 and ACTION_RE.search(body)):
+        start = a + (len(p) - len(p.lstrip()))
+        return start, start + len(body), body
+    return None
+
+def iter_scene_spans(lines):
+    r"""
+    Потоковый scene_spans: lines — строки текста без '\n' (как text.split("\n")),
+    сцены (start, end, body) отдаются, как только виден следующий заголовок.
+    В памяти — текущая сцена и HEADING_LOOKAHEAD непустых строк впереди.
+    """
+    src = iter(lines)
+    ahead = deque()       # (offset, line) ещё не классифицированные строки
+    nonblank = 0          # непустых строк в ahead
+    eof = False
+    offset = 0            # offset следующей читаемой строки
+    part, cut = [], 0     # куски текущего фрагмента и его начало
+    first = True
+    while True:
+        while not eof and nonblank <= HEADING_LOOKAHEAD:
+            line = next(src, None)
+            if line is None:
+                eof = True
+                break
+            ahead.append((offset, line))
+            offset += len(line) + 1
+            if line.strip():
+                nonblank += 1
+        if not ahead:
+            break
+        pos, line = ahead.popleft()
+        if line.strip():
+            nonblank -= 1
+        if not first:
+            part.append("\n")
+        first = False
+        q = LEADING_WS.match(line).end()
+        if q < len(line) and HEADING_FIRST_CHAR.match(line, q):
+            window = "\n".join([line] + [t for _, t in ahead])
+            if HEADING_BODY.match(window, q):
+                part.append(line[:q])
+                span = _part_span(cut, "".join(part))
+                if span:
+                    yield span
+                part, cut = [line[q:]], pos + q
+                continue
+        part.append(line)
+    span = _part_span(cut, "".join(part))
+    if span:
+        yield span
+
+def split_scenes(text: str):
+    """Разбивка на сцены: линейный построчный сегментатор (см. heading_offsets)"""
+    return [text[a:b] for a, b in scene_spans(text)]
+
+def split_scenes_regex(text: str):
+    """Прежняя разбивка через re.split(COMPREHENSIVE_SPLIT) — эталон для сверки и бенчмарка"""
+    parts = re.split(COMPREHENSIVE_SPLIT, text)
+    scenes = []
+    for p in parts:
+        p = p.strip()
+        word_count = len(p.split())
+        has_action = bool(ACTION_RE.search(p))
+        if word_count >= 5 or (word_count >= 3 and has_action):
+            scenes.append(p)
+    return scenes
+
+# ===== МНОЖЕСТВЕННЫЕ ПАТТЕРНЫ ДЛЯ ПАРСИНГА ЗАГОЛОВКОВ (по порядку приоритета) =====
+HEADER_RULES = [
+    # Паттерн 1: Стандартный с дефисом "1-2. ИНТ. ЛОКАЦИЯ - НОЧЬ"
+    ("dash", re.compile(
+        r'^\s*(?P<scene_no>\d+\s*-\s*\d+(?:\s*-\s*[A-Za-zА-ЯЁ])?)?\.?\s*'
+        r'(?P<period>\d{1,2}-[ЕE]\.?)?\s*'
+        r'(?P<place_type>ИНТ\.?|НАТ\.?|INT\.?|EXT\.?)\s+'
+        r'(?P<location>[^-–—:\n]{2,140}?)\s*[-–—]\s*'
+        r'(?P<tod>ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|DAY|NIGHT|РЕЖИМ|РАССВЕТ)(?:\s+\d+)?',
+        re.IGNORECASE
+    )),
+
+    # Паттерн 2: БЕЗ дефиса "1-2. ИНТ. ЛОКАЦИЯ НОЧЬ"
+    ("no_dash", re.compile(
+        r'^\s*(?P<scene_no>\d+\s*-\s*\d+(?:\s*-\s*[A-Za-zА-ЯЁ])?)?\.?\s*'
+        r'(?P<period>\d{1,2}-[ЕE]\.?)?\s*'
+        r'(?P<place_type>ИНТ\.?|НАТ\.?|INT\.?|EXT\.?)\s+'
+        r'(?P<location>(?:[A-ZА-ЯЁ][^\n]{0,100}?\.)?[A-ZА-ЯЁ][^\n]{1,100}?)'
+        r'\s+(?P<tod>ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|DAY|NIGHT|РЕЖИМ|РАССВЕТ)(?:\s+\d+)?\.?\s*$',
+        re.IGNORECASE | re.MULTILINE
+    )),
+
+    # Паттерн 3: Слитное "ЛЕС.ОПУШКА НОЧЬ"
+    ("fused_dot", re.compile(
+        r'^\s*(?P<scene_no>\d+\s*-\s*\d+(?:\s*-\s*[A-Za-zА-ЯЁ])?)?\.?\s*'
+        r'(?P<place_type>ИНТ\.?|НАТ\.?|INT\.?|EXT\.?)\s+'
+        r'(?P<location>[A-ZА-ЯЁ][^\s]{2,40}\.[A-ZА-ЯЁ][^\s]{2,80}|[A-ZА-ЯЁ][^\n]{2,100}?)'
+        r'\s+(?P<tod>ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|РЕЖИМ|РАССВЕТ)(?:\s+\d+)?',
+        re.IGNORECASE
+    )),
+
+    # Паттерн 4: "номер.тип ЛОКАЦИЯ - ВРЕМЯ" (старый формат)
+    ("num_dash", re.compile(
+        r'^\s*(?P<scene_no>\d+)\.\s*'
+        r'(?P<place_type>ИНТ\.?|НАТ\.?|INT\.?|EXT\.?)?\s*'
+        r'(?P<location>[^-–—\n]{2,120}?)\s*[-–—]\s*'
+        r'(?P<tod>ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|DAY|NIGHT|РЕЖИМ)\b',
+        re.IGNORECASE
+    )),
+
+    # Паттерн 5: "номер. тип. ЛОКАЦИЯ. ВРЕМЯ" (с точками) — КЛЮЧЕВОЙ!
+    ("num_dots", re.compile(
+        r'^\s*(?P<scene_no>\d+)\.\s*'
+        r'(?P<place_type>ИНТ\.|НАТ\.|INT\.|EXT\.)\s*'   # \s* вместо \s+
+        r'(?P<location>[^\n]{2,200}?)\.\s*'
+        r'(?P<tod>ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|DAY|NIGHT|РЕЖИМ|РАССВЕТ)\b',
+        re.IGNORECASE
+    )),
+
+    ("num_dots_short", re.compile(
+        r'^\s*(?P<scene_no>\d+)\.\s*'
+        r'(?P<place_type>ИНТ\.|НАТ\.|INT\.|EXT\.)\s*'
+        r'(?P<location>[^\n]{2,150}?)\.\s*'
+        r'(?P<tod>ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|DAY|NIGHT|РЕЖИМ|РАССВЕТ)\b',
+        re.IGNORECASE
+    )),
+
+    # Паттерн 6: Только ЛОКАЦИЯ - ВРЕМЯ (без номера/типа)
+    ("loc_dash", re.compile(
+        r'^\s*(?P<location>[A-ZА-ЯЁ][^\n-–—]{2,100}?)\s*[-–—]\s*'
+        r'(?P<tod>ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|DAY|NIGHT|РЕЖИМ)\b',
+        re.IGNORECASE
+    )),
+
+    # Паттерн 7: "номер. ИНТ. ЛОКАЦИЯ. ПОДЛОКАЦИЯ" (без времени, сцены 12, 13)
+    ("sublocation", re.compile(
+        r'^\s*(?P<scene_no>\d+(?:\s*-\s*\d+(?:\s*-\s*[A-Za-zА-ЯЁ])?)?)?\.?\s*'
+        r'(?P<place_type>ИНТ\.?|НАТ\.?|INT\.?|EXT\.?)\s*'
+        r'(?P<location>[A-ZА-ЯЁ][^\n.]{2,100}?\.[A-ZА-ЯЁ][^\n]{2,100}?)'
+        r'(?:\s*/\s*[A-ZА-ЯЁ][^\n]{2,100}?)?',
+        re.IGNORECASE | re.MULTILINE
+    )),
+
+    # Паттерн 8: "номер. НАТ.У ЦИРКА. ДЕНЬ" (точки + время, сцены 3, 4)
+    ("num_dot_loc", re.compile(
+        r'^\s*(?P<scene_no>\d+)\.\s*'
+        r'(?P<place_type>ИНТ\.?|НАТ\.?|INT\.?|EXT\.?)\s*'
+        r'(?P<location>[A-ZА-ЯЁ][^\n.]{2,60}?\.)'
+        r'[A-ZА-ЯЁ][^\n]{2,80}?'
+        r'(?:\s*\.\s*(?P<tod>ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|DAY|NIGHT|РЕЖИМ|РАССВЕТ)\b)?',
+        re.IGNORECASE
+    )),
+]
+HEADER_PATTERNS = [p for _, p in HEADER_RULES]
+
+# ===== Нормализация =====
+PLACE_TYPE_MAP = {
+    "инт": "ИНТ.", "int": "INT.", "і": "ИНТ.", "ін": "ИНТ.",
+    "нат": "НАТ.", "ext": "EXT.", "nat": "НАТ.",
+    "и/н": "И/Н", "i/e": "I/E"
+}
+
+TOD_MAP = {
+    "день": "ДЕНЬ", "day": "ДЕНЬ",
+    "ночь": "НОЧЬ", "night": "НОЧЬ",
+    "вечер": "ВЕЧЕР", "evening": "ВЕЧЕР",
+    "утро": "УТРО", "morning": "УТРО",
+    "режим": "РЕЖИМ",
+    "рассвет": "РАССВЕТ",
+    "закат": "ЗАКАТ",
+    "сумерки": "СУМЕРКИ"
+}
+
+def normalize_place_type(raw: str) -> str:
+    """Нормализация типа места с учётом опечаток"""
+    if not raw:
+        return ""
+    low = raw.lower().replace(".", "").strip()
+    return PLACE_TYPE_MAP.get(low, raw.upper())
+
+def normalize_tod(raw: str) -> str:
+    """Нормализация времени суток"""
+    if not raw:
+        return ""
+    low = raw.lower().strip()
+    return TOD_MAP.get(low, raw.upper())
+
+# ===== Эвристический fallback =====
+HEUR_NUM_RE = re.compile(r'\b(\d+\s*-\s*\d+(?:\s*-\s*[A-Za-zА-ЯЁ])?|\d+)\b')
+HEUR_TYPE_RE = re.compile(r'\b(ИНТ\.?|НАТ\.?|INT\.?|EXT\.?|[иінат]+\.?)\b', re.IGNORECASE)
+# Расширенный список времени суток (как в разметке обучения), с границей слова справа
+HEUR_TOD_RE = re.compile(
+    r'\b(ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|DAY|NIGHT|РЕЖИМ|РАССВЕТ|ЗАКАТ|СУМЕРКИ)\b(?:\s+\d+)?',
+    re.IGNORECASE
+)
+
+# Паттерны локации зависят только от пары (тип, время) — компилируем один раз на пару
+_LOC_RE_CACHE = {}
+
+def _loc_re(place_type: str, tod: str):
+    key = (place_type, tod)
+    rx = _LOC_RE_CACHE.get(key)
+    if rx is None:
+        if place_type:
+            src = rf'{re.escape(place_type)}\s*(.+?)\s*[-–—:]\s*{re.escape(tod)}'
+        else:
+            src = r'(.+?)\s*[-–—:]\s*' + re.escape(tod)
+        rx = _LOC_RE_CACHE[key] = re.compile(src, re.IGNORECASE)
+    return rx
+
+def heuristic_parse(line: str):
+    """Эвристический парсер для нестандартных заголовков"""
+    result = {"scene_no": "", "period": "", "place_type": "", "location": "", "tod": ""}
+
+    # Номер сцены
+    num_match = HEUR_NUM_RE.search(line)
+    if num_match:
+        result["scene_no"] = num_match.group(1).strip()
+
+    # Тип места
+    type_match = HEUR_TYPE_RE.search(line)
+    if type_match:
+        result["place_type"] = normalize_place_type(type_match.group(1))
+
+    # Время суток
+    tod_match = HEUR_TOD_RE.search(line)
+    if tod_match:
+        result["tod"] = normalize_tod(tod_match.group(1))
+        # Локация — текст между типом и временем (или всё до разделителя, если типа нет)
+        loc_match = _loc_re(result["place_type"], result["tod"]).search(line)
+        if loc_match:
+            result["location"] = loc_match.group(1).strip().strip('.')
+
+    return result
+
+# ===== Диспетчеризация по первому токену строки =====
+# Все HEADER_RULES якорны (^\s*...), поэтому форма начала строки заранее отсекает
+# правила, которые не могут совпасть; порядок внутри группы — как в HEADER_RULES.
+HEADER_SHAPES = {
+    "range":  ["dash", "no_dash", "fused_dot", "sublocation"],       # "1-2", "1-2-А", "3-Е"
+    "dotted": ["num_dash", "num_dots", "num_dots_short", "sublocation", "num_dot_loc"],  # "12."
+    "bare":   ["sublocation"],                                         # "5 ИНТ. ..."
+    "dot":    ["dash", "no_dash", "fused_dot", "sublocation"],         # ". ИНТ ..."
+    "place":  ["dash", "no_dash", "fused_dot", "loc_dash", "sublocation"],  # ИНТ/НАТ/INT/EXT
+    "word":   ["loc_dash"],                                            # "КУХНЯ - ДЕНЬ"
+}
+_RULES_BY_NAME = dict(HEADER_RULES)
+HEADER_DISPATCH = {shape: [(name, _RULES_BY_NAME[name]) for name in names]
+                   for shape, names in HEADER_SHAPES.items()}
+
+# dash/num_dash/loc_dash требуют "[-–—] ВРЕМЯ" — без такой подстроки их можно не пробовать
+DASH_TOD_RULES = {"dash", "num_dash", "loc_dash"}
+DASH_TOD_RE = re.compile(r'[-–—]\s*(?:ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|DAY|NIGHT|РЕЖИМ|РАССВЕТ)', re.IGNORECASE)
+
+FIRST_LINE_BREAK = re.compile('[\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]')  # те же разрывы, что у splitlines
+LEAD_NUM_RE = re.compile(r'\s*(\d+)(\s*-|\.)?')
+PLACE_START_RE = re.compile(r'[ИНIE]', re.IGNORECASE)
+
+def header_shape(line: str) -> str:
+    """Форма начала строки заголовка: range/dotted/bare/dot/place/word или "" (ни одно правило не подходит)."""
+    m = LEAD_NUM_RE.match(line)
+    if m:
+        if m.group(2) is None:
+            return "bare"
+        return "dotted" if m.group(2) == "." else "range"
+    q = LEADING_WS.match(line).end()
+    if q >= len(line):
+        return ""
+    c = line[q]
+    if c == ".":
+        return "dot"
+    if PLACE_START_RE.match(c):
+        return "place"
+    return "word" if c.isalpha() else ""
+
+def first_line_of(scene_text: str) -> str:
+    m = FIRST_LINE_BREAK.search(scene_text)
+    return scene_text[:m.start()] if m else scene_text
+
+def parse_header_rule(scene_text: str):
+    """(meta, rule): разбор первой строки + имя сработавшего правила ("heuristic" — fallback)."""
+    first_line = first_line_of(scene_text)
+
+    # Только правила, совместимые с формой начала строки, по порядку HEADER_RULES
+    has_dash_tod = None
+    for name, pattern in HEADER_DISPATCH.get(header_shape(first_line), ()):
+        if name in DASH_TOD_RULES:
+            if has_dash_tod is None:
+                has_dash_tod = DASH_TOD_RE.search(first_line) is not None
+            if not has_dash_tod:
+                continue
+        m = pattern.match(first_line)
+        if m:
+            g = m.groupdict()
+            return {
+                "scene_no": (g.get("scene_no") or "").strip(),
+                "period": (g.get("period") or "").strip(),
+                "place_type": normalize_place_type(g.get("place_type") or ""),
+                "location": (g.get("location") or "").strip().strip('. '),
+                "tod": normalize_tod(g.get("tod") or "")
+            }, name
+
+    # Fallback: эвристический парсинг
+    return heuristic_parse(first_line), "heuristic"
+
+def parse_header(scene_text: str):
+    """Fuzzy-парсинг с fallback через несколько паттернов"""
+    return parse_header_rule(scene_text)[0]
@@ -0,0 +1,235 @@
+# scene_parser.py — лёгкий слой разбора сценария: чтение файлов + реэкспорт грамматики из scene_grammar.
+# Без моделей, словарей и pickle: импорт не имеет побочных эффектов.
+import re
+from collections import namedtuple
+
+# Грамматика заголовков (разбивка, паттерны, нормализация) — единая в scene_grammar
+from scene_grammar import (
+    COMPREHENSIVE_SPLIT, HEADING_BODY, HEADER_RULES, HEADER_PATTERNS,
+    heading_offsets, scene_spans, iter_scene_spans, split_scenes, split_scenes_regex,
+    normalize_place_type, normalize_tod, heuristic_parse, parse_header, parse_header_rule
+)
+
+# ===== IO helpers =====
+CAST_ONLY_RE = re.compile(r'\s*\[.*?\]\s*')          # строка целиком — ремарка-каст (fullmatch)
+UNDERLINE_MARK_RE = re.compile(r'\{\.underline\}', re.IGNORECASE)
+BOLD_MARK_RE = re.compile(r'\*\*(.*?)\*\*')
+LINE_BACKSLASH_RE = re.compile(r'\\\s*$')
+DOUBLE_BACKSLASH_EOL_RE = re.compile(r'[ \t]*\\\\\s*$')
+
+# Строка итогового текста и её происхождение: offset в тексте read_script,
+# номер страницы PDF (None для DOCX/TXT) и номер абзаца DOCX / строки страницы PDF / строки TXT (с 1)
+Line = namedtuple("Line", "text offset page para")
+
+def _is_blank(s: str) -> bool:
+    return not s.strip()
+
+def _split_chunks(chunks):
+    r"""
+    (кусок, page, para) подряд -> (строка, page, para) ровно как "".join(куски).split("\n").
+    Происхождение строки — кусок, в котором лежит её первый символ
+    (строка, начатая "\n" в конце куска, относится к следующему куску).
+    """
+    buf, meta = [], (None, None)
+    for text, page, para in chunks:
+        if not buf:
+            meta = (page, para)
+        parts = text.split("\n")
+        buf.append(parts[0])
+        for p in parts[1:]:
+            yield ("".join(buf),) + meta
+            buf, meta = ([p] if p else []), (page, para)
+    yield ("".join(buf),) + meta
+
+def _joined_chunks(paragraphs):
+    # "\n".join(абзацев) кусками: разделитель отдельно, чтобы пустой абзац сохранил свой номер
+    for i, t in enumerate(paragraphs):
+        if i:
+            yield "\n", None, i
+        yield t, None, i + 1
+
+# ===== Потоковые источники =====
+def iter_pdf_chunks(path):
+    r"""Страницы PDF по порядку: (текст + "\n", page, 1); извлечение — pdf_pages (пул процессов + кэш)."""
+    from pdf_pages import iter_pdf_pages
+    for pg in iter_pdf_pages(path):
+        yield pg.text + "\n", pg.no, 1
+
+def _pdf_lines(path):
+    # Номер строки внутри страницы вместо номера абзаца
+    page, k = None, 0
+    for text, pg, _ in _split_chunks(iter_pdf_chunks(path)):
+        k = k + 1 if pg == page else 1
+        page = pg
+        yield text, pg, k
+
+def clean_docx_paragraph(t: str) -> str:
+    r"""Разметка внутри абзаца: {.underline}, {.smallcaps}, **жирный**, '\' в конце."""
+    t = UNDERLINE_MARK_RE.sub('', t).replace('{.smallcaps}', '')
+    t = BOLD_MARK_RE.sub(r'\1', t)
+    return LINE_BACKSLASH_RE.sub('', t)
+
+# DOCX читается напрямую: word/document.xml потоком из zip через iterparse, без объектной модели python-docx.
+# Текст абзаца — как Paragraph.text в python-docx 1.x: прямые w:r и w:r внутри w:hyperlink,
+# в прогоне — w:t, w:tab/w:ptab -> "\t", w:br (перенос строки) и w:cr -> "\n", w:noBreakHyphen -> "-".
+# Абзацы — только прямые дети w:body (как doc.paragraphs: без таблиц и w:sdt).
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+W_BODY, W_P, W_R, W_HYPERLINK = W_NS + "body", W_NS + "p", W_NS + "r", W_NS + "hyperlink"
+W_BR, W_TYPE = W_NS + "br", W_NS + "type"
+RUN_TEXT = {W_NS + "tab": "\t", W_NS + "ptab": "\t", W_NS + "cr": "\n", W_NS + "noBreakHyphen": "-"}
+W_T = W_NS + "t"
+
+def _run_text(r, out):
+    for e in r:
+        tag = e.tag
+        if tag == W_T:
+            out.append(e.text or "")
+        elif tag == W_BR:
+            # разрыв страницы/колонки текста не даёт
+            if e.get(W_TYPE, "textWrapping") == "textWrapping":
+                out.append("\n")
+        elif tag in RUN_TEXT:
+            out.append(RUN_TEXT[tag])
+
+def docx_paragraph_text(p) -> str:
+    """Текст элемента w:p — то же, что python-docx Paragraph.text."""
+    out = []
+    for child in p:
+        if child.tag == W_R:
+            _run_text(child, out)
+        elif child.tag == W_HYPERLINK:
+            for r in child:
+                if r.tag == W_R:
+                    _run_text(r, out)
+    return "".join(out)
+
+def iter_docx_texts(path):
+    """Сырые тексты абзацев DOCX по одному; разобранные абзацы сразу выбрасываются из дерева."""
+    import zipfile
+    from xml.etree.ElementTree import iterparse
+    with zipfile.ZipFile(path) as z, z.open("word/document.xml") as f:
+        depth, body = 0, None
+        for event, el in iterparse(f, events=("start", "end")):
+            if event == "start":
+                depth += 1
+                if depth == 2 and el.tag == W_BODY:
+                    body = el
+                continue
+            depth -= 1
+            if depth == 2 and body is not None:
+                # прямой ребёнок w:body (абзац, таблица, sectPr...) разобран целиком
+                if el.tag == W_P:
+                    yield docx_paragraph_text(el)
+                body.remove(el)
+
+def iter_docx_paragraphs(path):
+    """Абзацы DOCX по одному, уже очищенные clean_docx_paragraph."""
+    for t in iter_docx_texts(path):
+        yield clean_docx_paragraph(t)
+
+def read_docx_raw(path):
+    r"""Абзацы через "\n" без очистки — для вспомогательных скриптов, которым нужна исходная разметка."""
+    return "\n".join(iter_docx_texts(path))
+
+def docx_lines(paragraphs):
+    r"""
+    Очищенные абзацы -> (строка, None, para) итогового текста read_docx.
+    Построчно то же, что прежние замены по всему тексту: '^\s*\[.*?\]\s*$' (MULTILINE),
+    '[ \t]+\n', '\[' / '\]' и DOUBLE_BACKSLASH_EOL_RE.
+    Заглядывает вперёд только на серию пустых строк.
+    """
+    raw = _split_chunks(_joined_chunks(paragraphs))
+    return _cut_double_backslash(_unescape_lines(_drop_cast_lines(raw)))
+
+def _drop_cast_lines(lines):
+    # ^\s*[...]\s*$ съедает пустые строки перед кастом (после последней непустой)
+    # и все пустые после него: такая группа превращается в одну пустую строку.
+    # Следующий каст продолжает группу, только если перед ним строка "" (^ совпадает в её начале)
+    blanks = []
+    group = None      # происхождение открытой группы каста
+    last = None       # текст последней строки открытой группы
+    for ln in lines:
+        t = ln[0]
+        if _is_blank(t):
+            if group is None:
+                blanks.append(ln)
+            last = t
+            continue
+        if CAST_ONLY_RE.fullmatch(t):
+            if group is None or last != "":
+                if group is not None:
+                    yield ("",) + group
+                group = (blanks[0] if blanks else ln)[1:]
+                blanks = []
+            last = t
+            continue
+        if group is not None:
+            yield ("",) + group
+            group = None
+        yield from blanks
+        blanks = []
+        yield ln
+    if group is not None:
+        yield ("",) + group
+    yield from blanks
+
+def _unescape_lines(lines):
+    # '[ \t]+\n' -> '\n' трогает все строки, кроме последней; затем '\[' -> '[', '\]' -> ']'
+    prev = None
+    for ln in lines:
+        if prev is not None:
+            yield (prev[0].rstrip(" \t").replace("\\[", "[").replace("\\]", "]"),) + prev[1:]
+        prev = ln
+    if prev is not None:
+        yield (prev[0].replace("\\[", "[").replace("\\]", "]"),) + prev[1:]
+
+def _cut_double_backslash(lines):
+    # '[ \t]*\\\\\s*$' обрезает строку, и \s* уносит следующие пустые строки;
+    # если до конца текста одни пробелы — обрезанная строка становится последней
+    cut = False
+    for ln in lines:
+        if cut and _is_blank(ln[0]):
+            continue
+        cut = False
+        m = DOUBLE_BACKSLASH_EOL_RE.search(ln[0])
+        if m:
+            ln = (ln[0][:m.start()],) + ln[1:]
+            cut = True
+        yield ln
+
+def _text_lines(path):
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        yield from _split_chunks((s, None, no) for no, s in enumerate(f, 1))
+
+def iter_lines(path):
+    r"""
+    Потоковое чтение сценария: Line(text, offset, page, para) по одной строке.
+    "\n".join(l.text for l in iter_lines(p)) == read_script(p); в памяти — страница/абзац
+    и серия пустых строк впереди (DOCX — потоковый разбор word/document.xml через iterparse).
+    """
+    low = path.lower()
+    if low.endswith(".pdf"):
+        src = _pdf_lines(path)
+    elif low.endswith(".docx"):
+        src = docx_lines(iter_docx_paragraphs(path))
+    else:
+        src = _text_lines(path)
+    offset = 0
+    for text, page, para in src:
+        yield Line(text, offset, page, para)
+        offset += len(text) + 1
+
+def iter_scenes(path):
+    """Сцены по мере чтения файла — то же, что split_scenes(read_script(path))."""
+    for _, _, body in iter_scene_spans(l.text for l in iter_lines(path)):
+        yield body
+
+def read_pdf(path):
+    # Склейка одним join вместо txt += ... на каждой странице
+    return "\n".join(t for t, _, _ in _pdf_lines(path))
+
+def read_docx(path):
+    return "\n".join(t for t, _, _ in docx_lines(iter_docx_paragraphs(path)))
+
+def read_script(path):
+    return "\n".join(l.text for l in iter_lines(path))
@@ -0,0 +1,184 @@
+# scoring_server.py — долгоживущий воркер: энкодер, HEADS и EP_HEADS держатся прогретыми
+#
+# Пример:
+#   python scoring_server.py --port 8765
+#   python scoring_server.py --unix /tmp/scoring.sock
+#   curl -s localhost:8765/scene -d '{"text": "ИНТ. КВАРТИРА - НОЧЬ ..."}'
+#   curl -s localhost:8765/script -d '{"path": "fisher2.docx"}'
+#
+# POST /scene  {"text"}          -> тот же JSON, что cli_scene_check.main
+# POST /script {"text" | "path"} -> тот же JSON, что final_report.json из analyze_script
+# GET  /health                   -> счётчики кэша/энкодера/коалесцера
+
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+
+from models import get_tok_mdl, get_fused_heads, get_fused_ep_heads
+from embeddings import cache_stats, ENCODE_STATS
+from scene_parser import read_script
+from test import analyze_scenes, analyze_text
+from cli_scene_check import check_scene
+
+# Модель одна на процесс: прогоны энкодера (батчи сцен и целые скрипты) идут по очереди
+MODEL_LOCK = threading.Lock()
+
+# ===== Коалесцер одиночных сцен =====
+class SceneBatcher:
+    """
+    Одиночные запросы /scene копятся до max_batch или до истечения окна wait_ms
+    и уходят в один вызов analyze_scenes (общий батч энкодера).
+    """
+
+    def __init__(self, max_batch: int = 32, wait_ms: float = 10.0):
+        self.max_batch = max_batch
+        self.wait = wait_ms / 1000.0
+        self.q = queue.Queue()
+        self.stats = {"requests": 0, "batches": 0, "max_batch_seen": 0}
+        threading.Thread(target=self._loop, name="scene-batcher", daemon=True).start()
+
+    def submit(self, text: str) -> Future:
+        fut = Future()
+        self.q.put((text, fut))
+        return fut
+
+    def _collect(self):
+        items = [self.q.get()]
+        deadline = time.monotonic() + self.wait
+        while len(items) < self.max_batch:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                break
+            try:
+                items.append(self.q.get(timeout=left))
+            except queue.Empty:
+                break
+        return items
+
+    def _loop(self):
+        while True:
+            items = self._collect()
+            texts = [t for t, _ in items]
+            try:
+                with MODEL_LOCK:
+                    per_class_all = analyze_scenes(texts)
+                for (text, fut), per_class in zip(items, per_class_all):
+                    fut.set_result(check_scene(text, per_class))
+            except Exception as e:
+                for _, fut in items:
+                    if not fut.done():
+                        fut.set_exception(e)
+            self.stats["requests"] += len(items)
+            self.stats["batches"] += 1
+            self.stats["max_batch_seen"] = max(self.stats["max_batch_seen"], len(items))
+
+BATCHER = None
+
+# ===== HTTP =====
+class ScoringHandler(BaseHTTPRequestHandler):
+    server_version = "ScriptRating/1.0"
+
+    def address_string(self):
+        # для Unix-сокета client_address пустой
+        return self.client_address[0] if self.client_address else "unix"
+
+    def _send(self, code: int, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        n = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(n) if n else b"{}"
+        return json.loads(raw.decode("utf-8") or "{}")
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send(200, {"status": "ok", "cache": cache_stats(), "encode": ENCODE_STATS,
+                             "batcher": BATCHER.stats})
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        try:
+            req = self._read_json()
+        except ValueError as e:
+            self._send(400, {"error": f"bad json: {e}"})
+            return
+        try:
+            if self.path == "/scene":
+                text = req.get("text") or ""
+                if not text.strip():
+                    self._send(400, {"error": "empty text"})
+                    return
+                self._send(200, BATCHER.submit(text).result())
+            elif self.path == "/script":
+                if req.get("text"):
+                    text = req["text"]
+                elif req.get("path") and os.path.exists(req["path"]):
+                    text = read_script(req["path"])
+                else:
+                    self._send(400, {"error": "need 'text' or existing 'path'"})
+                    return
+                with MODEL_LOCK:
+                    payload = analyze_text(text, verbose=False)
+                self._send(200, payload)
+            else:
+                self._send(404, {"error": "not found"})
+        except Exception as e:
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+def warm_up():
+    """Загружаем всё тяжёлое до первого запроса."""
+    t0 = time.perf_counter()
+    get_tok_mdl()
+    get_fused_heads()
+    get_fused_ep_heads()
+    with MODEL_LOCK:
+        analyze_scenes(["ИНТ. КОМНАТА - ДЕНЬ. Он входит и садится за стол."])
+    print(f"Модели прогреты за {time.perf_counter() - t0:.1f} s", file=sys.stderr)
+
+def main(argv=None):
+    global BATCHER
+    ap = argparse.ArgumentParser(description="Сервер оценки сцен/сценариев с прогретыми моделями")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--unix", help="путь к Unix-сокету вместо TCP")
+    ap.add_argument("--max-batch", type=int, default=32)
+    ap.add_argument("--wait-ms", type=float, default=10.0, help="окно коалесцирования одиночных сцен")
+    args = ap.parse_args(argv)
+
+    BATCHER = SceneBatcher(max_batch=args.max_batch, wait_ms=args.wait_ms)
+    warm_up()
+
+    if args.unix:
+        if os.path.exists(args.unix):
+            os.remove(args.unix)
+        srv = ThreadingUnixHTTPServer(args.unix, ScoringHandler)
+        where = args.unix
+    else:
+        srv = ThreadingHTTPServer((args.host, args.port), ScoringHandler)
+        where = f"http://{args.host}:{args.port}"
+    print(f"Слушаю {where}", file=sys.stderr)
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -2,280 +2,23 @@
 import os
 import re
 import json
-import pickle
+import difflib
+import hashlib
 import numpy as np
-import torch
-import pdfplumber
-from docx import Document
-from transformers import AutoTokenizer, AutoModel
 from normalize import normalize_headings
-from embeddings import scene_vector
-
-# ===== УЛУЧШЕННЫЙ REGEX ДЛЯ РАЗБИВКИ НА СЦЕНЫ =====
-COMPREHENSIVE_SPLIT = re.compile(
-    r'(?=^\s*'
-    r'(?:'
-    # БЛОК 1: Стандартный формат (с дефисом)
-    r'(?:\d+\s*-\s*\d+(?:\s*-\s*[A-Za-zА-ЯЁ])?)?\.?\s*'
-    r'(?:\d{1,2}-[ЕE]\.?)?\s*'
-    r'(?:ИНТ\.?|НАТ\.?|INT\.?|EXT\.?|И/Н|I/E)\s+'
-    r'[^\n]{2,140}?'
-    r'\s*[-–—]\s*'
-    r'(?:ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|DAY|NIGHT|EVENING|MORNING|РЕЖИМ|РАССВЕТ)(?:\s+\d+)?'
-    r'|'
-    # БЛОК 2: БЕЗ дефиса (точка или пробел перед временем)
-    r'(?:\d+\s*-\s*\d+(?:\s*-\s*[A-Za-zА-ЯЁ])?)?\.?\s*'
-    r'(?:ИНТ\.?|НАТ\.?|INT\.?|EXT\.?)\s*'  # было \s+, стало \s*
-    r'[^\n]{2,200}?'
-    r'\.?\s+'
-    r'(?:ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|DAY|NIGHT|РЕЖИМ|РАССВЕТ)(?:\s+\d+)?'
-    r'\.?\s*$'
-    r'|'
-    # БЛОК 3: Слитное написание "ЛЕС.ОПУШКА НОЧЬ"
-    r'(?:\d+\s*-\s*\d+(?:\s*-\s*[A-Za-zА-ЯЁ])?)?\.?\s*'
-    r'(?:ИНТ\.?|НАТ\.?|INT\.?|EXT\.?)\s*'  # было \s+, стало \s*
-    r'[A-ZА-ЯЁ]+\.[A-ZА-ЯЁ][^\n]{1,100}?'
-    r'\s+(?:ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|РЕЖИМ|РАССВЕТ)(?:\s+\d+)?'
-    r'|'
-    # БЛОК 4: Номер.тип ЛОКАЦИЯ - ВРЕМЯ
-    r'\d+\.\s*(?:ИНТ\.?|НАТ\.?|INT\.?|EXT\.?)\s+[^\n]{2,120}\s*[-–—]\s*'
-    r'(?:ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|РЕЖИМ|РАССВЕТ)(?:\s+\d+)?'
-    r'|'
-    # БЛОК 5: Служебные маркеры
-    r'(?:СЦЕНА|СЕРИЯ|ТИТРЫ)\s*\d*'
-    r'|'
-    # БЛОК 6: Формат "номер. тип. ЛОКАЦИЯ. ВРЕМЯ" (с точками вместо дефисов)
-    r'\d+\.\s*(?:ИНТ\.?|НАТ\.?|INT\.?|EXT\.?)\s*'  # было \s+, стало \s*
-    r'[^\n]{2,200}?\.\s*'
-    r'(?:ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|DAY|NIGHT|РЕЖИМ|РАССВЕТ)\b'
-    r'|'
-    # БЛОК 7: Формат "номер. тип. ЛОКАЦИЯ. ПОДЛОКАЦИЯ" (без времени, для сцен 12, 13)
-    r'(?:\d+\s*-\s*\d+(?:\s*-\s*[A-Za-zА-ЯЁ])?)?\.?\s*'
-    r'(?:ИНТ\.?|НАТ\.?|INT\.?|EXT\.?)\s*'
-    r'[A-ZА-ЯЁ][^\n.]{2,100}?\.[A-ZА-ЯЁ][^\n]{2,100}?'
-    r'(?:\s*/\s*[A-ZА-ЯЁ][^\n]{2,100}?)?'
-    r'|'
-    # БЛОК 8: Слитное без пробелов "номер. тип.ЛОКАЦИЯ" или с / (для 10, 15)
-    r'(?:\d+\s*-\s*\d+(?:\s*-\s*[A-Za-zА-ЯЁ])?)?\.?\s*'
-    r'(?:ИНТ\.?|НАТ\.?|INT\.?|EXT\.?)\s*'
-    r'[A-ZА-ЯЁ][^\n\s]{4,120}?(?:\s*/\s*[A-ZА-ЯЁ][^\n]{2,100}?)?'
-    r'(?=\s*(?:ДЕНЬ|НОЧЬ|\n))'
-    r'|'
-    # БЛОК 9: "номер. НАТ.У ЦИРКА. ДЕНЬ" (точки вместо дефисов, для 3, 4, 7)
-    r'\d+\.\s*(?:ИНТ\.?|НАТ\.?|INT\.?|EXT\.?)\s*'
-    r'[A-ZА-ЯЁ][^\n.]{2,80}?\.[A-ZА-ЯЁ][^\n]{2,80}?'
-    r'(?:\s*\.\s*(?:ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|DAY|NIGHT)\b)?'
-    r')'
-    r')',
-    re.IGNORECASE | re.MULTILINE
+from embeddings import ScriptTokens, encode_scenes, aggregate_windows, cache_stats, window_stats, window_plan_tag
+from models import encoder_tag, get_fused_heads, get_fused_ep_heads
+from fused_heads import scene_proba
+from keyword_matcher import KeywordMatcher
+
+# Чтение, разбивка и заголовки живут в лёгком scene_parser (реэкспорт для старых импортов)
+from scene_parser import (
+    COMPREHENSIVE_SPLIT, HEADER_PATTERNS, scene_spans, split_scenes, normalize_place_type, normalize_tod,
+    heuristic_parse, parse_header, read_pdf, read_docx, read_script
 )
 
-
-def split_scenes(text: str):
-    """Разбивка с многопаттернным regex"""
-    parts = re.split(COMPREHENSIVE_SPLIT, text)
-    scenes = []
-    for p in parts:
-        p = p.strip()
-        word_count = len(p.split())
-        has_action = bool(re.search(
-            r'\b(входит|выходит|говорит|смотрит|берёт|идёт|садится|стоит|открывает|закрывает)\b',
-            p, re.IGNORECASE
-        ))
-        if word_count >= 5 or (word_count >= 3 and has_action):
-            scenes.append(p)
-    return scenes
-
-# ===== МНОЖЕСТВЕННЫЕ ПАТТЕРНЫ ДЛЯ ПАРСИНГА ЗАГОЛОВКОВ =====
-HEADER_PATTERNS = [
-    # Паттерн 1: Стандартный с дефисом "1-2. ИНТ. ЛОКАЦИЯ - НОЧЬ"
-    re.compile(
-        r'^\s*(?P<scene_no>\d+\s*-\s*\d+(?:\s*-\s*[A-Za-zА-ЯЁ])?)?\.?\s*'
-        r'(?P<period>\d{1,2}-[ЕE]\.?)?\s*'
-        r'(?P<place_type>ИНТ\.?|НАТ\.?|INT\.?|EXT\.?)\s+'
-        r'(?P<location>[^-–—:\n]{2,140}?)\s*[-–—]\s*'
-        r'(?P<tod>ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|DAY|NIGHT|РЕЖИМ|РАССВЕТ)(?:\s+\d+)?',
-        re.IGNORECASE
-    ),
-    
-    # Паттерн 2: БЕЗ дефиса "1-2. ИНТ. ЛОКАЦИЯ НОЧЬ"
-    re.compile(
-        r'^\s*(?P<scene_no>\d+\s*-\s*\d+(?:\s*-\s*[A-Za-zА-ЯЁ])?)?\.?\s*'
-        r'(?P<period>\d{1,2}-[ЕE]\.?)?\s*'
-        r'(?P<place_type>ИНТ\.?|НАТ\.?|INT\.?|EXT\.?)\s+'
-        r'(?P<location>(?:[A-ZА-ЯЁ][^\n]{0,100}?\.)?[A-ZА-ЯЁ][^\n]{1,100}?)'
-        r'\s+(?P<tod>ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|DAY|NIGHT|РЕЖИМ|РАССВЕТ)(?:\s+\d+)?\.?\s*$',
-        re.IGNORECASE | re.MULTILINE
-    ),
-    
-    # Паттерн 3: Слитное "ЛЕС.ОПУШКА НОЧЬ"
-    re.compile(
-        r'^\s*(?P<scene_no>\d+\s*-\s*\d+(?:\s*-\s*[A-Za-zА-ЯЁ])?)?\.?\s*'
-        r'(?P<place_type>ИНТ\.?|НАТ\.?|INT\.?|EXT\.?)\s+'
-        r'(?P<location>[A-ZА-ЯЁ][^\s]{2,40}\.[A-ZА-ЯЁ][^\s]{2,80}|[A-ZА-ЯЁ][^\n]{2,100}?)'
-        r'\s+(?P<tod>ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|РЕЖИМ|РАССВЕТ)(?:\s+\d+)?',
-        re.IGNORECASE
-    ),
-    
-    # Паттерн 4: "номер.тип ЛОКАЦИЯ - ВРЕМЯ" (старый формат)
-    re.compile(
-        r'^\s*(?P<scene_no>\d+)\.\s*'
-        r'(?P<place_type>ИНТ\.?|НАТ\.?|INT\.?|EXT\.?)?\s*'
-        r'(?P<location>[^-–—\n]{2,120}?)\s*[-–—]\s*'
-        r'(?P<tod>ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|DAY|NIGHT|РЕЖИМ)\b',
-        re.IGNORECASE
-    ),
-    
-    # Паттерн 5: "номер. тип. ЛОКАЦИЯ. ВРЕМЯ" (с точками) — КЛЮЧЕВОЙ!
-    re.compile(
-        r'^\s*(?P<scene_no>\d+)\.\s*'
-        r'(?P<place_type>ИНТ\.|НАТ\.|INT\.|EXT\.)\s*'   # \s* вместо \s+
-        r'(?P<location>[^\n]{2,200}?)\.\s*'
-        r'(?P<tod>ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|DAY|NIGHT|РЕЖИМ|РАССВЕТ)\b',
-        re.IGNORECASE
-    ),
-    
-    re.compile(
-        r'^\s*(?P<scene_no>\d+)\.\s*'
-        r'(?P<place_type>ИНТ\.|НАТ\.|INT\.|EXT\.)\s*'
-        r'(?P<location>[^\n]{2,150}?)\.\s*'
-        r'(?P<tod>ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|DAY|NIGHT|РЕЖИМ|РАССВЕТ)\b',
-        re.IGNORECASE
-    ),
-
-    # Паттерн 6: Только ЛОКАЦИЯ - ВРЕМЯ (без номера/типа)
-    re.compile(
-        r'^\s*(?P<location>[A-ZА-ЯЁ][^\n-–—]{2,100}?)\s*[-–—]\s*'
-        r'(?P<tod>ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|DAY|NIGHT|РЕЖИМ)\b',
-        re.IGNORECASE
-    ),
-
-    # Паттерн 7: "номер. ИНТ. ЛОКАЦИЯ. ПОДЛОКАЦИЯ" (без времени, сцены 12, 13)
-    re.compile(
-        r'^\s*(?P<scene_no>\d+(?:\s*-\s*\d+(?:\s*-\s*[A-Za-zА-ЯЁ])?)?)?\.?\s*'
-        r'(?P<place_type>ИНТ\.?|НАТ\.?|INT\.?|EXT\.?)\s*'
-        r'(?P<location>[A-ZА-ЯЁ][^\n.]{2,100}?\.[A-ZА-ЯЁ][^\n]{2,100}?)'
-        r'(?:\s*/\s*[A-ZА-ЯЁ][^\n]{2,100}?)?',
-        re.IGNORECASE | re.MULTILINE
-    ),
-
-    # Паттерн 8: "номер. НАТ.У ЦИРКА. ДЕНЬ" (точки + время, сцены 3, 4)
-    re.compile(
-        r'^\s*(?P<scene_no>\d+)\.\s*'
-        r'(?P<place_type>ИНТ\.?|НАТ\.?|INT\.?|EXT\.?)\s*'
-        r'(?P<location>[A-ZА-ЯЁ][^\n.]{2,60}?\.)'
-        r'[A-ZА-ЯЁ][^\n]{2,80}?'
-        r'(?:\s*\.\s*(?P<tod>ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|DAY|NIGHT|РЕЖИМ|РАССВЕТ)\b)?',
-        re.IGNORECASE
-    ),
-]
-
-def normalize_place_type(raw: str) -> str:
-    if not raw:
-        return ""
-    low = raw.lower().replace(".", "").strip()
-    mapping = {
-        "инт": "ИНТ.", "int": "INT.", "і": "ИНТ.", "ін": "ИНТ.",
-        "нат": "НАТ.", "ext": "EXT.", "nat": "НАТ.",
-        "и/н": "И/Н", "i/e": "I/E"
-    }
-    return mapping.get(low, raw.upper())
-
-def normalize_tod(raw: str) -> str:
-    if not raw:
-        return ""
-    low = raw.lower().strip()
-    mapping = {
-        "день": "ДЕНЬ", "day": "ДЕНЬ",
-        "ночь": "НОЧЬ", "night": "НОЧЬ",
-        "вечер": "ВЕЧЕР", "evening": "ВЕЧЕР",
-        "утро": "УТРО", "morning": "УТРО"
-    }
-    return mapping.get(low, raw.upper())
-
-def heuristic_parse(line: str):
-    result = {"scene_no": "", "period": "", "place_type": "", "location": "", "tod": ""}
-    
-    num_match = re.search(r'\b(\d+\s*-\s*\d+(?:\s*-\s*[A-Za-zА-ЯЁ])?|\d+)\b', line)
-    if num_match:
-        result["scene_no"] = num_match.group(1).strip()
-    
-    type_match = re.search(r'\b(ИНТ\.?|НАТ\.?|INT\.?|EXT\.?|[иінат]+\.?)\b', line, re.IGNORECASE)
-    if type_match:
-        result["place_type"] = normalize_place_type(type_match.group(1))
-    
-    tod_match = re.search(r'\b(ДЕНЬ|НОЧЬ|ВЕЧЕР|УТРО|день|ночь|вечер|утро|DAY|NIGHT)\b', line, re.IGNORECASE)
-    if tod_match:
-        result["tod"] = normalize_tod(tod_match.group(1))
-        if result["place_type"] and result["tod"]:
-            loc_pattern = rf'{re.escape(result["place_type"])}\s*(.+?)\s*[-–—:]\s*{re.escape(result["tod"])}'
-            loc_match = re.search(loc_pattern, line, re.IGNORECASE)
-            if loc_match:
-                result["location"] = loc_match.group(1).strip().strip('.')
-        elif result["tod"]:
-            loc_match = re.search(r'(.+?)\s*[-–—:]\s*' + re.escape(result["tod"]), line, re.IGNORECASE)
-            if loc_match:
-                result["location"] = loc_match.group(1).strip().strip('.')
-    
-    return result
-
-def parse_header(scene_text: str):
-    lines = scene_text.splitlines()
-    first_line = lines[0] if lines else scene_text[:200]
-    
-    for pattern in HEADER_PATTERNS:
-        m = pattern.search(first_line)
-        if m:
-            return {
-                "scene_no": (m.groupdict().get("scene_no") or "").strip(),
-                "period": (m.groupdict().get("period") or "").strip(),
-                "place_type": normalize_place_type(m.groupdict().get("place_type") or ""),
-                "location": (m.groupdict().get("location") or "").strip().strip('. '),
-                "tod": normalize_tod(m.groupdict().get("tod") or "")
-            }
-    
-    return heuristic_parse(first_line)
-
-# ===== IO helpers =====
-CAST_LINE_RE = re.compile(r'^\s*\[.*?\]\s*$', re.MULTILINE)
-UNDERLINE_MARK_RE = re.compile(r'\{\.underline\}', re.IGNORECASE)
-BOLD_MARK_RE = re.compile(r'\*\*(.*?)\*\*')
-LINE_BACKSLASH_RE = re.compile(r'\\\s*$')
 EP_RE = re.compile(r'\[\s*ep\s*:\s*([^\]]+)\]', re.IGNORECASE)
 
-def read_pdf(path):
-    txt = ""
-    with pdfplumber.open(path) as pdf:
-        for p in pdf.pages:
-            t = p.extract_text() or ""
-            txt += t + "\n"
-    return txt
-
-def read_docx(path):
-    doc = Document(path)
-    parts = []
-    for p in doc.paragraphs:
-        t = (p.text or "")
-        t = UNDERLINE_MARK_RE.sub('', t).replace('{.smallcaps}', '')
-        t = BOLD_MARK_RE.sub(r'\1', t)
-        t = LINE_BACKSLASH_RE.sub('', t)
-        parts.append(t)
-    txt = "\n".join(parts)
-    txt = CAST_LINE_RE.sub('', txt)
-    txt = re.sub(r'[ \t]+\n', '\n', txt)
-    txt = txt.replace("\\[", "[").replace("\\]", "]")
-    txt = re.sub(r"[ \t]*\\\\\s*$", "", txt, flags=re.MULTILINE)
-    return txt
-
-def read_script(path):
-    if path.lower().endswith(".pdf"):
-        return read_pdf(path)
-    elif path.lower().endswith(".docx"):
-        return read_docx(path)
-    else:
-        with open(path, "r", encoding="utf-8", errors="ignore") as f:
-            return f.read()
-
 # ===== Rule-based keywords =====
 def load_keywords(folder="keywords"):
     cats = ["violence", "sexual", "profanity", "alcohol_drugs", "scary"]
@@ -304,28 +47,23 @@ def load_keywords(folder="keywords"):
 
 keywords, keyword_weights = load_keywords()
 
-def find_triggers_weighted(text, words, weights):
-    hits = []
-    low = text.lower()
-    total_score = 0.0
-    for w in words:
-        weight = weights.get(w, 1.0)
-        for m in re.finditer(rf'\b{re.escape(w)}\b', low):
-            start = max(0, m.start() - 25)
-            end = min(len(text), m.end() + 25)
-            snippet = text[start:end].replace("\n", " ")
-            hits.append({"offset": m.start(), "match": w, "weight": weight, "snippet": snippet})
-            total_score += weight
-    return hits, total_score
-
-def rule_based_score(scene_text):
-    text = scene_text[:8000]
+# Автомат по всем словарям сразу: один проход по сцене даёт хиты, веса, offset'ы и счётчики
+KEYWORD_MATCHER = KeywordMatcher(keywords, keyword_weights)
+
+RULE_TEXT_LIMIT = 8000
+
+def rule_based_score(scene_text, matches=None):
+    """matches — готовый KEYWORD_MATCHER.scan(scene_text); переиспользуется, если сцена не длиннее лимита."""
+    text = scene_text[:RULE_TEXT_LIMIT]
+    if matches is None or len(scene_text) > RULE_TEXT_LIMIT:
+        matches = KEYWORD_MATCHER.scan(text)
+    found = KEYWORD_MATCHER.hits(text, matches)
     result = {k: 0.0 for k in keywords}
     episodes = {k: [] for k in keywords}
     for cat, words in keywords.items():
         if not words:
             continue
-        trig, total = find_triggers_weighted(text, words, keyword_weights[cat])
+        trig, total = found[cat]
         episodes[cat].extend(trig)
         score = min(1.0, np.log1p(total) * 0.25)
         result[cat] = score
@@ -362,26 +100,19 @@ def parse_ep_features(text):
     return vec
 
 # ===== ML Model =====
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-EMB_MODEL = "ai-forever/ruRoberta-large"
-tok = AutoTokenizer.from_pretrained(EMB_MODEL)
-mdl = AutoModel.from_pretrained(EMB_MODEL).to(DEVICE)
-mdl.eval()
+# Энкодер не грузится здесь: embeddings берёт его из models.get_tok_mdl() при первом кодировании
 
-def rule_vec(text):
-    lf = text.lower()
-    return np.array([sum(len(re.findall(rf'\b{re.escape(w)}\b', lf)) for w in keywords.get(cat, []))
-                     for cat in ["violence", "sexual", "profanity", "alcohol_drugs", "scary"]], dtype=float)
+def rule_vec(text, matches=None):
+    if matches is None:
+        matches = KEYWORD_MATCHER.scan(text)
+    cnt = KEYWORD_MATCHER.counts(matches)
+    return np.array([cnt.get(cat, 0) for cat in ["violence", "sexual", "profanity", "alcohol_drugs", "scary"]], dtype=float)
 
 # ===== Episode aggregates =====
-from episodes_aggregates import episode_aggregates_for_scene
+from episodes_aggregates import episode_aggregates_batch
 
-# ===== Load scene heads =====
-if os.path.exists("heads.pkl"):
-    with open("heads.pkl", "rb") as f:
-        HEADS = pickle.load(f)
-else:
-    HEADS = None
+# ===== Scene heads =====
+# Головы грузятся лениво через models.get_fused_heads(): heads.npz или фьюзинг heads.pkl
 
 # ===== Legal overrides (436-ФЗ) =====
 OBSCENE_PATTERNS = [
@@ -438,22 +169,18 @@ def to_severity(p):
         return "Moderate"
     return "Severe"
 
-def analyze_scene(scene_text):
-    rule_scores, episodes = rule_based_score(scene_text)
-    ep_feats_vec = parse_ep_features(scene_text)
-    epi = episode_aggregates_for_scene(scene_text)
-    emb = scene_vector(scene_text, max_len=384, stride=320, batch_size=8, use_cache=True)
-    rv = rule_vec(scene_text)
-    
-    if HEADS:
-        x = np.hstack([emb, rv, ep_feats_vec, epi])
-        model_probs = {cat: float(clf.predict_proba([x])[0, 1]) for cat, clf in HEADS.items()}
-        epi_cat_max = {c: float(epi[i * 6 + 0]) for i, c in enumerate(["violence", "sexual", "profanity", "alcohol_drugs", "scary"])}
+def combine_scene(rule_scores, episodes, epi, model_p=None, episode_spans=None):
+    """
+    Смешивание правил, сценовой головы и эпизодных агрегатов в per_class одной сцены.
+    episode_spans — {cat: [a, b)} символьный диапазон спана с пиком эпизодной головы (или None).
+    """
+    epi_cat_max = {c: float(epi[i * 6 + 0]) for i, c in enumerate(["violence", "sexual", "profanity", "alcohol_drugs", "scary"])}
+    if model_p is not None:
+        model_probs = model_p
         final_probs = {cat: 0.55 * model_probs[cat] + 0.25 * rule_scores[cat] + 0.20 * epi_cat_max[cat]
                        for cat in ["violence", "sexual", "profanity", "alcohol_drugs", "scary"]}
     else:
         model_probs = {c: 0.0 for c in ["violence", "sexual", "profanity", "alcohol_drugs", "scary"]}
-        epi_cat_max = {c: float(epi[i * 6 + 0]) for i, c in enumerate(["violence", "sexual", "profanity", "alcohol_drugs", "scary"])}
         final_probs = {cat: 0.80 * rule_scores[cat] + 0.20 * epi_cat_max[cat]
                        for cat in ["violence", "sexual", "profanity", "alcohol_drugs", "scary"]}
     
@@ -464,11 +191,52 @@ def analyze_scene(scene_text):
         "episode_max": float(epi_cat_max[cat]),
         "final_proba": float(final_probs[cat]),
         "severity": severity[cat],
-        "episodes": episodes[cat]
+        "episodes": episodes[cat],
+        "episode_span": (episode_spans or {}).get(cat)
     } for cat in ["violence", "sexual", "profanity", "alcohol_drugs", "scary"]}
     
     return per_class
 
+def analyze_scenes(scenes, token_budget=None, use_cache=True, encoded=None, script_tokens=None):
+    """
+    Пакетный анализ: окна всех сцен кодируются одним скриптовым проходом энкодера,
+    эпизодные и сценовые головы считаются одним matmul на весь скрипт.
+    script_tokens — ScriptTokens всего скрипта: токены сцен срезом, без повторной токенизации.
+    Без скрипта — ScriptTokens по склейке сцен: одна токенизация и для окон, и для символьных диапазонов.
+    """
+    tokens = script_tokens or ScriptTokens.of_scenes(scenes)
+    if encoded is None:
+        encoded = encode_scenes(scenes, max_len=384, stride=320, token_budget=token_budget, use_cache=use_cache,
+                                script_tokens=tokens)
+    peaks = []
+    epi_all = episode_aggregates_batch([E for _, E in encoded], peaks=peaks)
+    
+    rows, X = [], []
+    for s, (V, E), epi, peak in zip(scenes, encoded, epi_all, peaks):
+        matches = KEYWORD_MATCHER.scan(s)
+        rule_scores, episodes = rule_based_score(s, matches)
+        X.append(np.hstack([aggregate_windows(V, topk=3), rule_vec(s, matches), parse_ep_features(s), epi]))
+        rows.append((rule_scores, episodes, epi, _peak_spans(tokens, s, E, peak)))
+    
+    fused = get_fused_heads()
+    if fused is not None and X:
+        P = scene_proba(fused, np.vstack(X))
+        model_ps = [{cat: float(P[i, j]) for j, cat in enumerate(fused["cats"])} for i in range(len(X))]
+    else:
+        model_ps = [None] * len(X)
+    return [combine_scene(r, e, epi, mp, sp) for (r, e, epi, sp), mp in zip(rows, model_ps)]
+
+def _peak_spans(tokens, s, E, peak):
+    """{cat: [a, b)} по индексам пиковых спанов; None, если сцену не удалось сопоставить с токенами."""
+    ranges = tokens.window_ranges(s, max_len=384, stride=320)
+    if ranges is None or len(ranges["episodes"]) != len(E):
+        return None
+    cats = ["violence", "sexual", "profanity", "alcohol_drugs", "scary"]
+    return {c: list(ranges["episodes"][k]) for c, k in zip(cats, peak) if k is not None}
+
+def analyze_scene(scene_text, encoded=None):
+    return analyze_scenes([scene_text], encoded=[encoded] if encoded is not None else None)[0]
+
 # ===== Age Rating =====
 def age_from_scene(per_class):
     if per_class["profanity"]["severity"] in ["Moderate", "Severe"]:
@@ -493,65 +261,58 @@ def aggregate_rating(scene_levels):
             worst = r
     return worst
 
-# ===== Main =====
-def analyze_script(path, report_path="final_report.json"):
-    text = read_script(path)
-    text = normalize_headings(text)
-    scenes = split_scenes(text)
-    details, scene_levels = [], []
+# ===== Report =====
+def scene_detail(i, s, per_class):
+    """Запись сцены для отчёта: метаданные заголовка, per_class, рейтинг с оверрайдами, проблемы."""
+    meta = parse_header(s)
+    scene_rate = age_from_scene(per_class)
     
-    print(f"Найдено сцен: {len(scenes)}")
+    override = legal_overrides(s)
+    if override:
+        order = ["0+", "6+", "12+", "16+", "18+"]
+        if order.index(override["min_age"]) > order.index(scene_rate):
+            scene_rate = override["min_age"]
     
-    for i, s in enumerate(scenes, 1):
-        meta = parse_header(s)
-        per_class = analyze_scene(s)
-        scene_rate = age_from_scene(per_class)
-        
-        override = legal_overrides(s)
-        if override:
-            order = ["0+", "6+", "12+", "16+", "18+"]
-            if order.index(override["min_age"]) > order.index(scene_rate):
-                scene_rate = override["min_age"]
-        
-        scene_levels.append(scene_rate)
-        
-        problems = []
-        for cat, data in per_class.items():
-            if data["severity"] in ["Moderate", "Severe"]:
-                for ep in data["episodes"][:5]:
-                    problems.append({
-                        "category": cat,
-                        "severity": data["severity"],
-                        "snippet": ep["snippet"],
-                        "offset": ep["offset"]
-                    })
-        
-        if override:
-            for r in override["reasons"]:
+    problems = []
+    for cat, data in per_class.items():
+        if data["severity"] in ["Moderate", "Severe"]:
+            for ep in data["episodes"][:5]:
                 problems.append({
-                    "category": "legal",
-                    "severity": "Severe",
-                    "snippet": s[:240],
-                    "offset": 0
+                    "category": cat,
+                    "severity": data["severity"],
+                    "snippet": ep["snippet"],
+                    "offset": ep["offset"]
                 })
-        
-        details.append({
-            "scene_index": i,
-            **meta,
-            "per_class": {k: {
-                "rule_score": data["rule_score"],
-                "model_proba": data["model_proba"],
-                "episode_max": data["episode_max"],
-                "final_proba": data["final_proba"],
-                "severity": data["severity"],
-                "episodes_count": len(data["episodes"])
-            } for k, data in per_class.items()},
-            "scene_rating": scene_rate,
-            "problems": problems
-        })
-        
-        print(f"Сцена {i}: {scene_rate} | {meta.get('scene_no', '')} {meta.get('place_type', '')} {meta.get('location', '')} - {meta.get('tod', '')}")
     
+    if override:
+        for r in override["reasons"]:
+            problems.append({
+                "category": "legal",
+                "severity": "Severe",
+                "snippet": s[:240],
+                "offset": 0
+            })
+    
+    return {
+        "scene_index": i,
+        **meta,
+        "per_class": {k: {
+            "rule_score": data["rule_score"],
+            "model_proba": data["model_proba"],
+            "episode_max": data["episode_max"],
+            "final_proba": data["final_proba"],
+            "severity": data["severity"],
+            "episodes_count": len(data["episodes"]),
+            # [a, b) в тексте сцены: спан, где эпизодная голова дала episode_max
+            "episode_span": data.get("episode_span")
+        } for k, data in per_class.items()},
+        "scene_rating": scene_rate,
+        "problems": problems
+    }
+
+def summarize(details):
+    """rating / summary / parents_guide по готовым записям сцен."""
+    scene_levels = [d["scene_rating"] for d in details]
     rating = aggregate_rating(scene_levels)
     
     def pct(cat):
@@ -566,25 +327,294 @@ def analyze_script(path, report_path="final_report.json"):
         "scary": {"percentage_scenes": pct("scary"), "episodes_total": sum(d["per_class"]["scary"]["episodes_count"] for d in details)},
     }
     
-    payload = {
+    return {
         "rating": rating,
         "summary": {
-            "count_scenes": len(scenes),
+            "count_scenes": len(details),
             "scene_ratings": {r: scene_levels.count(r) for r in ["6+", "12+", "16+", "18+"]}
         },
         "parents_guide": guide,
-        "details": details
     }
+
+# ===== Инкрементальная переоценка =====
+_stamp = None
+
+def scoring_stamp() -> str:
+    """
+    Версия оценки: модель и бэкенд энкодера, раскладка окон и бюджет, словари и веса голов.
+    Другая версия — переиспользовать старые сцены нельзя.
+    """
+    global _stamp
+    if _stamp is None:
+        h = hashlib.sha1(encoder_tag().encode())
+        h.update(window_plan_tag().encode())
+        h.update(json.dumps([keywords, keyword_weights], ensure_ascii=False, sort_keys=True).encode())
+        for fused in (get_fused_heads(), get_fused_ep_heads()):
+            if fused is not None:
+                h.update(np.ascontiguousarray(fused["W"]).tobytes())
+                h.update(np.ascontiguousarray(fused["b"]).tobytes())
+        _stamp = h.hexdigest()
+    return _stamp
+
+def scene_fingerprint(s: str) -> str:
+    """
+    Отпечаток сцены: точный текст. Правка даже одних пробелов сдвигает offset/snippet проблем
+    и episode_span в записи — такую сцену нужно пересчитать, а не переиспользовать.
+    """
+    return hashlib.sha1(s.encode("utf-8")).hexdigest()
+
+def reusable_details(previous):
+    """{fingerprint: запись сцены} из прошлого отчёта, если он посчитан той же версией оценки."""
+    if not previous or previous.get("scoring_stamp") != scoring_stamp():
+        return {}
+    return {d["fingerprint"]: d for d in previous.get("details", []) if d.get("fingerprint")}
+
+def diff_scenes(previous, fingerprints, scenes):
+    """Раздел changes: выравнивание сцен нового текста с прошлым отчётом по отпечаткам."""
+    old = previous.get("details", []) if previous else []
+    sm = difflib.SequenceMatcher(None, [d.get("fingerprint") for d in old], fingerprints, autojunk=False)
+    changes = {"previous_count": len(old), "unchanged": 0, "changed": [], "added": [], "removed": []}
+    for tag, i1, i2, j1, j2 in sm.get_opcodes():
+        if tag == "equal":
+            changes["unchanged"] += i2 - i1
+            continue
+        # replace: попарно «изменена», избыток новых — «добавлена», избыток старых — «удалена»
+        paired = min(i2 - i1, j2 - j1) if tag == "replace" else 0
+        for k in range(j1, j2):
+            entry = {"scene_index": k + 1, "scene_no": parse_header(scenes[k]).get("scene_no", "")}
+            if k - j1 < paired:
+                entry["previous_index"] = i1 + (k - j1) + 1
+                changes["changed"].append(entry)
+            else:
+                changes["added"].append(entry)
+        for k in range(i1 + paired, i2):
+            changes["removed"].append({"previous_index": k + 1, "scene_no": old[k].get("scene_no", "")})
+    return changes
+
+# ===== Main =====
+# Сцен на один проход энкодера в потоковом режиме: запись появляется в выходе, как только готов её кусок
+STREAM_CHUNK = int(os.environ.get("SCRIPT_STREAM_CHUNK", "16"))
+
+def _score(scenes, use_cache=True, tokens=None, pool=None):
+    if not scenes:
+        return []  # ничего не изменилось — энкодер не нужен
+    if pool is not None:
+        return pool.analyze(scenes, script_tokens=tokens)
+    return analyze_scenes(scenes, use_cache=use_cache, script_tokens=tokens)
+
+def prepare_scenes(text, previous=None):
+    """
+    Нормализация и разбивка + отпечатки сцен, переиспользуемые записи прошлого отчёта
+    и ScriptTokens (один проход токенизатора по нормализованному скрипту, лениво).
+    """
+    text = normalize_headings(text)
+    spans = scene_spans(text)
+    scenes = [text[a:b] for a, b in spans]
+    fingerprints = [scene_fingerprint(s) for s in scenes]
+    return scenes, fingerprints, reusable_details(previous), ScriptTokens(text, spans)
+
+def iter_details(scenes, fingerprints, reuse, workers=1, use_cache=True, chunk=None, tokens=None):
+    """
+    Записи сцен отчёта строго по порядку. Переоцениваются только сцены без записи в reuse;
+    chunk — сколько таких сцен за один проход (None — все сразу, как в пакетном режиме).
+    workers > 1 — один пул процессов на все куски (parallel.ScenePool).
+    """
+    todo = [i for i, fp in enumerate(fingerprints) if fp not in reuse]
+    step = chunk or max(1, len(todo))
+    nxt = 0
+    pool = None
+    if workers > 1 and todo:
+        from parallel import ScenePool
+        pool = ScenePool(workers, use_cache=use_cache)
+    try:
+        for a in range(0, len(todo), step):
+            idx = todo[a:a + step]
+            per_class_of = dict(zip(idx, _score([scenes[i] for i in idx], use_cache, tokens, pool)))
+            while nxt <= idx[-1]:
+                yield _detail(nxt, scenes, fingerprints, reuse, per_class_of)
+                nxt += 1
+    finally:
+        if pool is not None:
+            pool.close()
+    while nxt < len(scenes):
+        yield _detail(nxt, scenes, fingerprints, reuse, {})
+        nxt += 1
+
+def _detail(k, scenes, fingerprints, reuse, per_class_of):
+    s, fp = scenes[k], fingerprints[k]
+    if k in per_class_of:
+        return {**scene_detail(k + 1, s, per_class_of[k]), "fingerprint": fp}
+    # reused — служебная пометка для печати, в отчёт не попадает
+    return {**reuse[fp], **parse_header(s), "scene_index": k + 1, "reused": True}
+
+def _print_detail(d):
+    mark = " (без изменений)" if d.get("reused") else ""
+    print(f"Сцена {d['scene_index']}: {d['scene_rating']} | {d.get('scene_no', '')} {d.get('place_type', '')} {d.get('location', '')} - {d.get('tod', '')}{mark}")
+
+def finish_report(details, fingerprints, scenes, previous=None, script=None):
+    """rating / summary / parents_guide (+ changes при previous) по готовым записям сцен; script — имя сценария."""
+    payload = {**summarize(details), "scoring_stamp": scoring_stamp(), "details": details}
+    if script is not None:
+        payload["script"] = script
+    if previous is not None:
+        changes = diff_scenes(previous, fingerprints, scenes)
+        changes["rescored"] = sum(1 for fp in fingerprints if fp not in reusable_details(previous))
+        payload["changes"] = changes
+    return payload
+
+def analyze_text(text, verbose=True, workers=1, use_cache=True, previous=None, script=None):
+    """
+    Полный отчёт (та же структура, что final_report.json) по тексту сценария.
+    workers > 1 — сцены делятся между процессами (см. parallel.py), порядок в отчёте тот же.
+    previous — прошлый отчёт по этому сценарию: сцены с тем же отпечатком не переоцениваются,
+    их per_class / problems / рейтинг берутся оттуда; rating и parents_guide считаются заново,
+    а в отчёт добавляется раздел changes.
+    """
+    scenes, fingerprints, reuse, tokens = prepare_scenes(text, previous)
+    if verbose:
+        todo = sum(1 for fp in fingerprints if fp not in reuse)
+        print(f"Найдено сцен: {len(scenes)}" + (f"; к переоценке: {todo}" if previous else ""))
+    details = []
+    for d in iter_details(scenes, fingerprints, reuse, workers=workers, use_cache=use_cache, tokens=tokens):
+        if verbose:
+            _print_detail(d)
+        d.pop("reused", None)
+        details.append(d)
+    return finish_report(details, fingerprints, scenes, previous, script)
+
+# ===== Потоковый отчёт (NDJSON) =====
+# Строка на запись: {"type": "meta", ...} с числом сцен, затем {"type": "scene", ...} на каждую сцену
+# по мере оценки (с flush), в конце {"type": "summary", ...}. report_from_ndjson собирает из потока
+# ту же структуру, что final_report.json; оборванный поток даёт частичный отчёт с "partial": true.
+def _dumps(obj, compact=True):
+    if compact:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+    return json.dumps(obj, ensure_ascii=False, indent=2)
+
+def iter_report_records(text, workers=1, use_cache=True, previous=None, chunk=None, script=None):
+    """Записи NDJSON-отчёта: meta, scene..., summary."""
+    scenes, fingerprints, reuse, tokens = prepare_scenes(text, previous)
+    yield {"type": "meta", "count_scenes": len(scenes), "script": script,
+           "rescore_scenes": sum(1 for fp in fingerprints if fp not in reuse), "scoring_stamp": scoring_stamp()}
+    details = []
+    for d in iter_details(scenes, fingerprints, reuse, workers=workers, use_cache=use_cache,
+                          chunk=chunk or STREAM_CHUNK, tokens=tokens):
+        d.pop("reused", None)
+        details.append(d)
+        yield {"type": "scene", **d}
+    payload = finish_report(details, fingerprints, scenes, previous, script)
+    yield {"type": "summary", **{k: v for k, v in payload.items() if k != "details"}}
+
+def stream_script(path, out_path="final_report.ndjson", workers=1, incremental=False, chunk=None):
+    """
+    Оценка сценария с записью NDJSON по мере готовности сцен.
+    incremental=True — база для переоценки из out_path (в т.ч. оборванного прошлого прогона того же сценария).
+    """
+    previous = previous_report(path, out_path) if incremental else None
+    summary = None
+    # Пишем прямо в out_path: дашборд читает частичный поток, оборванный прогон остаётся базой для повтора
+    with open(out_path, "w", encoding="utf-8") as f:
+        for rec in iter_report_records(read_script(path), workers=workers, previous=previous, chunk=chunk,
+                                       script=script_name(path)):
+            f.write(_dumps(rec) + "\n")
+            f.flush()
+            if rec["type"] == "scene":
+                _print_detail(rec)
+            elif rec["type"] == "summary":
+                summary = rec
+    print(f"✅ Итоговый рейтинг: {summary['rating']}")
+    print(f"📁 Сохранён отчёт: {out_path}")
+    return summary
+
+def report_from_ndjson(path):
+    """Структура final_report.json из NDJSON-потока (частичный поток — "partial": true, сводка по готовым сценам)."""
+    meta, details, summary = {}, [], None
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                break  # недописанная последняя строка
+            kind = rec.pop("type", None)
+            if kind == "meta":
+                meta = rec
+            elif kind == "scene":
+                details.append(rec)
+            elif kind == "summary":
+                summary = rec
+    if summary is None:
+        payload = {**summarize(details), "scoring_stamp": meta.get("scoring_stamp"), "details": details}
+        if meta.get("script") is not None:
+            payload["script"] = meta["script"]
+        payload["partial"] = True
+        return payload
+    payload = {k: summary[k] for k in ("rating", "summary", "parents_guide", "scoring_stamp")}
+    if summary.get("script") is not None:
+        payload["script"] = summary["script"]
+    payload["details"] = details
+    if "changes" in summary:
+        payload["changes"] = summary["changes"]
+    return payload
+
+def load_report(path):
+    """Отчёт из .json или .ndjson (потокового) — например, как previous для analyze_text."""
+    if path.endswith(".ndjson"):
+        return report_from_ndjson(path)
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def script_name(path) -> str:
+    """Имя сценария в отчёте: имя файла (правки обычно сохраняют под тем же именем, каталог может отличаться)."""
+    return os.path.basename(path)
+
+def previous_report(path, report_path):
+    """Прошлый отчёт из report_path — только если он по тому же сценарию (иначе changes были бы бессмыслицей)."""
+    if not os.path.exists(report_path):
+        return None
+    previous = load_report(report_path)
+    if previous.get("script") != script_name(path):
+        print(f"ℹ️  {report_path} — отчёт по другому сценарию ({previous.get('script') or 'без имени'}), "
+              f"оценка с нуля")
+        return None
+    return previous
+
+def analyze_script(path, report_path="final_report.json", workers=1, incremental=False, compact=False):
+    """
+    incremental=True — прошлый отчёт по report_path (если он по тому же сценарию) служит базой
+    для переоценки только правок.
+    compact=True — JSON без отступов. Отчёт пишется атомарно (временный файл + os.replace).
+    """
+    previous = previous_report(path, report_path) if incremental else None
+    payload = analyze_text(read_script(path), workers=workers, previous=previous, script=script_name(path))
     
-    with open(report_path, "w", encoding="utf-8") as f:
-        json.dump(payload, f, ensure_ascii=False, indent=2)
+    tmp = f"{report_path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(_dumps(payload, compact=compact))
+    os.replace(tmp, report_path)
     
-    print(f"\n✅ Итоговый рейтинг: {rating}")
+    cs = cache_stats()
+    print(f"\n🗄  Кэш эмбеддингов: hits={cs['hits']} misses={cs['misses']} hit_rate={cs['hit_rate']}")
+    ws = window_stats()
+    if ws["scenes"]:
+        print(f"🪟 Окна: {ws['windows']} на {ws['scenes']} сцен, coverage={ws['coverage']} "
+              f"ep_coverage={ws['ep_coverage']} redundancy={ws['redundancy']}")
+    if "changes" in payload:
+        ch = payload["changes"]
+        print(f"✏️  Изменения: переоценено {ch['rescored']}, изменено {len(ch['changed'])}, "
+              f"добавлено {len(ch['added'])}, удалено {len(ch['removed'])}, без изменений {ch['unchanged']}")
+    print(f"✅ Итоговый рейтинг: {payload['rating']}")
     print(f"📁 Сохранён отчёт: {report_path}")
+    return payload
 
 if __name__ == "__main__":
-    path = input("Введите путь к сценарию (.docx/.pdf): ").strip()
+    import argparse
+    ap = argparse.ArgumentParser(description="Возрастной рейтинг сценария")
+    ap.add_argument("path", nargs="?", help="сценарий .docx/.pdf (без аргумента — спросить)")
+    ap.add_argument("--incremental", action="store_true",
+                    help="переоценить только правки относительно прошлого final_report.json того же сценария")
+    args = ap.parse_args()
+    path = args.path or input("Введите путь к сценарию (.docx/.pdf): ").strip()
     if not os.path.exists(path):
         print("Файл не найден.")
     else:
-        analyze_script(path)
+        analyze_script(path, incremental=args.incremental)
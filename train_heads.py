@@ -1,12 +1,31 @@
 # train_heads.py (замена цикла обучения)
+#
+# train     — LogisticRegression по категориям на всей матрице X (как раньше).
+# train_sgd — out-of-core: X читается шардами из хранилища признаков (memmap), все 5 голов учатся
+#             SGD (логистическая потеря, partial_fit) за один проход по данным на эпоху,
+#             ранняя остановка по отложенным шардам. Масштабирование вшивается в веса —
+#             heads.pkl остаётся drop-in для analyze_scene (fused_heads берёт только coef_/intercept_).
+#
+# Пример: python train_heads.py --sgd --shard-rows 4096 --epochs 20
+import os
+import math
+import argparse
 import numpy as np, pickle
-from sklearn.linear_model import LogisticRegression
+from sklearn.linear_model import LogisticRegression, SGDClassifier
 from sklearn.model_selection import train_test_split
-from sklearn.metrics import classification_report
+from sklearn.metrics import classification_report, log_loss
+from sklearn.preprocessing import StandardScaler
+from vector_store import load_features
+from embeddings import window_plan_tag
+from fused_heads import PLAN_KEY
+
+CATS = ["violence","sexual","profanity","alcohol_drugs","scary"]
+# Строк в шарде: 4096 x (3H+45) float32 — около 50 MB в памяти на шард
+SHARD_ROWS = int(os.environ.get("SCRIPT_SHARD_ROWS", "4096"))
 
 def train(prefix="data"):
-    X = np.load(f"{prefix}_X.npy")
-    cats = ["violence","sexual","profanity","alcohol_drugs","scary"]
+    X = load_features(prefix)  # memmap строк из хранилища признаков (или прежний {prefix}_X.npy)
+    cats = CATS
     heads = {}
     for cat in cats:
         y = np.load(f"{prefix}_y_{cat}.npy")
@@ -18,24 +37,132 @@ def train(prefix="data"):
         clf.fit(Xtr, ytr)
 
         # безопасный отчёт
-        uniq = np.unique(yva)
-        try:
-            print(f"\n{cat}:")
-            if len(uniq) == 2:
-                print(classification_report(yva, clf.predict(Xva), target_names=["0","1"]))
-            else:
-                # один класс в валидации
-                y_pred = clf.predict(Xva)
-                acc = (y_pred == yva).mean()
-                print(f"Валидация содержит один класс {int(uniq[0])}; accuracy={acc:.3f}, pos_rate_train={ytr.mean():.3f}")
-        except Exception as e:
-            print(f"{cat}: отчет пропущен ({e})")
+        report(cat, yva, clf.predict(Xva), ytr)
 
         heads[cat] = clf
 
+    heads[PLAN_KEY] = window_plan_tag()  # признаки make_features собраны на этой раскладке окон
     with open("heads.pkl","wb") as f:
         pickle.dump(heads,f)
     print("OK: heads.pkl saved")
 
+def report(cat, yva, y_pred, ytr):
+    uniq = np.unique(yva)
+    try:
+        print(f"\n{cat}:")
+        if len(uniq) == 2:
+            print(classification_report(yva, y_pred, target_names=["0","1"]))
+        else:
+            # один класс в валидации
+            acc = (y_pred == yva).mean()
+            print(f"Валидация содержит один класс {int(uniq[0])}; accuracy={acc:.3f}, pos_rate_train={ytr.mean():.3f}")
+    except Exception as e:
+        print(f"{cat}: отчет пропущен ({e})")
+
+# ===== Out-of-core обучение =====
+def split_shards(n: int, shard_rows: int, holdout: float, seed: int):
+    """Шарды [(a, b)] подряд по строкам X и индексы отложенных (не меньше одного; шардов не меньше 5)."""
+    if n <= 0:
+        raise ValueError(f"split_shards: нет строк для разбиения на шарды (n={n})")
+    k = max(5, math.ceil(n / shard_rows)) if n >= 5 else max(1, n)
+    size = math.ceil(n / k)
+    shards = [(a, min(a + size, n)) for a in range(0, n, size)]
+    rng = np.random.default_rng(seed)
+    n_hold = max(1, round(holdout * len(shards))) if len(shards) > 1 else 0
+    hold = set(rng.choice(len(shards), size=n_hold, replace=False).tolist())
+    return [s for i, s in enumerate(shards) if i not in hold], [s for i, s in enumerate(shards) if i in hold]
+
+def train_sgd(prefix="data", shard_rows=SHARD_ROWS, epochs=20, patience=3, holdout=0.1, alpha=1e-4, seed=42):
+    X = load_features(prefix)
+    if X.shape[0] == 0:
+        raise ValueError(f"{prefix}: пустая обучающая выборка (0 строк X)")
+    Y = np.column_stack([np.load(f"{prefix}_y_{cat}.npy").astype(int) for cat in CATS])  # [N, C] — метки малы
+    train_sh, hold_sh = split_shards(X.shape[0], shard_rows, holdout, seed)
+    shard = lambda a, b: np.asarray(X[a:b], dtype=np.float64)
+    print(f"X: {X.shape}; шардов: обучение {len(train_sh)}, отложено {len(hold_sh)} по ~{train_sh[0][1] - train_sh[0][0]} строк")
+
+    # 1) Первый проход: статистики масштаба и балансировка классов (class_weight="balanced" вручную)
+    scaler = StandardScaler()
+    pos = np.zeros(len(CATS))
+    n = 0
+    for a, b in train_sh:
+        scaler.partial_fit(shard(a, b))
+        pos += Y[a:b].sum(axis=0)
+        n += b - a
+    heads, best, state = {}, {}, {}
+    for j, cat in enumerate(CATS):
+        counts = {0: n - pos[j], 1: pos[j]}
+        cw = {c: (n / (2.0 * k) if k else 1.0) for c, k in counts.items()}
+        heads[cat] = SGDClassifier(loss="log_loss", alpha=alpha, average=True, class_weight=cw, random_state=seed)
+        state[cat] = {"best": math.inf, "bad": 0, "done": False}
+
+    # 2) Эпохи: каждый шард читается один раз и идёт во все ещё не остановленные головы
+    rng = np.random.default_rng(seed)
+    for epoch in range(1, epochs + 1):
+        active = [cat for cat in CATS if not state[cat]["done"]]
+        if not active:
+            break
+        for i in rng.permutation(len(train_sh)):
+            a, b = train_sh[i]
+            order = rng.permutation(b - a)
+            Xs = scaler.transform(shard(a, b))[order]
+            for cat in active:
+                heads[cat].partial_fit(Xs, Y[a:b, CATS.index(cat)][order], classes=np.array([0, 1]))
+        losses = holdout_losses(heads, active, scaler, shard, Y, hold_sh)
+        line = []
+        for cat in active:
+            st = state[cat]
+            if losses[cat] < st["best"] - 1e-4:
+                st["best"], st["bad"] = losses[cat], 0
+                best[cat] = (heads[cat].coef_.copy(), heads[cat].intercept_.copy())
+            else:
+                st["bad"] += 1
+                st["done"] = st["bad"] >= patience
+            line.append(f"{cat}={losses[cat]:.4f}{'*' if st['done'] else ''}")
+        print(f"эпоха {epoch}: log_loss отложенных " + " ".join(line))
+
+    # 3) Лучшие веса + масштаб вшит в них: w' = w / σ, b' = b - w'·μ (головы работают на сыром X)
+    for cat, clf in heads.items():
+        coef, icpt = best.get(cat, (clf.coef_, clf.intercept_))
+        clf.coef_ = coef / scaler.scale_
+        clf.intercept_ = icpt - clf.coef_ @ scaler.mean_
+    yva = np.vstack([Y[a:b] for a, b in hold_sh]) if hold_sh else Y[:0]
+    pred = np.vstack([np.column_stack([heads[c].predict(shard(a, b)) for c in CATS]) for a, b in hold_sh]) \
+        if hold_sh else yva
+    for j, cat in enumerate(CATS):
+        report(cat, yva[:, j], pred[:, j], Y[:, j])
+
+    heads[PLAN_KEY] = window_plan_tag()
+    with open("heads.pkl","wb") as f:
+        pickle.dump(heads,f)
+    from fused_heads import fuse_scene_heads, save_npz
+    save_npz("heads.npz", fuse_scene_heads(heads))
+    print("OK: heads.pkl, heads.npz saved")
+    return heads
+
+def holdout_losses(heads, cats, scaler, shard, Y, hold_sh):
+    """log_loss каждой головы на отложенных шардах (на масштабированном X, до вшивания масштаба)."""
+    if not hold_sh:
+        return {cat: 0.0 for cat in cats}
+    P = {cat: [] for cat in cats}
+    for a, b in hold_sh:
+        Xs = scaler.transform(shard(a, b))
+        for cat in cats:
+            P[cat].append(heads[cat].predict_proba(Xs)[:, 1])
+    yh = np.vstack([Y[a:b] for a, b in hold_sh])
+    return {cat: log_loss(yh[:, CATS.index(cat)], np.concatenate(P[cat]), labels=[0, 1]) for cat in cats}
+
 if __name__ == "__main__":
-    train()
+    ap = argparse.ArgumentParser(description="Обучение сценовых голов")
+    ap.add_argument("--prefix", default="data")
+    ap.add_argument("--sgd", action="store_true", help="out-of-core SGD по шардам (для больших X)")
+    ap.add_argument("--shard-rows", type=int, default=SHARD_ROWS)
+    ap.add_argument("--epochs", type=int, default=20)
+    ap.add_argument("--patience", type=int, default=3)
+    ap.add_argument("--holdout", type=float, default=0.1, help="доля отложенных шардов")
+    args = ap.parse_args()
+    if args.sgd:
+        train_sgd(args.prefix, shard_rows=args.shard_rows, epochs=args.epochs, patience=args.patience,
+                  holdout=args.holdout)
+    else:
+        train(args.prefix)
@@ -2,32 +2,28 @@
 import pandas as pd
 import numpy as np
 import pickle
-import torch
 
-from transformers import AutoTokenizer, AutoModel
+from embeddings import encode_scenes, window_plan_tag
+from fused_heads import PLAN_KEY
 from sklearn.linear_model import LogisticRegression, Ridge
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report
 
 # ===== Config =====
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-MODEL = "ai-forever/ruRoberta-large"
 CATS = ["violence","sexual","profanity","alcohol_drugs","scary"]
 EP_CSV = "episodes.csv"  # при необходимости поменяй путь
 
 # ===== Embedding helpers =====
-def embed_batch(texts, tok, mdl, max_len=512):
-    mdl.eval()
-    vecs = []
-    with torch.no_grad():
-        for t in texts:
-            t = t if isinstance(t, str) else ""
-            x = tok(t[:2000], return_tensors="pt", truncation=True, max_length=max_len).to(DEVICE)
-            hs = mdl(**x).last_hidden_state           # [1, T, H]
-            attn = (x["attention_mask"].unsqueeze(-1) > 0).float()  # [1, T, 1]
-            v = (hs * attn).sum(dim=1) / attn.sum(dim=1).clamp(min=1e-9)  # mean-pool
-            vecs.append(v.cpu().numpy())
-    return np.vstack(vecs)
+def embed_episodes(texts, use_cache=True):
+    """
+    Эпизоды -> [N, H] тем же путём, что на инференсе: encode_scenes (общий энкодер, окна батчами
+    по длине, кэш окон) и эпизодные спаны EP_WIN_LEN; вектор эпизода — среднее его спанов.
+    Эпизод не длиннее спана пулится ровно как один спан сцены (контекст — сам эпизод, а не окно сцены).
+    При дообучении энкодер прогоняет только новые эпизоды — остальные берутся из кэша.
+    """
+    texts = [t if isinstance(t, str) else "" for t in texts]
+    encoded = encode_scenes(texts, max_len=384, stride=320, use_cache=use_cache)
+    return np.vstack([(E if len(E) else V).mean(axis=0) for V, E in encoded])
 
 def main(ep_csv=EP_CSV):
     # 1) Load data
@@ -35,10 +31,8 @@ def main(ep_csv=EP_CSV):
     df["text"] = df["text"].fillna("")
 
     # 2) Embed episodes
-    tok = AutoTokenizer.from_pretrained(MODEL)
-    mdl = AutoModel.from_pretrained(MODEL).to(DEVICE)
     print("Embedding episodes...")
-    X = embed_batch(df["text"].tolist(), tok, mdl)  # shape: [N, H]
+    X = embed_episodes(df["text"].tolist())  # shape: [N, H]
 
     heads = {}
     for cat in CATS:
@@ -84,7 +78,8 @@ def main(ep_csv=EP_CSV):
 
         heads[cat] = {"bin": clf_bin, "sev": reg_sev}
 
-    # 6) Save
+    # 6) Save (с раскладкой окон, на которой пулились векторы эпизодов)
+    heads[PLAN_KEY] = window_plan_tag()
     with open("episode_heads.pkl","wb") as f:
         pickle.dump(heads, f)
     print("\n✅ Saved: episode_heads.pkl")
@@ -0,0 +1,421 @@
+# vector_store.py — дисковое хранилище векторов: append-only файл строк + маленький индекс, чтение через np.memmap
+#
+# Одна директория = одна размерность и один dtype (float32/float16):
+#   CURRENT            — номер поколения (меняется атомарно при компактизации)
+#   data.<gen>.bin     — строки [dim] подряд, только дозапись
+#   index.<gen>.log    — журнал: "+ key row n" (строки row..row+n-1), "~ key" (обращение), "- key" (удаление)
+#   lock               — flock для писателей и компактизации
+# Читатели блокировок не берут: журнал дочитывается с запомненной позиции (недописанная строка ждёт),
+# данные мапятся через np.memmap без копирования. Запись строки в журнал — после записи самих строк,
+# поэтому видимые читателю ключи всегда указывают на уже лежащие на диске данные.
+# Внутри процесса объект общий для потоков: методы берут его RLock (до flock, порядок всегда такой).
+# Компактизация переписывает живые ключи в новое поколение (старые первыми вытесняются сверх лимита);
+# её вызывают и мёртвые строки данных, и разросшийся журнал (обращение к недавно сдвинутому ключу не пишется);
+# читатель со старым поколением продолжает читать свой открытый файл, новое подхватывает на промахе.
+#
+# Пример: python vector_store.py ./.cache_script_rating/store/windows-float32 --compact
+
+import os
+import json
+import fcntl
+import functools
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+CACHE_DIR = os.environ.get("SCRIPT_CACHE_DIR", "./.cache_script_rating")
+STORE_DIR = os.path.join(CACHE_DIR, "store")
+STORE_DTYPE = os.environ.get("SCRIPT_STORE_DTYPE", "float32").strip().lower()
+# Компактизация, когда мёртвых строк (перезаписанных/удалённых/вытесненных) больше живых и больше этого числа
+COMPACT_MIN_DEAD_ROWS = 4096
+# ...или когда строк журнала (обращения "~", перекрытые "+", "-") больше живых ключей втрое и больше этого числа
+COMPACT_MIN_DEAD_LINES = 16384
+# Проверка компактизации под блокировкой — раз в столько записанных отметок обращения (get без put)
+TOUCH_CHECK_EVERY = 1024
+
+def _synchronized(fn):
+    # Состояние читателя (позиция журнала, индекс, memmap) общее для потоков процесса
+    @functools.wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        with self._mutex:
+            return fn(self, *args, **kwargs)
+    return wrapper
+
+class VectorStore:
+    """Append-only хранилище: ключ -> блок строк [n, dim]. Безопасно для нескольких процессов."""
+
+    def __init__(self, path: str, dtype: str = STORE_DTYPE, max_bytes: int = None):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.max_bytes = max_bytes
+        self.dim = None
+        self.index = {}        # key -> (row, n); порядок вставки = порядок давности обращения (LRU)
+        self.evictions = 0
+        self._mutex = threading.RLock()
+        self._lines = 0        # строк журнала текущего поколения
+        self._moved = {}       # key -> номер строки журнала, последней сдвинувшей ключ в свежие
+        self._touches = 0
+        self._gen = None
+        self._pid = None
+        self._index_fd = None
+        self._index_pos = 0
+        self._data_f = None
+        self._mm = None
+        self._load_meta()
+
+    # ===== Файлы и поколения =====
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _load_meta(self):
+        try:
+            with open(self._file("meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.dim = int(meta["dim"])
+        self.dtype = np.dtype(meta["dtype"])  # существующее хранилище задаёт dtype само
+
+    def _write_meta(self, dim: int):
+        os.makedirs(self.path, exist_ok=True)
+        tmp = self._file(f"meta.json.{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"dim": dim, "dtype": self.dtype.name}, f)
+        os.replace(tmp, self._file("meta.json"))
+        self.dim = dim
+
+    def _current_gen(self) -> int:
+        try:
+            with open(self._file("CURRENT"), "r", encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    @property
+    def row_bytes(self) -> int:
+        return self.dim * self.dtype.itemsize
+
+    @contextmanager
+    def _locked(self):
+        # Свой дескриптор на каждый захват: flock, унаследованный через fork, процессы бы делили
+        os.makedirs(self.path, exist_ok=True)
+        fd = os.open(self._file("lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def _close(self):
+        if self._index_fd is not None:
+            os.close(self._index_fd)
+        if self._data_f is not None:
+            self._data_f.close()
+        self._index_fd = self._data_f = self._mm = None
+
+    def _open_gen(self, gen: int):
+        """Переключиться на поколение gen: индекс читается заново с начала журнала."""
+        self._close()
+        self._gen, self._pid = gen, os.getpid()
+        self.index, self._index_pos = {}, 0
+        self._lines, self._moved = 0, {}
+        try:
+            self._index_fd = os.open(self._file(f"index.{gen}.log"), os.O_RDONLY)
+            self._data_f = open(self._file(f"data.{gen}.bin"), "rb")
+        except OSError:
+            self._close()
+
+    @_synchronized
+    def refresh(self):
+        """Подхватить новое поколение и дочитать журнал индекса."""
+        if self.dim is None:
+            self._load_meta()
+        gen = self._current_gen()
+        if gen != self._gen or self._pid != os.getpid() or self._index_fd is None:
+            self._open_gen(gen)
+        if self._index_fd is None:
+            return
+        size = os.fstat(self._index_fd).st_size
+        if size <= self._index_pos:
+            return
+        chunk = os.pread(self._index_fd, size - self._index_pos, self._index_pos)
+        end = chunk.rfind(b"\n") + 1  # хвост без '\n' ещё дописывается
+        for line in chunk[:end].decode("utf-8").splitlines():
+            self._apply(line.split("\t"))
+        self._index_pos += end
+
+    def _apply(self, rec):
+        op, key = rec[0], rec[1]
+        self._lines += 1
+        if op == "+":
+            self.index.pop(key, None)
+            self.index[key] = (int(rec[2]), int(rec[3]))
+            self._moved[key] = self._lines
+        elif op == "~":
+            loc = self.index.pop(key, None)
+            if loc is not None:
+                self.index[key] = loc
+                self._moved[key] = self._lines
+        elif op == "-":
+            self.index.pop(key, None)
+            self._moved.pop(key, None)
+
+    def _recent(self, key) -> bool:
+        """Ключ сдвигался в свежие за последнюю четверть журнала — повторная отметка порядок почти не меняет."""
+        moved = self._moved.get(key)
+        return moved is not None and self._lines - moved < max(1, len(self.index) // 4)
+
+    def _rows(self, need: int):
+        """memmap данных текущего поколения, покрывающий не меньше need строк (или None)."""
+        if self._mm is None or self._mm.shape[0] < need:
+            if self._data_f is None or not need:
+                return None
+            n = os.fstat(self._data_f.fileno()).st_size // self.row_bytes
+            self._mm = np.memmap(self._data_f, dtype=self.dtype, mode="r", shape=(n, self.dim))
+        return self._mm
+
+    # ===== Чтение =====
+    def __len__(self):
+        return len(self.index)
+
+    @_synchronized
+    def __contains__(self, key):
+        if key not in self.index:
+            self.refresh()
+        return key in self.index
+
+    @_synchronized
+    def view(self, key: str):
+        """Строки ключа [n, dim] — вид memmap без копирования — или None."""
+        loc = self.index.get(key)
+        if loc is None or self._pid != os.getpid():
+            self.refresh()
+            loc = self.index.get(key)
+            if loc is None:
+                return None
+        row, n = loc
+        if n == 0:
+            return np.empty((0, self.dim), dtype=self.dtype)
+        return self._rows(row + n)[row:row + n]
+
+    @_synchronized
+    def get(self, key: str, touch: bool = False):
+        """Копия строк ключа в float32 или None; touch — отметить обращение для вытеснения по давности."""
+        V = self.view(key)
+        if V is None:
+            return None
+        if touch and not self._recent(key):
+            self._append_index(f"~\t{key}\n", create=False)
+            self.index[key] = self.index.pop(key)  # строку журнала посчитает refresh
+            self._moved[key] = self._lines
+            self._touches += 1
+            if self._touches % TOUCH_CHECK_EVERY == 0:
+                self._check_compaction()
+        return np.array(V, dtype=np.float32)
+
+    @_synchronized
+    def rows(self, keys):
+        """Номера строк однострочных ключей (в порядке keys) для take/matrix; KeyError на отсутствующий."""
+        self.refresh()
+        return np.array([self.index[k][0] for k in keys], dtype=np.int64)
+
+    @_synchronized
+    def matrix(self):
+        """Все строки текущего поколения одним memmap [N, dim] (включая мёртвые — адресуйте через rows)."""
+        self.refresh()
+        if self._data_f is None:
+            return np.empty((0, self.dim or 0), dtype=self.dtype)
+        return self._rows(os.fstat(self._data_f.fileno()).st_size // self.row_bytes)
+
+    @_synchronized
+    def take(self, keys):
+        """Матрица [len(keys), dim] однострочных ключей: срез memmap без копии, если строки идут подряд."""
+        rows = self.rows(keys)
+        if not len(rows):
+            return np.empty((0, self.dim or 0), dtype=self.dtype)
+        M = self._rows(int(rows.max()) + 1)
+        if np.all(np.diff(rows) == 1):
+            return M[rows[0]:rows[-1] + 1]
+        return M[rows]
+
+    # ===== Запись =====
+    def _append_index(self, text: str, create: bool = True):
+        # O_APPEND + одна запись: строки разных процессов не перемешиваются
+        flags = os.O_WRONLY | os.O_APPEND | (os.O_CREAT if create else 0)
+        try:
+            fd = os.open(self._file(f"index.{self._gen}.log"), flags, 0o644)
+        except FileNotFoundError:
+            return  # поколение уже сменилось компактизацией — отметка обращения не нужна
+        try:
+            os.write(fd, text.encode("utf-8"))
+        finally:
+            os.close(fd)
+
+    def put(self, key: str, V):
+        self.put_many([(key, V)])
+
+    @_synchronized
+    def put_many(self, items):
+        """Дописать блоки [(key, V [n, dim]), ...] подряд одной записью; ключ с тем же именем перекрывается."""
+        items = [(k, np.asarray(V).reshape(-1, np.shape(V)[-1])) for k, V in items]
+        if not items:
+            return
+        with self._locked():
+            if self.dim is None:
+                self._load_meta()
+                if self.dim is None:
+                    self._write_meta(items[0][1].shape[1])
+            self.refresh()
+            gen = self._gen
+            for k, V in items:
+                if V.shape[1] != self.dim:
+                    raise ValueError(f"{self.path}: размерность {V.shape[1]} вместо {self.dim}")
+            fd = os.open(self._file(f"data.{gen}.bin"), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                size = os.fstat(fd).st_size
+                pad = -size % self.row_bytes  # оборванная прошлым падением строка — добиваем до границы
+                if pad:
+                    os.write(fd, b"\0" * pad)
+                row, lines = (size + pad) // self.row_bytes, []
+                for k, V in items:
+                    os.write(fd, np.ascontiguousarray(V, dtype=self.dtype).tobytes())
+                    lines.append(f"+\t{k}\t{row}\t{V.shape[0]}\n")
+                    row += V.shape[0]
+            finally:
+                os.close(fd)
+            self._append_index("".join(lines))
+            if self._data_f is None:
+                self._open_gen(gen)
+            self.refresh()
+            if self._needs_compaction():
+                self._compact()
+
+    @_synchronized
+    def delete(self, key: str):
+        """Удалить ключ (читатели, уже видевшие его, узнают об этом на ближайшем refresh)."""
+        with self._locked():
+            self.refresh()
+            if key in self.index:
+                self._append_index(f"-\t{key}\n")
+                self.refresh()
+
+    # ===== Компактизация =====
+    @_synchronized
+    def stats(self) -> dict:
+        self.refresh()
+        total = os.fstat(self._data_f.fileno()).st_size // self.row_bytes if self._data_f is not None else 0
+        live = sum(n for _, n in self.index.values())
+        return {"keys": len(self.index), "rows": total, "live_rows": live, "dead_rows": total - live,
+                "journal_lines": self._lines, "dead_lines": self._lines - len(self.index),
+                "bytes": total * self.row_bytes if total else 0, "generation": self._gen or 0,
+                "evictions": self.evictions}
+
+    def _needs_compaction(self) -> bool:
+        st = self.stats()
+        if self.max_bytes and st["bytes"] > self.max_bytes:
+            return True
+        if st["dead_lines"] > max(3 * st["keys"], COMPACT_MIN_DEAD_LINES):
+            return True
+        return st["dead_rows"] > max(st["live_rows"], COMPACT_MIN_DEAD_ROWS)
+
+    def _check_compaction(self):
+        """Отметки обращения пишутся без блокировки — журнал проверяется под ней отдельно."""
+        with self._locked():
+            self.refresh()
+            if self._data_f is not None and self._needs_compaction():
+                self._compact()
+
+    @_synchronized
+    def compact(self, max_bytes: int = None):
+        """Переписать живые ключи в новое поколение; сверх max_bytes (90% лимита) вытесняются самые давние."""
+        with self._locked():
+            self.refresh()
+            return self._compact(max_bytes)
+
+    def _compact(self, max_bytes: int = None):
+        max_bytes = max_bytes or self.max_bytes
+        keep = list(self.index.items())  # от давних к свежим
+        if max_bytes:
+            target = int(max_bytes * 0.9) // self.row_bytes
+            total = sum(n for _, (_, n) in keep)
+            drop = 0
+            while drop < len(keep) and total > target:
+                total -= keep[drop][1][1]
+                drop += 1
+            self.evictions += drop
+            keep = keep[drop:]
+        old, gen = self._gen, self._gen + 1
+        M = self._rows(max((r + n for _, (r, n) in keep), default=0))
+        data_tmp, index_tmp = self._file(f"data.{gen}.bin.tmp"), self._file(f"index.{gen}.log.tmp")
+        lines, row = [], 0
+        with open(data_tmp, "wb") as f:
+            for k, (r, n) in keep:
+                if n:
+                    f.write(np.ascontiguousarray(M[r:r + n]).tobytes())
+                lines.append(f"+\t{k}\t{row}\t{n}\n")
+                row += n
+        with open(index_tmp, "w", encoding="utf-8", newline="") as f:
+            f.write("".join(lines))
+        os.replace(data_tmp, self._file(f"data.{gen}.bin"))
+        os.replace(index_tmp, self._file(f"index.{gen}.log"))
+        cur_tmp = self._file(f"CURRENT.{os.getpid()}.tmp")
+        with open(cur_tmp, "w", encoding="utf-8") as f:
+            f.write(str(gen))
+        os.replace(cur_tmp, self._file("CURRENT"))
+        # Открытые у читателей дескрипторы старого поколения остаются валидными и после unlink
+        for name in (f"data.{old}.bin", f"index.{old}.log"):
+            try:
+                os.remove(self._file(name))
+            except OSError:
+                pass
+        self._open_gen(gen)
+        self.refresh()
+        return len(keep)
+
+# ===== Общие хранилища =====
+_stores = {}
+
+def open_store(name: str, dtype: str = STORE_DTYPE, max_bytes: int = None) -> VectorStore:
+    """Хранилище STORE_DIR/<name>-<dtype>, одно на процесс (кэш окон, признаки обучения)."""
+    path = os.path.join(STORE_DIR, f"{name}-{np.dtype(dtype).name}")
+    if path not in _stores:
+        _stores[path] = VectorStore(path, dtype=dtype, max_bytes=max_bytes)
+    return _stores[path]
+
+# ===== Признаки обучения =====
+# make_features пишет строки X в хранилище "features", а в <prefix>_X.keys — ключи строк по порядку
+def save_feature_keys(prefix: str, keys):
+    path = f"{prefix}_X.keys"
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("".join(f"{k}\n" for k in keys))
+    os.replace(tmp, path)
+
+def load_feature_keys(prefix: str):
+    with open(f"{prefix}_X.keys", "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+def load_features(prefix: str = "data"):
+    """
+    X для обучения: строки из хранилища признаков по <prefix>_X.keys (memmap, без копии, если подряд);
+    без .keys — прежний <prefix>_X.npy, тоже через memmap.
+    """
+    if os.path.exists(f"{prefix}_X.keys"):
+        return open_store("features").take(load_feature_keys(prefix))
+    return np.load(f"{prefix}_X.npy", mmap_mode="r")
+
+def main(argv=None):
+    import argparse
+    ap = argparse.ArgumentParser(description="Состояние и компактизация хранилища векторов")
+    ap.add_argument("path")
+    ap.add_argument("--compact", action="store_true")
+    ap.add_argument("--max-mb", type=float, default=None, help="лимит при компактизации (вытеснение давних)")
+    args = ap.parse_args(argv)
+    store = VectorStore(args.path)
+    if args.compact:
+        store.compact(int(args.max_mb * 1024 * 1024) if args.max_mb else None)
+    print(json.dumps({"dim": store.dim, "dtype": store.dtype.name, **store.stats()}, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()